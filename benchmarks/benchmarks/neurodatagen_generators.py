@@ -0,0 +1,134 @@
+"""
+Headless benchmarks of the neurodatagen data generators used to build test fixtures.
+
+Unlike the other benchmarks of this suite, these do not start a server or a browser,
+they time the generators and track their peak memory directly. All generators are
+seeded, so that each run measures the same work.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from neurodatagen.annotations import create_random_ranges
+from neurodatagen.ca_imaging import simulate_miniscope_data
+from neurodatagen.eeg import generate_eeg_powerlaw
+from neurodatagen.ephys import assign_groups, generate_ephys, sim_spikes, stream_spikes
+
+SEED = 0
+
+
+class GeneratorBase:
+    # Each call generates a full dataset, a few rounds of a single call are enough
+    number = 1
+    repeat = (1, 3, 30.0)
+    timeout = 600
+
+
+class SimulateMiniscope(GeneratorBase):
+    params: tuple[list[int], list[int]] = ([200, 1000], [256, 512])
+    param_names: tuple[str] = ("n_frames", "size")
+
+    def _run(self, n_frames: int, size: int) -> None:
+        dims = {"height": size, "width": size, "frame": n_frames}
+        simulate_miniscope_data(ncell=40, dims=dims, chk_size=200, seed=SEED).compute()
+
+    def time_simulate_miniscope_data(self, n_frames: int, size: int) -> None:
+        self._run(n_frames, size)
+
+    def peakmem_simulate_miniscope_data(self, n_frames: int, size: int) -> None:
+        self._run(n_frames, size)
+
+
+class GenerateEEGPowerlaw(GeneratorBase):
+    params: tuple[list[int], list[int]] = ([16, 64, 256], [10, 60])
+    param_names: tuple[str] = ("n_channels", "n_seconds")
+
+    def _run(self, n_channels: int, n_seconds: int) -> None:
+        generate_eeg_powerlaw(n_channels, n_seconds, fs=250, seed=SEED)
+
+    def time_generate_eeg_powerlaw(self, n_channels: int, n_seconds: int) -> None:
+        self._run(n_channels, n_seconds)
+
+    def peakmem_generate_eeg_powerlaw(self, n_channels: int, n_seconds: int) -> None:
+        self._run(n_channels, n_seconds)
+
+
+class GenerateEphys(GeneratorBase):
+    params: tuple[list[int], list[int]] = ([4, 16, 64], [1, 10])
+    param_names: tuple[str] = ("n_channels", "n_seconds")
+
+    def _run(self, n_channels: int, n_seconds: int) -> None:
+        generate_ephys(n_channels, n_seconds, fs=30000, seed=SEED)
+
+    def time_generate_ephys(self, n_channels: int, n_seconds: int) -> None:
+        self._run(n_channels, n_seconds)
+
+    def peakmem_generate_ephys(self, n_channels: int, n_seconds: int) -> None:
+        self._run(n_channels, n_seconds)
+
+
+class GenerateEphysParallel(GeneratorBase):
+    # Speedup of the process pool over the serial path, for a Neuropixels-like probe
+    params: list[int] = [1, 2, 4, 8]
+    param_names: tuple[str] = ("n_workers",)
+
+    def time_generate_ephys(self, n_workers: int) -> None:
+        generate_ephys(128, 10, fs=30000, seed=SEED, n_workers=n_workers)
+
+
+class SimSpikes(GeneratorBase):
+    params: tuple[list[int], list[int]] = ([100, 1000, 10000], [10, 100])
+    param_names: tuple[str] = ("num_neurons", "duration")
+
+    def _run(self, num_neurons: int, duration: int) -> None:
+        sim_spikes(num_neurons, firing_rate=10, duration=duration, seed=SEED)
+
+    def time_sim_spikes(self, num_neurons: int, duration: int) -> None:
+        self._run(num_neurons, duration)
+
+    def peakmem_sim_spikes(self, num_neurons: int, duration: int) -> None:
+        self._run(num_neurons, duration)
+
+
+class StreamSpikes(GeneratorBase):
+    # Memory should stay that of a chunk whatever the duration
+    params: tuple[list[int], list[int]] = ([1000, 10000], [100, 600])
+    param_names: tuple[str] = ("num_neurons", "duration")
+
+    def _run(self, num_neurons: int, duration: int) -> None:
+        for _ in stream_spikes(num_neurons, firing_rate=10, duration=duration, seed=SEED, dtype=np.float32):
+            pass
+
+    def time_stream_spikes(self, num_neurons: int, duration: int) -> None:
+        self._run(num_neurons, duration)
+
+    def peakmem_stream_spikes(self, num_neurons: int, duration: int) -> None:
+        self._run(num_neurons, duration)
+
+
+class AssignGroups(GeneratorBase):
+    params: tuple[list[int], list[int]] = ([1000, 10000, 100000], [4, 32])
+    param_names: tuple[str] = ("n_times", "num_groups")
+
+    def setup(self, n_times: int, num_groups: int) -> None:
+        self.times = np.random.default_rng(SEED).uniform(0, 100, n_times)
+
+    def time_assign_groups(self, n_times: int, num_groups: int) -> None:
+        assign_groups(self.times, num_groups, seed=SEED)
+
+    def peakmem_assign_groups(self, n_times: int, num_groups: int) -> None:
+        assign_groups(self.times, num_groups, seed=SEED)
+
+
+class CreateRandomRanges(GeneratorBase):
+    params: tuple[list[int], list[int]] = ([100, 1000, 10000], [3, 10])
+    param_names: tuple[str] = ("n_total_annotations", "n_categories")
+
+    def _run(self, n_total_annotations: int, n_categories: int) -> None:
+        create_random_ranges(100000, n_categories, n_total_annotations, seed=SEED)
+
+    def time_create_random_ranges(self, n_total_annotations: int, n_categories: int) -> None:
+        self._run(n_total_annotations, n_categories)
+
+    def peakmem_create_random_ranges(self, n_total_annotations: int, n_categories: int) -> None:
+        self._run(n_total_annotations, n_categories)
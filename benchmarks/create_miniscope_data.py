@@ -3,7 +3,9 @@
 # Use env: create_miniscope_data_env.yml
 
 # %%
-from neurodatagen.ca_imaging import simulate_miniscope_data
+import os
+
+from neurodatagen.ca_imaging import write_miniscope_zarr
 
 MINISCOPE_DATA_PATH = "~/data/image-stacks/miniscope/"
 # %% image stack datasets - simulation of miniscope data
@@ -40,16 +42,15 @@ param_dict = {
     },
 }
 
+# Stream each dataset to zarr block by block, resuming any interrupted run
 for k, v in param_dict.items():
-    simulate_miniscope_data(
+    write_miniscope_zarr(
+        os.path.expanduser(f"{MINISCOPE_DATA_PATH}/miniscope_sim_{k}.zarr"),
         ncell=v["NCELL"],
         dims={"height": v["HEIGHT"], "width": v["WIDTH"], "frame": v["FRAME"]},
         arr_name=k,
         chk_size=v["CHK_SIZE"],
-    ).to_zarr(
-        f"{MINISCOPE_DATA_PATH}/miniscope_sim_{k}.zarr",
-        mode="w",
-        consolidated=True,
+        resume=True,
     )
 
 # %%
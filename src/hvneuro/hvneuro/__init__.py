@@ -1,2 +1,3 @@
 from .vidviewer import VArrayViewer
-from .util import download_file, download_files
\ No newline at end of file
+from .util import download_file, download_files, open_remote_zarr
+from .catalog import load_catalog, open_catalog_entry
@@ -0,0 +1,206 @@
+from importlib import resources
+from pathlib import Path
+from typing import Optional, Union
+import os
+import shutil
+
+import numpy as np
+import xarray as xr
+import yaml
+
+from .util import download_file, open_remote_zarr
+
+# Catalog shipped as package data of hvneuro
+DEFAULT_CATALOG = "catalog.yml"
+DEFAULT_CACHE_DIR = "~/.cache/hvneuro"
+
+# Formats that are converted to zarr on first use, rather than read directly
+CONVERTED_FORMATS = ("edf", "nwb")
+
+
+def load_catalog(catalog: Optional[Union[str, Path]] = None) -> dict:
+    """
+    Load the sources declared in a catalog file.
+
+    Parameters
+    ----------
+    catalog : Optional[Union[str, Path]]
+        Path to the catalog YAML file. Defaults to the `catalog.yml` shipped
+        with hvneuro.
+
+    Returns
+    -------
+    sources : dict
+        Mapping of entry name to entry specification.
+    """
+    if catalog is None:
+        spec = yaml.safe_load(resources.files(__package__).joinpath(DEFAULT_CATALOG).read_text())
+    else:
+        with open(Path(os.path.expanduser(catalog))) as f:
+            spec = yaml.safe_load(f)
+    return spec.get("sources", {})
+
+
+def open_catalog_entry(
+    name: str,
+    catalog: Optional[Union[str, Path]] = None,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+    chunks: Optional[dict] = None,
+) -> xr.Dataset:
+    """
+    Resolve a catalog entry to a lazily opened, dask-backed dataset.
+
+    Zarr sources are opened in place through a local chunk cache. Sources in
+    slow formats (EDF, NWB) are downloaded and converted once into an
+    analysis-ready zarr store with consolidated metadata under `cache_dir`;
+    later opens read that store directly and skip parsing the original file.
+    Converted stores hold (channel, time) data, as the neurodatagen writers do.
+
+    The optional `metadata` section of an entry may specify:
+
+    - `format`: one of 'zarr', 'edf' or 'nwb'. Inferred from the file
+      extension of `urlpath` if missing.
+    - `chunks`: dask chunking hints used when opening the dataset, and when
+      writing the converted zarr store.
+    - `variable`: name of the data variable of converted stores. Defaults to
+      'data'.
+    - `series`: name of the NWB acquisition to convert. Defaults to the first
+      acquisition with a non-empty `data` array.
+
+    Parameters
+    ----------
+    name : str
+        The name of the entry in the catalog.
+    catalog : Optional[Union[str, Path]]
+        Path to the catalog YAML file. Defaults to the `catalog.yml` shipped
+        with hvneuro.
+    cache_dir : str
+        Local directory for downloaded files, converted stores and cached
+        zarr chunks. Defaults to '~/.cache/hvneuro'.
+    chunks : Optional[dict]
+        Chunking that overrides the hints declared in the entry.
+
+    Returns
+    -------
+    ds : xarray.Dataset
+        The lazily opened dataset.
+
+    Raises
+    ------
+    KeyError
+        if `name` is not an entry of the catalog.
+    NotImplementedError
+        if the format of the entry is not supported.
+    ValueError
+        if an NWB file has no acquisition with data and no `series` is given.
+    """
+    sources = load_catalog(catalog)
+    if name not in sources:
+        raise KeyError(f"'{name}' not found in catalog, available entries: {list(sources)}")
+    entry = sources[name]
+    args = entry.get("args", {})
+    metadata = entry.get("metadata", {}) or {}
+    urlpath = args["urlpath"]
+    fmt = metadata.get("format") or _infer_format(urlpath)
+    if chunks is None:
+        chunks = metadata.get("chunks", {})
+
+    cache_dir = Path(os.path.expanduser(cache_dir))
+    if fmt == "zarr":
+        return open_remote_zarr(urlpath, cache_dir=str(cache_dir / "zarr"), chunks=chunks)
+    if fmt not in CONVERTED_FORMATS:
+        raise NotImplementedError(f"Unsupported format '{fmt}' for catalog entry '{name}'")
+
+    store = cache_dir / "converted" / f"{name}.zarr"
+    if not store.exists():
+        # Reuse the file name declared by the entry's file cache, if any
+        file_name = None
+        for cache in args.get("cache", []):
+            if cache.get("type") == "file" and "path" in cache:
+                file_name = Path(cache["path"]).name
+        file_path = download_file(urlpath, str(cache_dir / "files"), file_name)
+        convert = _convert_edf if fmt == "edf" else _convert_nwb
+        # Write to a temporary location so that interrupted conversions are not mistaken for complete ones
+        tmp_store = store.with_suffix(".zarr.tmp")
+        shutil.rmtree(tmp_store, ignore_errors=True)
+        convert(file_path, tmp_store, metadata)
+        tmp_store.rename(store)
+
+    return xr.open_zarr(store, chunks=chunks, consolidated=True)
+
+
+def _infer_format(urlpath: str) -> str:
+    """Infer the format of a source from the extension of its path."""
+    suffix = Path(urlpath.rstrip("/")).suffix.lower().lstrip(".")
+    return {"zarr": "zarr", "edf": "edf", "bdf": "edf", "nwb": "nwb"}.get(suffix, suffix)
+
+
+def _time_block_size(metadata: dict, n_channels: int) -> int:
+    """Number of samples converted at a time, from the entry's chunk hints."""
+    return int(metadata.get("chunks", {}).get("time", max(1, 2**22 // max(n_channels, 1))))
+
+
+def _convert_edf(file_path: Path, store: Path, metadata: dict) -> None:
+    """Convert an EDF file into a (channel, time) zarr store, one time block at a time."""
+    import mne  # import here to avoid dependency for all workflows
+
+    raw = mne.io.read_raw_edf(file_path, preload=False, verbose=False)
+    variable = metadata.get("variable", "data")
+    block = _time_block_size(metadata, len(raw.ch_names))
+    n_times = raw.n_times
+
+    for start in range(0, n_times, block):
+        stop = min(start + block, n_times)
+        data, times = raw.get_data(start=start, stop=stop, return_times=True)
+        ds = xr.Dataset(
+            {variable: (("channel", "time"), data)},
+            coords={"channel": raw.ch_names, "time": times},
+        )
+        if start == 0:
+            ds[variable].attrs.update(units="V", sfreq=raw.info["sfreq"])
+            ds[variable].encoding["chunks"] = (len(raw.ch_names), block)
+            ds.to_zarr(store, mode="w", consolidated=False)
+        else:
+            ds.to_zarr(store, append_dim="time", consolidated=False)
+
+    import zarr
+
+    zarr.consolidate_metadata(str(store))
+
+
+def _convert_nwb(file_path: Path, store: Path, metadata: dict) -> None:
+    """
+    Convert an NWB acquisition time series into a (channel, time) zarr store. NWB
+    stores time series as (time, channel), the data is transposed as it is written.
+    """
+    import dask.array as darr
+    from pynwb import NWBHDF5IO  # import here to avoid dependency for all workflows
+
+    variable = metadata.get("variable", "data")
+    with NWBHDF5IO(str(file_path), "r") as io:
+        nwb = io.read()
+        series_name = metadata.get("series") or _first_series_with_data(nwb.acquisition)
+        series = nwb.acquisition[series_name]
+        data = series.data
+        n_channels = data.shape[1] if len(data.shape) > 1 else 1
+        block = _time_block_size(metadata, n_channels)
+        if series.timestamps is not None:
+            times = np.asarray(series.timestamps[:])
+        else:
+            times = series.starting_time + np.arange(data.shape[0]) / series.rate
+
+        # Read blocks of all channels, then put the channels first
+        arr = darr.from_array(data, chunks=(block,) + data.shape[1:]).T
+        dims = ("channel", "time") if len(data.shape) > 1 else ("time",)
+        ds = xr.Dataset({variable: (dims, arr)}, coords={"time": times})
+        ds[variable].attrs.update(units=series.unit, series=series_name)
+        ds.to_zarr(store, mode="w", consolidated=True)
+
+
+def _first_series_with_data(acquisition: dict) -> str:
+    """Name of the first acquisition of an NWB file with a non-empty `data` array."""
+    for name, series in acquisition.items():
+        shape = getattr(getattr(series, "data", None), "shape", None)
+        if shape and np.prod(shape) > 0:
+            return name
+    raise ValueError(f"No acquisition with data among {list(acquisition)}")
@@ -4,6 +4,8 @@ import requests
 from tqdm import tqdm
 from typing import Union, List, Optional
 import os
+import fsspec
+import xarray as xr
 
 def download_file(url: str, data_dir: str, file_name: Optional[str] = None) -> Path:
     """
@@ -88,3 +90,52 @@ def download_files(input_data: Union[str, dict, List[str]], data_dir: str):
         raise TypeError("input_data must be either a string, a dictionary, or a list.")
 
 
+def open_remote_zarr(
+    url: str,
+    cache_dir: str = "~/.cache/hvneuro/zarr",
+    chunks: Optional[Union[dict, str]] = None,
+    consolidated: Optional[bool] = None,
+    storage_options: Optional[dict] = None,
+) -> xr.Dataset:
+    """
+    Lazily open a remote zarr store through a persistent local chunk cache.
+
+    Rather than copying the whole store before viewing it, every key of the
+    zarr store (metadata and individual chunks) is fetched the first time it
+    is read and saved under `cache_dir`. Subsequent reads, including those
+    from later sessions, are served from the local copy, so only the chunks a
+    viewer actually touches are ever downloaded.
+
+    Parameters
+    ----------
+    url : str
+        The URL (or any fsspec-compatible path) of the zarr store.
+    cache_dir : str
+        The local directory where fetched chunks are cached. Defaults to
+        '~/.cache/hvneuro/zarr'.
+    chunks : Optional[Union[dict, str]]
+        Dask chunking passed to `xarray.open_zarr`. Defaults to the chunking
+        of the store, so that each dask task maps to a single cached chunk.
+    consolidated : Optional[bool]
+        Whether to read consolidated metadata. By default, consolidated
+        metadata is used if present.
+    storage_options : Optional[dict]
+        Extra options for the remote filesystem (e.g. headers or credentials).
+
+    Returns
+    -------
+    ds : xarray.Dataset
+        The lazily loaded dataset.
+    """
+    cache_dir = Path(os.path.expanduser(cache_dir))
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    protocol = urlparse(url).scheme or "file"
+    mapper = fsspec.get_mapper(
+        f"simplecache::{url}",
+        simplecache={"cache_storage": str(cache_dir)},
+        **{protocol: storage_options or {}},
+    )
+    if chunks is None:
+        chunks = {}
+    return xr.open_zarr(mapper, chunks=chunks, consolidated=consolidated)
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+mne = pytest.importorskip("mne")
+catalog = pytest.importorskip("hvneuro.catalog")
+
+
+def test_load_catalog_default():
+    sources = catalog.load_catalog()
+    assert "mne_edf" in sources
+    assert all("urlpath" in entry["args"] for entry in sources.values())
+
+
+@pytest.fixture
+def edf_entry(tmp_path, monkeypatch):
+    """A catalog with a single entry, whose download is a tiny local EDF file."""
+    pytest.importorskip("edfio")
+    rng = np.random.default_rng(0)
+    info = mne.create_info(["EEG 1", "EEG 2", "EEG 3"], sfreq=100.0, ch_types="eeg")
+    raw = mne.io.RawArray(rng.normal(scale=1e-5, size=(3, 1000)), info, verbose=False)
+    edf_path = tmp_path / "tiny.edf"
+    mne.export.export_raw(edf_path, raw, fmt="edf", verbose=False)
+
+    catalog_path = tmp_path / "catalog.yml"
+    catalog_path.write_text(
+        "sources:\n"
+        "  tiny:\n"
+        "    args:\n"
+        "      urlpath: 'https://example.com/tiny.edf'\n"
+        "    metadata:\n"
+        "      chunks:\n"
+        "        time: 256\n"
+    )
+    downloads = []
+
+    def download_file(url, data_dir, file_name=None):
+        downloads.append(url)
+        return edf_path
+
+    monkeypatch.setattr(catalog, "download_file", download_file)
+    return catalog_path, edf_path, downloads
+
+
+def test_open_catalog_entry_converts_edf(tmp_path, edf_entry):
+    catalog_path, edf_path, downloads = edf_entry
+    cache_dir = tmp_path / "cache"
+    ds = catalog.open_catalog_entry("tiny", catalog=catalog_path, cache_dir=str(cache_dir))
+
+    raw = mne.io.read_raw_edf(edf_path, preload=True, verbose=False)
+    np.testing.assert_array_equal(ds["data"].values, raw.get_data())
+    np.testing.assert_array_equal(ds["time"].values, raw.times)
+    assert list(ds["channel"].values) == raw.ch_names
+    assert ds["data"].attrs["sfreq"] == raw.info["sfreq"]
+    assert (cache_dir / "converted" / "tiny.zarr" / ".zmetadata").exists()
+    assert not (cache_dir / "converted" / "tiny.zarr.tmp").exists()
+
+    # The converted store is reused, without downloading the file again
+    catalog.open_catalog_entry("tiny", catalog=catalog_path, cache_dir=str(cache_dir))
+    assert len(downloads) == 1
+
+
+def test_open_catalog_entry_interrupted_conversion(tmp_path, edf_entry, monkeypatch):
+    catalog_path, _, _ = edf_entry
+    cache_dir = tmp_path / "cache"
+    convert_edf = catalog._convert_edf
+
+    def interrupted(file_path, store, metadata):
+        store.mkdir(parents=True)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(catalog, "_convert_edf", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        catalog.open_catalog_entry("tiny", catalog=catalog_path, cache_dir=str(cache_dir))
+    assert not (cache_dir / "converted" / "tiny.zarr").exists()
+
+    # The partial store is not mistaken for a converted one, and is converted again
+    monkeypatch.setattr(catalog, "_convert_edf", convert_edf)
+    ds = catalog.open_catalog_entry("tiny", catalog=catalog_path, cache_dir=str(cache_dir))
+    assert ds["data"].shape == (3, 1000)
+    assert not (cache_dir / "converted" / "tiny.zarr.tmp").exists()
@@ -0,0 +1,44 @@
+import shutil
+
+import numpy as np
+import pytest
+import xarray as xr
+
+util = pytest.importorskip("hvneuro.util")
+
+
+@pytest.fixture
+def remote_store(tmp_path):
+    """A chunked zarr store standing in for a remote one."""
+    data = np.random.default_rng(0).normal(size=(4, 1000)).astype(np.float32)
+    ds = xr.Dataset({"data": (("channel", "time"), data)}, coords={"time": np.arange(1000)})
+    ds["data"].encoding["chunks"] = (4, 100)
+    path = tmp_path / "remote.zarr"
+    ds.to_zarr(path, consolidated=True)
+    return path, data
+
+
+def test_open_remote_zarr_fetches_only_touched_chunks(tmp_path, remote_store):
+    path, data = remote_store
+    cache_dir = tmp_path / "cache"
+    ds = util.open_remote_zarr(str(path), cache_dir=str(cache_dir))
+    assert ds["data"].chunks == ((4,), (100,) * 10)
+
+    np.testing.assert_array_equal(ds["data"][:, :100].values, data[:, :100])
+    n_cached = len(list(cache_dir.iterdir()))
+    n_chunks = len(list((path / "data").glob("*.*")))
+    assert n_cached < n_chunks
+
+    np.testing.assert_array_equal(ds["data"].values, data)
+    assert len(list(cache_dir.iterdir())) > n_cached
+
+
+def test_open_remote_zarr_reuses_cache(tmp_path, remote_store):
+    path, data = remote_store
+    cache_dir = tmp_path / "cache"
+    util.open_remote_zarr(str(path), cache_dir=str(cache_dir)).load()
+
+    # Later sessions read the cached keys, without the remote store
+    shutil.rmtree(path)
+    ds = util.open_remote_zarr(str(path), cache_dir=str(cache_dir))
+    np.testing.assert_array_equal(ds["data"].values, data)
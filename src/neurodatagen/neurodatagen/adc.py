@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from typing import Optional
+import numpy as np
+
+
+def quantize(
+    data: np.ndarray,
+    gain: float,
+    offset: float = 0.0,
+    dtype=np.int16,
+    out: Optional[np.ndarray] = None,
+    max_block_size: int = 2**22,
+) -> np.ndarray:
+    """
+    Quantizes data in physical units, e.g. microvolts, into the integer samples of an
+    analog-to-digital converter, as recorded by acquisition systems.
+
+    Each sample becomes `round((data - offset) / gain)`, clipped to the range of the
+    integer type, so that `samples * gain + offset` approximates the data to within half
+    a gain. The conversion is done a block of values at a time, so that it only takes
+    the memory of the output beyond that of the data.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The data to quantize, of shape (n_channels, n_samples) or (n_samples,).
+    gain : float
+        Value of one bit in the units of the data, e.g. 0.195 microvolts per bit for
+        Intan amplifiers.
+    offset : float, optional
+        Value of the zero sample in the units of the data. Default is 0.
+    dtype : optional
+        Integer data type of the samples. Default is np.int16.
+    out : np.ndarray, optional
+        Integer array of the shape of `data` to write the samples to. Defaults to a new
+        array of `dtype`.
+    max_block_size : int, optional
+        Maximum number of values converted at once, to bound memory. Default is 2**22.
+
+    Returns
+    -------
+    np.ndarray
+        The integer samples.
+    """
+    out = np.empty(data.shape, dtype=dtype) if out is None else out
+    info = np.iinfo(out.dtype)
+    src, dst = np.atleast_2d(data), np.atleast_2d(out)
+    n_rows = max(1, max_block_size // max(src.shape[-1], 1))
+    for r0 in range(0, len(src), n_rows):
+        buf = src[r0 : r0 + n_rows] - offset
+        buf /= gain
+        np.rint(buf, out=buf)
+        np.clip(buf, info.min, info.max, out=buf)
+        dst[r0 : r0 + n_rows] = buf
+    return out
+
+
+def dequantize(samples: np.ndarray, gain: float, offset: float = 0.0, dtype=np.float64) -> np.ndarray:
+    """
+    Converts the integer samples of `quantize` back to physical units.
+
+    Parameters
+    ----------
+    samples : np.ndarray
+        The integer samples.
+    gain : float
+        Value of one bit in physical units.
+    offset : float, optional
+        Value of the zero sample in physical units. Default is 0.
+    dtype : optional
+        Floating point data type of the result. Default is np.float64.
+
+    Returns
+    -------
+    np.ndarray
+        The data in physical units, `samples * gain + offset`.
+    """
+    data = samples.astype(dtype)
+    data *= gain
+    data += offset
+    return data
+
+
+def adc_attrs(gain: float, offset: float = 0.0) -> dict:
+    """
+    Attributes that describe quantized data, following the CF conventions, so that
+    xarray, e.g. `xarray.open_zarr` or `xarray.decode_cf`, lazily converts the samples
+    back to physical units as `samples * scale_factor + add_offset`.
+    """
+    return dict(scale_factor=float(gain), add_offset=float(offset))
@@ -1,9 +1,13 @@
+import string
 import pandas as pd
 import numpy as np
 import colorcet as cc
 
+from .rng import SeedLike, default_rng
+
 def create_random_ranges(n_total_seconds: int, n_categories: int, 
-                             n_total_annotations: int, duration: int = 1) -> pd.DataFrame:
+                             n_total_annotations: int, duration: int = 1,
+                             seed: SeedLike = None) -> pd.DataFrame:
     """
     Generate a DataFrame containing annotations for a range of categories over a specified time duration.
 
@@ -17,6 +21,8 @@ def create_random_ranges(n_total_seconds: int, n_categories: int,
         The total number of annotations to be created.
     duration : int, optional
         The duration of each annotation in seconds. Defaults to 1.
+    seed : SeedLike, optional
+        Seed or random number generator.
 
     Returns
     -------
@@ -44,14 +50,15 @@ def create_random_ranges(n_total_seconds: int, n_categories: int,
     """
     ...
 
-    start_times = np.sort(np.random.randint(0, n_total_seconds - duration, n_total_annotations))
+    rng = default_rng(seed)
+    start_times = np.sort(rng.integers(0, n_total_seconds - duration, n_total_annotations))
     
     # Ensure the annotations are non-overlapping
     for i in range(1, len(start_times)):
         if start_times[i] < start_times[i-1] + duration:
             start_times[i] = start_times[i-1] + duration
     end_times = start_times + duration
-    categories = np.random.choice(list(string.ascii_uppercase)[:n_categories], n_total_annotations)
+    categories = rng.choice(list(string.ascii_uppercase)[:n_categories], n_total_annotations)
     
     df = pd.DataFrame({
         'start': start_times,
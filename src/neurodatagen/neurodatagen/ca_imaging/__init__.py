@@ -1,2 +1,4 @@
 from .gen_miniscope import simulate_miniscope_data
+from .write_miniscope import write_miniscope_zarr
+from .stream_miniscope import MiniscopeFrameSource
 from .gen_random import *
\ No newline at end of file
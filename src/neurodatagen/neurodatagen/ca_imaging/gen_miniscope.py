@@ -3,13 +3,15 @@ from __future__ import annotations
 from typing import Tuple, Optional, Dict, List
 import os
 import warnings
+import dask
 import dask.array as darr
 import numpy as np
-from numpy import random
 import sparse
 import xarray as xr
-from scipy.stats import multivariate_normal
-from scipy.ndimage import gaussian_filter1d
+from scipy.ndimage import gaussian_filter1d, shift as ndshift
+from scipy.signal import lfilter
+
+from ..rng import SeedLike, default_rng, seed_sequence, child_rng, stream_key, hashed_normal
 
 
 def shift_perframe(fm: np.ndarray, sh: np.ndarray, fill=np.nan) -> np.ndarray:
@@ -52,6 +54,71 @@ def shift_perframe(fm: np.ndarray, sh: np.ndarray, fill=np.nan) -> np.ndarray:
     return fm
 
 
+def shift_frames(
+    fms: np.ndarray,
+    shifts: np.ndarray,
+    fill=np.nan,
+    subpixel: bool = False,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Shifts all pixels of each frame in a block of frames by its own amount.
+
+    Parameters
+    ----------
+    fms: np.ndarray
+        Input block of frames to be shifted, of shape (frame, height, width).
+    shifts: np.ndarray
+        Shifts for each frame and spatial dimension, of shape (frame, 2).
+    fill: optional
+        Value to fill in the places left vacant by the shift.
+    subpixel: bool, optional
+        If True, shifts are not rounded and frames are shifted with bilinear
+        interpolation. Default is False.
+    out: np.ndarray, optional
+        Array to write the shifted frames to, which can be `fms` itself to shift
+        the frames in place. If not specified, a new array is allocated.
+
+    Returns
+    --------
+    out: np.ndarray
+        Shifted block of frames.
+    """
+    if out is None:
+        out = np.empty_like(fms)
+
+    if subpixel:
+        # Interpolation can not run in place, go through a single frame buffer instead
+        buf = np.empty_like(fms[0]) if np.shares_memory(fms, out) else None
+        for fm, sh, fm_out in zip(fms, shifts, out):
+            if buf is not None:
+                buf[:] = fm
+                fm = buf
+            ndshift(fm, sh, output=fm_out, order=1, mode="constant", cval=fill)
+        return out
+
+    # Round shifts to nearest integer, a shift larger than the frame leaves it empty
+    _, hh, ww = fms.shape
+    sh = np.clip(np.around(shifts).astype(int), [-hh, -ww], [hh, ww])
+
+    # Precompute the destination windows of all frames, source windows are offset by the shift
+    h0, h1 = np.clip(sh[:, 0], 0, None), hh + np.clip(sh[:, 0], None, 0)
+    w0, w1 = np.clip(sh[:, 1], 0, None), ww + np.clip(sh[:, 1], None, 0)
+
+    for i, (sh_h, sh_w) in enumerate(sh):
+        out[i, h0[i] : h1[i], w0[i] : w1[i]] = fms[
+            i, h0[i] - sh_h : h1[i] - sh_h, w0[i] - sh_w : w1[i] - sh_w
+        ]
+
+        # Fill in the gaps left by the shift
+        out[i, : h0[i]] = fill
+        out[i, h1[i] :] = fill
+        out[i, h0[i] : h1[i], : w0[i]] = fill
+        out[i, h0[i] : h1[i], w1[i] :] = fill
+
+    return out
+
+
 def gauss_cell(
     height: int,
     width: int,
@@ -60,10 +127,16 @@ def gauss_cell(
     sz_min: float,
     cent=None,
     norm=True,
-) -> np.ndarray:
+    zero_thres: float = 1e-8,
+    seed: SeedLike = None,
+) -> sparse.COO:
     """
     Generates a cell with a Gaussian distribution of pixel intensities.
 
+    The Gaussian of each cell is only evaluated inside its bounding box, i.e.
+    the window around the centroid beyond which pixel intensities fall below
+    `zero_thres`, and the result is directly emitted as a sparse array.
+
     Parameters
     ----------
     height: int
@@ -79,46 +152,87 @@ def gauss_cell(
     cent: list, optional
         The centroid of the cell. If not specified, a random centroid will be generated.
     norm: bool, optional
-        Whether or not to normalize the cell.
+        Whether or not to normalize the cell, such that its peak is 1.
+    zero_thres: float, optional
+        Pixel intensities below this threshold are treated as zero. Default is 1e-8.
+    seed: SeedLike, optional
+        Seed or random number generator for the centroid and sizes of the cells.
 
     Returns
     -------
-    A: np.ndarray
-        The generated Gaussian cell.
+    A: sparse.COO
+        The generated Gaussian cell, of shape (ncell, height, width).
     """
 
+    rng = default_rng(seed)
+
     # Generate centroid if not provided
     if cent is None:
-        cent = np.atleast_2d([random.randint(height), random.randint(width)])
+        cent = np.atleast_2d([rng.integers(height), rng.integers(width)])
 
     # Generate sizes (height and width) for the Gaussian cell using a normal distribution
     sz_h = np.clip(
-        random.normal(loc=sz_mean, scale=sz_sigma, size=cent.shape[0]), sz_min, None
+        rng.normal(loc=sz_mean, scale=sz_sigma, size=cent.shape[0]), sz_min, None
     )
     sz_w = np.clip(
-        random.normal(loc=sz_mean, scale=sz_sigma, size=cent.shape[0]), sz_min, None
+        rng.normal(loc=sz_mean, scale=sz_sigma, size=cent.shape[0]), sz_min, None
     )
 
-    # Generate grid to be used for calculating Gaussian PDF
-    grid = np.moveaxis(np.mgrid[:height, :width], 0, -1)
-    A = np.zeros((cent.shape[0], height, width))
-
-    # Calculate Gaussian PDF for each cell and assign it to the corresponding position in the array
-    for idx, (c, hs, ws) in enumerate(zip(cent, sz_h, sz_w)):
-        pdf = multivariate_normal.pdf(grid, mean=c, cov=np.array([[hs, 0], [0, ws]]))
-
-        # Normalize the PDF if the 'norm' parameter is True
-        if norm:
-            pmin, pmax = pdf.min(), pdf.max()
-            pdf = (pdf - pmin) / (pmax - pmin)
-
-        A[idx] = pdf
-
-    return A
-
+    # Peak value of the Gaussian PDF of each cell
+    if norm:
+        peak = np.ones(cent.shape[0])
+    else:
+        peak = 1 / (2 * np.pi * np.sqrt(sz_h * sz_w))
+
+    # Half-size of the bounding box of each cell, beyond which its PDF falls below the threshold
+    log_ratio = np.log(np.maximum(peak / zero_thres, 1))
+    rad = np.ceil(np.sqrt(2 * np.stack([sz_h, sz_w], axis=1) * log_ratio[:, None])).astype(int)
+    cent_int = np.around(cent).astype(int)
+
+    # Cells with the same box size are evaluated together, so that small cells keep small boxes
+    coords, data = [np.empty((3, 0), dtype=int)], [np.empty(0)]
+    box_sizes, box_of_cell = np.unique(rad, axis=0, return_inverse=True)
+    for ibox, (rad_h, rad_w) in enumerate(box_sizes):
+        cells = np.flatnonzero(box_of_cell.reshape(-1) == ibox)
+
+        # Pixel coordinates of the bounding box of each cell
+        hs = cent_int[cells, 0, None] + np.arange(-rad_h, rad_h + 1)
+        ws = cent_int[cells, 1, None] + np.arange(-rad_w, rad_w + 1)
+
+        # The PDF is separable along height and width, evaluate it for all cells at once
+        pdf_h = np.exp(-((hs - cent[cells, 0, None]) ** 2) / (2 * sz_h[cells, None]))
+        pdf_w = np.exp(-((ws - cent[cells, 1, None]) ** 2) / (2 * sz_w[cells, None]))
+        pdf = peak[cells, None, None] * pdf_h[:, :, None] * pdf_w[:, None, :]
+
+        # Keep pixels above threshold that fall inside the frame
+        mask = (
+            (pdf > zero_thres)
+            & ((hs >= 0) & (hs < height))[:, :, None]
+            & ((ws >= 0) & (ws < width))[:, None, :]
+        )
+        idx, ih, iw = np.nonzero(mask)
+        coords.append(np.stack([cells[idx], hs[idx, ih], ws[idx, iw]]))
+        data.append(pdf[mask])
+
+    # Put the pixels back in order of cell, then of height and width within each cell
+    coords, data = np.concatenate(coords, axis=1), np.concatenate(data)
+    order = np.argsort(coords[0], kind="stable")
+
+    return sparse.COO(
+        coords[:, order],
+        data[order],
+        shape=(cent.shape[0], height, width),
+        has_duplicates=False,
+        sorted=True,
+    )
 
 def exp_trace(
-    frame: int, pfire: float, tau_d: float, tau_r: float, trunc_thres: float = 1e-6
+    frame: int,
+    pfire: float,
+    tau_d: float,
+    tau_r: float,
+    trunc_thres: float = 1e-6,
+    seed: SeedLike = None,
 ) -> Tuple[np.ndarray, np.ndarray]:
     """
     Generates an exponential trace for a cell, simulating the calcium indicator dynamics modulated by a Poisson spike train.
@@ -135,6 +249,8 @@ def exp_trace(
         Rise constant for the exponential trace, representing the rise time of the calcium indicator.
     trunc_thres : float, optional
         Truncation threshold for the generated exponential trace. Values below this threshold are omitted. Default is 1e-6.
+    seed : SeedLike, optional
+        Seed or random number generator for the spike train.
 
     Returns
     -------
@@ -146,7 +262,7 @@ def exp_trace(
 
     # Generate a Poisson spike train, which is a sequence of binary values (0 or 1)
     # indicating whether a cell fires at each frame.
-    S = random.binomial(n=1, p=pfire, size=frame).astype(float)
+    S = default_rng(seed).binomial(n=1, p=pfire, size=frame).astype(float)
 
     # Generate a time array that goes from 0 to the total number of frames.
     t = np.arange(frame)
@@ -167,6 +283,69 @@ def exp_trace(
     return C, S
 
 
+def exp_traces(
+    ncell: int,
+    frame: int,
+    pfire: float,
+    tau_d: float,
+    tau_r: float,
+    dtype=np.float32,
+    seed: SeedLike = None,
+) -> Tuple[np.ndarray, sparse.COO]:
+    """
+    Generates exponential traces for a batch of cells at once, simulating the calcium indicator dynamics modulated by Poisson spike trains.
+
+    This is the batched equivalent of `exp_trace`. The spike trains of all cells are drawn as a single
+    array and filtered in one call with the recursive form of the double-exponential kernel, which
+    is exact up to the truncation applied by `exp_trace`.
+
+    Parameters
+    ----------
+    ncell : int
+        Number of cells.
+    frame : int
+        Total number of frames (i.e., time points) in the traces.
+    pfire : float
+        Probability of a cell firing at each frame, used to generate the Poisson spike trains.
+    tau_d : float
+        Decay constant for the exponential trace, representing the decay time of the calcium indicator.
+    tau_r : float
+        Rise constant for the exponential trace, representing the rise time of the calcium indicator.
+    dtype : optional
+        Data type of the generated calcium traces. Default is np.float32.
+    seed : SeedLike, optional
+        Seed or random number generator for the spike trains.
+
+    Returns
+    -------
+    C : np.ndarray
+        Generated calcium traces, of shape (frame, ncell).
+    S : sparse.COO
+        Generated Poisson spike trains, of shape (frame, ncell).
+    """
+
+    # Generate the Poisson spike trains of all cells as one (cell, frame) array
+    spikes = default_rng(seed).binomial(n=1, p=pfire, size=(ncell, frame)).astype(dtype)
+
+    # The kernel exp(-(t + 1) / tau_d) - exp(-(t + 1) / tau_r) used by `exp_trace` is the impulse
+    # response of a second order recursive filter, apply it to all spike trains at once.
+    a_d, a_r = np.exp(-1 / tau_d), np.exp(-1 / tau_r)
+    C = lfilter(
+        np.array([a_d - a_r], dtype=dtype),
+        np.array([1, -(a_d + a_r), a_d * a_r], dtype=dtype),
+        spikes,
+        axis=1,
+    )
+
+    # Store the spike trains sparsely, as they are mostly zeros
+    icell, ifrm = np.nonzero(spikes)
+    S = sparse.COO(
+        np.stack([ifrm, icell]), np.ones(len(ifrm), dtype=dtype), shape=(frame, ncell)
+    )
+
+    return C.T, S
+
+
 def random_walk(
     n_stp: int,
     stp_var: float = 1,
@@ -176,6 +355,7 @@ def random_walk(
     integer: bool = True,
     nn: bool = False,
     smooth_var: Optional[float] = None,
+    seed: SeedLike = None,
 ) -> np.ndarray:
     """
     Generates a random walk in ndim dimensions.
@@ -198,6 +378,8 @@ def random_walk(
         If True, the walk is clipped to non-negative values. Default is False.
     smooth_var : float, optional
         If provided, the walk is smoothed with a Gaussian filter of this variance. Default is None.
+    seed : SeedLike, optional
+        Seed or random number generator for the steps.
 
     Returns
     -------
@@ -214,18 +396,15 @@ def random_walk(
 
     """
 
-    # Initialize the walk as an array of zeros
-    walk = np.zeros(shape=(n_stp, ndim))
+    rng = default_rng(seed)
 
     # If a constrain factor is provided, we generate a constrained random walk
     if constrain_factor > 0:
-        for i in range(n_stp):
-            # Get the last step of the walk, or 0 if this is the first step
-            last = walk[i - 1] if i > 0 else 0
-            # Generate a new step as a Gaussian random value, with mean as a function of the last step
-            walk[i] = last + random.normal(
-                loc=-constrain_factor * last, scale=stp_var, size=ndim
-            )
+        # Each step is a Gaussian random value with mean pulling the walk back towards the origin,
+        # i.e. walk[i] = (1 - constrain_factor) * walk[i - 1] + noise[i], an AR(1) process.
+        # Generate the noise for all steps and dimensions at once, then apply the recurrence as a linear filter.
+        stps = rng.normal(loc=0, scale=stp_var, size=(n_stp, ndim))
+        walk = lfilter([1], [1, constrain_factor - 1], stps, axis=0)
 
         # If integer is True, round the walk to the nearest integers
         if integer:
@@ -234,7 +413,7 @@ def random_walk(
     # If no constrain factor is provided, we generate a simple random walk
     else:
         # Generate the steps of the walk as Gaussian random values
-        stps = random.normal(loc=0, scale=stp_var, size=(n_stp, ndim))
+        stps = rng.normal(loc=0, scale=stp_var, size=(n_stp, ndim))
 
         # If integer is True, round the steps to the nearest integers
         if integer:
@@ -245,8 +424,7 @@ def random_walk(
 
     # If a smooth variance is provided, smooth the walk with a Gaussian filter
     if smooth_var is not None:
-        for iw in range(ndim):
-            walk[:, iw] = gaussian_filter1d(walk[:, iw], smooth_var)
+        walk = gaussian_filter1d(walk, smooth_var, axis=0)
 
     # If norm is True, normalize the walk to the range [0, 1]
     if norm:
@@ -277,10 +455,13 @@ def simulate_miniscope_data(
     bg_smth_var: float = 60.0,
     mo_stp_var: float = 1.0,
     mo_cons_fac: float = 0.2,
+    mo_subpixel: bool = False,
     cent: Optional[np.ndarray] = None,
     zero_thres: float = 1e-8,
     chk_size: int = 1000,
+    tile_size: Optional[int] = None,
     arr_name: str = "sim-miniscope",
+    seed: SeedLike = None,
 ) -> xr.DataArray:
     """
     Generates a simulated miniscope dataset that mimics the key properties of real
@@ -329,6 +510,9 @@ def simulate_miniscope_data(
         Variance of the motion step.
     mo_cons_fac : float
         Motion constraint factor.
+    mo_subpixel : bool, optional
+        If True, motion shifts are not rounded to whole pixels and frames are
+        shifted with bilinear interpolation. Default is False.
     cent : np.ndarray, optional
         Centroid of the Gaussian cell. If not specified, a random centroid is generated.
     zero_thres : float, optional
@@ -336,8 +520,15 @@ def simulate_miniscope_data(
         is 1e-8.
     chk_size : int, optional
         Chunk size for data array computations. Default is 1000.
+    tile_size : int, optional
+        Size of the spatial tiles the frames are generated in, in pixels. Each tile
+        is computed from the footprints that intersect it plus a halo sized to the
+        maximum motion shift. By default, whole frames are generated at once.
     arr_name : str, optional
         Name of the data array. Default is 'sim-miniscope'.
+    seed : SeedLike, optional
+        Seed or random number generator of the simulation. The result only depends
+        on the seed, not on `chk_size`, `tile_size` or on how the blocks are scheduled.
 
     Returns
     -------
@@ -348,34 +539,162 @@ def simulate_miniscope_data(
     # Extract frame, height and width from dimensions
     ff, hh, ww = dims["frame"], dims["height"], dims["width"]
 
+    # Generate the spatial footprints and temporal dynamics of cells, background sources and motion
+    model = _simulate_miniscope_model(
+        ncell=ncell,
+        dims=dims,
+        sz_mean=sz_mean,
+        sz_sigma=sz_sigma,
+        sz_min=sz_min,
+        tmp_pfire=tmp_pfire,
+        tmp_tau_d=tmp_tau_d,
+        tmp_tau_r=tmp_tau_r,
+        bg_nsrc=bg_nsrc,
+        bg_tmp_var=bg_tmp_var,
+        bg_cons_fac=bg_cons_fac,
+        bg_smth_var=bg_smth_var,
+        mo_stp_var=mo_stp_var,
+        mo_cons_fac=mo_cons_fac,
+        mo_subpixel=mo_subpixel,
+        cent=cent,
+        zero_thres=zero_thres,
+        seed=seed,
+    )
+    pad = model["pad"]
+
+    # Convert the traces and shifts into Dask arrays for efficient computation.
+    C = darr.from_array(model["C"], chunks=(chk_size, -1))
+    C_bg = darr.from_array(model["C_bg"], chunks=(chk_size, -1))
+    shifts = darr.from_array(model["shifts"], chunks=(chk_size, -1)).to_delayed()[:, 0]
+
+    # Split the frame into spatial tiles. Motion moves pixels by up to `pad`, so each tile is
+    # computed over a window of the padded frame that extends `pad` pixels beyond it on each side.
+    tile_size = tile_size or max(hh, ww)
+    tiles_h = [(h0, min(h0 + tile_size, hh)) for h0 in range(0, hh, tile_size)]
+    tiles_w = [(w0, min(w0 + tile_size, ww)) for w0 in range(0, ww, tile_size)]
+
+    Y = []
+    for h0, h1 in tiles_h:
+        Y.append([])
+        for w0, w1 in tiles_w:
+            # Only keep the footprints, and their traces, that intersect the window of the tile
+            A, iu = _crop_footprints(model["A"], slice(h0, h1 + 2 * pad), slice(w0, w1 + 2 * pad))
+            A_bg, ib = _crop_footprints(model["A_bg"], slice(h0, h1 + 2 * pad), slice(w0, w1 + 2 * pad))
+            A, A_bg = dask.delayed(A), dask.delayed(A_bg)
+            C_tile, C_bg_tile = C[:, iu].to_delayed()[:, 0], C_bg[:, ib].to_delayed()[:, 0]
+
+            # Compute the simulated calcium imaging video of the tile by multiplying the spatial footprints with the temporal dynamics and adding the result for all cells and background noise sources.
+            blocks = [
+                darr.from_delayed(
+                    dask.delayed(_compute_tile)(
+                        A,
+                        c,
+                        A_bg,
+                        c_bg,
+                        sh,
+                        pad=pad,
+                        origin=(f0, h0, w0),
+                        noise_key=model["noise_key"],
+                        sig_scale=sig_scale,
+                        noise_scale=0.1,
+                        post_offset=post_offset,
+                        post_gain=post_gain,
+                        subpixel=mo_subpixel,
+                    ),
+                    shape=(nf, h1 - h0, w1 - w0),
+                    dtype=np.uint8,
+                )
+                for c, c_bg, sh, nf, f0 in zip(
+                    C_tile, C_bg_tile, shifts, C.chunks[0], np.cumsum((0,) + C.chunks[0][:-1])
+                )
+            ]
+            Y[-1].append(darr.concatenate(blocks, axis=0))
+    Y = darr.block(Y)
+
+    # Convert the simulated calcium imaging video and other variables into Xarray DataArrays for easy manipulation and indexing.
+    uids, hs, ws, fs = np.arange(ncell), np.arange(hh), np.arange(ww), np.arange(ff)
+
+    Y = xr.DataArray(
+        Y,
+        dims=["frame", "height", "width"],
+        coords={"frame": fs, "height": hs, "width": ws},
+        name=arr_name,
+    )
+
+    # time = fs / sampling_rate
+    # Y = Y.expand_dims(time=time, axis=0) # is this the correct way to add a redundant dim?
+
+    # Return simulated data
+    return Y  # , A, C, S, shifts, time
+
+
+def _simulate_miniscope_model(
+    ncell: int,
+    dims: Dict[str, int],
+    sz_mean: float,
+    sz_sigma: float,
+    sz_min: float,
+    tmp_pfire: float,
+    tmp_tau_d: float,
+    tmp_tau_r: float,
+    bg_nsrc: int,
+    bg_tmp_var: float,
+    bg_cons_fac: float,
+    bg_smth_var: float,
+    mo_stp_var: float,
+    mo_cons_fac: float,
+    mo_subpixel: bool,
+    cent: Optional[np.ndarray],
+    zero_thres: float,
+    seed: SeedLike = None,
+) -> dict:
+    """
+    Generates the spatial footprints and temporal dynamics underlying a simulated
+    miniscope dataset. See `simulate_miniscope_data` for the parameters.
+
+    Returns
+    -------
+    dict
+        Footprints `A` and `A_bg` (sparse, over the padded frame), calcium traces `C`,
+        spike trains `S`, background dynamics `C_bg`, motion `shifts`, the padding
+        `pad` added around each edge of the frame and the key `noise_key` of the noise.
+    """
+
+    # Extract frame, height and width from dimensions
+    ff, hh, ww = dims["frame"], dims["height"], dims["width"]
+
+    # Each component of the model is drawn from its own stream of the seed
+    ss = seed_sequence(seed)
+
     # Generate random shifts for simulating motion in the video. This is done using a random walk model.
-    shifts = xr.DataArray(
-        darr.from_array(
-            random_walk(ff, ndim=2, stp_var=mo_stp_var, constrain_factor=mo_cons_fac),
-            chunks=(chk_size, -1),
-        ),
-        dims=["frame", "shift_dim"],
-        coords={"frame": np.arange(ff), "shift_dim": ["height", "width"]},
-        name="shifts",
+    shifts = random_walk(
+        ff,
+        ndim=2,
+        stp_var=mo_stp_var,
+        constrain_factor=mo_cons_fac,
+        integer=not mo_subpixel,
+        seed=child_rng(ss, 0),
     )
 
     # Pad the shifts if they exceed a certain limit, i.e. if the shifts are too large, they are clipped to prevent artifacts in the simulated data.
-    pad = np.absolute(shifts).max().values.item()
+    pad = int(np.ceil(np.absolute(shifts).max()))
     if pad > 20:
         warnings.warn("maximum shift is {}, clipping".format(pad))
         shifts = shifts.clip(-20, 20)
 
     # If no cell centroid positions are provided, randomly generate them within the frame, leaving some padding around the edges.
     if cent is None:
+        rng = child_rng(ss, 1)
         cent = np.stack(
             [
-                np.random.randint(pad * 2, hh, size=ncell),
-                np.random.randint(pad * 2, ww, size=ncell),
+                rng.integers(pad * 2, hh, size=ncell),
+                rng.integers(pad * 2, ww, size=ncell),
             ],
             axis=1,
         )
 
     # Generate spatial footprints for each cell using a Gaussian model.
+    # The footprints are directly generated as a sparse matrix representation for efficient computation.
     A = gauss_cell(
         2 * pad + hh,
         2 * pad + ww,
@@ -383,26 +702,19 @@ def simulate_miniscope_data(
         sz_sigma=sz_sigma,
         sz_min=sz_min,
         cent=cent,
-    )
-
-    # Convert the footprints into a sparse matrix representation for efficient computation.
-    A = darr.from_array(
-        sparse.COO.from_numpy(np.where(A > zero_thres, A, 0)), chunks=-1
-    )
+        zero_thres=zero_thres,
+        seed=child_rng(ss, 2),
+    ).astype(np.float32)
 
     # Generate calcium traces for each cell. The temporal dynamics are modeled as an exponential decay (due to calcium indicator) modulated by a Poisson spike train.
-    traces = [exp_trace(ff, tmp_pfire, tmp_tau_d, tmp_tau_r) for _ in range(len(cent))]
-
-    # Convert the calcium traces and spike trains into Dask arrays for efficient computation.
-    C = darr.from_array(np.stack([t[0] for t in traces]).T, chunks=(chk_size, -1))
-    S = darr.from_array(np.stack([t[1] for t in traces]).T, chunks=(chk_size, -1))
+    C, S = exp_traces(len(cent), ff, tmp_pfire, tmp_tau_d, tmp_tau_r, seed=child_rng(ss, 3))
 
     # Generate centroids for background noise
-
+    rng = child_rng(ss, 4)
     cent_bg = np.stack(
         [
-            np.random.randint(pad, pad + hh, size=bg_nsrc),
-            np.random.randint(pad, pad + ww, size=bg_nsrc),
+            rng.integers(pad, pad + hh, size=bg_nsrc),
+            rng.integers(pad, pad + ww, size=bg_nsrc),
         ],
         axis=1,
     )
@@ -415,69 +727,68 @@ def simulate_miniscope_data(
         sz_sigma=sz_sigma * 10,
         sz_min=sz_min,
         cent=cent_bg,
-    )
-
-    # Convert the footprints for the background noise sources into a sparse matrix representation for efficient computation.
-    A_bg = darr.from_array(
-        sparse.COO.from_numpy(np.where(A_bg > zero_thres, A_bg, 0)), chunks=-1
-    )
+        zero_thres=zero_thres,
+        seed=child_rng(ss, 5),
+    ).astype(np.float32)
 
     # Generate temporal dynamics for the background noise sources using a random walk model.
-    C_bg = darr.from_array(
-        random_walk(
-            ff,
-            ndim=bg_nsrc,
-            stp_var=bg_tmp_var,
-            norm=False,
-            integer=False,
-            nn=True,
-            constrain_factor=bg_cons_fac,
-            smooth_var=bg_smth_var,
-        ),
-        chunks=(chk_size, -1),
+    C_bg = random_walk(
+        ff,
+        ndim=bg_nsrc,
+        stp_var=bg_tmp_var,
+        norm=False,
+        integer=False,
+        nn=True,
+        constrain_factor=bg_cons_fac,
+        smooth_var=bg_smth_var,
+        seed=child_rng(ss, 6),
+    ).astype(np.float32)
+
+    return dict(
+        A=A, C=C, S=S, A_bg=A_bg, C_bg=C_bg, shifts=shifts, pad=pad, noise_key=stream_key(ss, 7)
     )
 
-    # Compute the simulated calcium imaging video by multiplying the spatial footprints with the temporal dynamics and adding the result for all cells and background noise sources.
-    Y = darr.blockwise(
-        computeY,
-        "fhw",
-        A,
-        "uhw",
-        C,
-        "fu",
-        A_bg,
-        "bhw",
-        C_bg,
-        "fb",
-        shifts.data,
-        "fs",
-        dtype=np.uint8,
-        sig_scale=sig_scale,
-        noise_scale=0.1,
-        post_offset=post_offset,
-        post_gain=post_gain,
-    )
-
-    # Remove the padding around the edges of the video if it was added before.
-    if pad == 0:
-        pad = None
-    Y = Y[:, pad:-pad, pad:-pad]
 
-    # Convert the simulated calcium imaging video and other variables into Xarray DataArrays for easy manipulation and indexing.
-    uids, hs, ws, fs = np.arange(ncell), np.arange(hh), np.arange(ww), np.arange(ff)
+def _crop_footprints(A: sparse.COO, hs: slice, ws: slice) -> Tuple[sparse.COO, np.ndarray]:
+    """
+    Crops footprints to a window of the frame, keeping only those that intersect it.
 
-    Y = xr.DataArray(
-        Y,
-        dims=["frame", "height", "width"],
-        coords={"frame": fs, "height": hs, "width": ws},
-        name=arr_name,
+    Returns
+    -------
+    A : sparse.COO
+        The cropped footprints.
+    units : np.ndarray
+        Indices of the kept footprints.
+    """
+    # Select the nonzero elements inside the window directly from the coordinates, rather than
+    # through sparse indexing, whose first use in a process has a large compilation overhead
+    h0, h1 = hs.start, min(hs.stop, A.shape[1])
+    w0, w1 = ws.start, min(ws.stop, A.shape[2])
+    unit, h, w = A.coords
+    keep = (h >= h0) & (h < h1) & (w >= w0) & (w < w1)
+    units, iunit = np.unique(unit[keep], return_inverse=True)
+    A = sparse.COO(
+        np.stack([iunit, h[keep] - h0, w[keep] - w0]),
+        A.data[keep],
+        shape=(len(units), h1 - h0, w1 - w0),
+        has_duplicates=False,
+        sorted=True,
     )
+    return A, units
 
-    # time = fs / sampling_rate
-    # Y = Y.expand_dims(time=time, axis=0) # is this the correct way to add a redundant dim?
 
-    # Return simulated data
-    return Y  # , A, C, S, shifts, time
+def _compute_tile(
+    A: sparse.COO,
+    C: np.ndarray,
+    A_bg: sparse.COO,
+    C_bg: np.ndarray,
+    shifts: np.ndarray,
+    pad: int,
+    **kwargs,
+) -> np.ndarray:
+    """Computes a tile of simulated imaging data over its padded window, and removes the padding."""
+    Y = computeY([A], [C], [A_bg], [C_bg], [shifts], **kwargs)
+    return Y[:, pad : Y.shape[1] - pad, pad : Y.shape[2] - pad]
 
 
 def computeY(
@@ -490,10 +801,16 @@ def computeY(
     noise_scale: float,
     post_offset: float,
     post_gain: float,
+    subpixel: bool = False,
+    noise_key: Optional[int] = None,
+    origin: Tuple[int, int, int] = (0, 0, 0),
 ) -> np.ndarray:
     """
     Computes a simulated imaging data array.
 
+    The computation runs in float32 and in place, using a single frame-block buffer
+    for the noise, filled in place for each block of frames, besides the 8-bit output.
+
     Parameters
     ----------
     A : list of np.ndarray
@@ -514,6 +831,16 @@ def computeY(
         Constant offset added to the data after noise addition.
     post_gain : float
         Gain factor applied to the data after the offset.
+    subpixel : bool, optional
+        Whether to apply the shifts with subpixel interpolation. Default is False.
+    noise_key : int, optional
+        Key of the noise, see `neurodatagen.rng.hashed_normal`. The noise of each
+        pixel only depends on the key and on its position, so that blocks and tiles
+        of the same dataset can be computed separately. If not specified, a random
+        key is drawn.
+    origin : tuple of int, optional
+        Position (frame, height, width) of the first pixel of the data within the
+        padded dataset, used to index the noise. Default is (0, 0, 0).
 
     Returns
     -------
@@ -524,33 +851,29 @@ def computeY(
     # Select the first element from each of the input lists
     A, C, A_bg, C_bg, shifts = A[0], C[0], A_bg[0], C_bg[0], shifts[0]
 
-    # Compute the product of the calcium traces and spatial footprints for each cell
-    # This gives the signal contribution from each cell
-    Y = sparse.tensordot(C, A, axes=1)
-
-    # Scale the signal contribution from each cell
-    Y *= sig_scale
-
-    # Compute the product of the temporal dynamics and spatial footprints for each background noise source
-    # This gives the signal contribution from the background noise
-    Y_bg = sparse.tensordot(C_bg, A_bg, axes=1)
-
-    # Add the signal contribution from the background noise to the cell signal contribution
-    Y += Y_bg
-
-    # Delete the background noise contribution array to free memory
-    del Y_bg
-
-    # Apply shifts to each frame of the data to simulate motion artifacts
-    for i, sh in enumerate(shifts):
-        Y[i, :, :] = shift_perframe(Y[i, :, :], sh, fill=0)
-
-    # Generate a noise array and add it to the data
-    noise = np.random.normal(scale=noise_scale, size=Y.shape)
-    Y += noise
+    # Compute the product of the temporal dynamics and spatial footprints for all cells (scaled by the signal
+    # strength) and background noise sources at once, as a single float32 product.
+    # This gives the signal contribution from each cell and from the background noise
+    Y = sparse.tensordot(
+        np.concatenate([C * sig_scale, C_bg], axis=1).astype(np.float32, copy=False),
+        sparse.concatenate([A, A_bg]).astype(np.float32, copy=False),
+        axes=1,
+    )
 
-    # Delete the noise array to free memory
-    del noise
+    # Apply shifts to each frame of the data to simulate motion artifacts, in place
+    shift_frames(Y, shifts, fill=0, subpixel=subpixel, out=Y)
+
+    # Generate the noise a few frames at a time to bound memory, and add it to the data
+    if noise_key is None:
+        noise_key = stream_key(None)
+    fo, ho, wo = origin
+    nbuf = np.empty((min(16, len(Y)),) + Y.shape[1:], dtype=np.float32)
+    for f0 in range(0, len(Y), 16):
+        block = nbuf[: min(16, len(Y) - f0)]
+        hashed_normal(noise_key, (fo + f0, ho, wo), block.shape, out=block)
+        block *= noise_scale
+        Y[f0 : f0 + len(block)] += block
+    del nbuf
 
     # Add a constant offset to the data
     Y += post_offset
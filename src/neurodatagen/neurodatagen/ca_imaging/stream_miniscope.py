@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+from typing import Iterator, Optional
+import time
+import numpy as np
+import sparse
+
+from ..rng import SeedLike, seed_sequence, child_rng
+from .gen_miniscope import gauss_cell, shift_frames
+
+
+class MiniscopeFrameSource:
+    """
+    Real-time source of simulated miniscope frames.
+
+    Frames are generated one at a time from the same footprint, calcium trace,
+    background and motion model as `simulate_miniscope_data`, and yielded at a
+    target frame rate, so that viewers and pipelines can be exercised against a
+    live acquisition without any hardware.
+
+    Only a constant amount of temporal state is kept: the calcium traces use the
+    recursive form of the double-exponential kernel (two values per cell), and
+    the background sources and motion are AR(1) random walks (one value per
+    source and dimension). As a stream can not look ahead, the Gaussian smoothing
+    of the background dynamics is replaced by a causal exponential smoothing
+    with the same equivalent noise bandwidth.
+
+    Parameters
+    ----------
+    ncell : int
+        Number of cells to simulate.
+    height : int
+        Height of the frames.
+    width : int
+        Width of the frames.
+    fps : float
+        Target frame rate, in frames per second. Default is 30.
+    sig_scale : float
+        Signal scaling factor.
+    sz_mean : float
+        Mean size of the Gaussian cell.
+    sz_sigma : float
+        Standard deviation of the Gaussian cell size.
+    sz_min : float
+        Minimum size of the Gaussian cell.
+    tmp_pfire : float
+        Temporal probability of fire.
+    tmp_tau_d : float
+        Temporal decay constant.
+    tmp_tau_r : float
+        Temporal rise constant.
+    post_offset : float
+        Post-processing offset.
+    post_gain : float
+        Post-processing gain.
+    bg_nsrc : int
+        Number of background noise sources.
+    bg_tmp_var : float
+        Variance of the background temporal noise.
+    bg_cons_fac : float
+        Background noise constraint factor.
+    bg_smth_var : float
+        Variance of the background noise smoothing.
+    mo_stp_var : float
+        Variance of the motion step.
+    mo_cons_fac : float
+        Motion constraint factor.
+    max_shift : int
+        Motion shifts are clipped to this number of pixels. Default is 20.
+    noise_scale : float
+        Scaling factor for the noise. Default is 0.1.
+    zero_thres : float, optional
+        Threshold for zeroing out elements of the footprints. Default is 1e-8.
+    seed : SeedLike, optional
+        Seed or random number generator of the footprints, temporal dynamics and noise.
+
+    Attributes
+    ----------
+    stats : dict
+        Number of frames yielded, number of frames that were late, achieved frame
+        rate and the frame rate that generation alone could sustain.
+    """
+
+    def __init__(
+        self,
+        ncell: int = 40,
+        height: int = 256,
+        width: int = 256,
+        fps: float = 30.0,
+        sig_scale: float = 1.0,
+        sz_mean: float = 3.0,
+        sz_sigma: float = 0.6,
+        sz_min: float = 0.1,
+        tmp_pfire: float = 0.01,
+        tmp_tau_d: float = 6.0,
+        tmp_tau_r: float = 1.0,
+        post_offset: float = 1.0,
+        post_gain: float = 50.0,
+        bg_nsrc: int = 100,
+        bg_tmp_var: float = 2.0,
+        bg_cons_fac: float = 0.1,
+        bg_smth_var: float = 60.0,
+        mo_stp_var: float = 1.0,
+        mo_cons_fac: float = 0.2,
+        max_shift: int = 20,
+        noise_scale: float = 0.1,
+        zero_thres: float = 1e-8,
+        seed: SeedLike = None,
+    ):
+        self.fps = fps
+        self.height, self.width, self.pad = height, width, max_shift
+        self.sig_scale, self.noise_scale = sig_scale, noise_scale
+        self.post_offset, self.post_gain = post_offset, post_gain
+        self.tmp_pfire = tmp_pfire
+        self.bg_tmp_var, self.bg_cons_fac = bg_tmp_var, bg_cons_fac
+        self.mo_stp_var, self.mo_cons_fac = mo_stp_var, mo_cons_fac
+        ss = seed_sequence(seed)
+        self._rng = child_rng(ss, 0)
+
+        # Generate footprints of cells and background sources over the padded frame, as in `simulate_miniscope_data`.
+        # Cells are kept `max_shift` away from the edges of the field of view, or as far as it allows
+        pad, hh, ww = self.pad, 2 * max_shift + height, 2 * max_shift + width
+        mh, mw = min(pad, (height - 1) // 2), min(pad, (width - 1) // 2)
+        rng = child_rng(ss, 1)
+        cent = np.stack(
+            [
+                rng.integers(pad + mh, pad + height - mh, size=ncell),
+                rng.integers(pad + mw, pad + width - mw, size=ncell),
+            ],
+            axis=1,
+        )
+        A = gauss_cell(
+            hh, ww, sz_mean, sz_sigma, sz_min, cent=cent, zero_thres=zero_thres, seed=child_rng(ss, 2)
+        )
+        rng = child_rng(ss, 3)
+        cent_bg = np.stack(
+            [rng.integers(pad, pad + height, size=bg_nsrc), rng.integers(pad, pad + width, size=bg_nsrc)],
+            axis=1,
+        )
+        A_bg = gauss_cell(
+            hh,
+            ww,
+            sz_mean * 60,
+            sz_sigma * 10,
+            sz_min,
+            cent=cent_bg,
+            zero_thres=zero_thres,
+            seed=child_rng(ss, 4),
+        )
+
+        # Stack all footprints as a (source, pixel) matrix, so that a frame is a single sparse product
+        self._A = (
+            sparse.concatenate([A, A_bg]).reshape((ncell + bg_nsrc, hh * ww)).astype(np.float32).tocsr()
+        )
+
+        # Temporal state: calcium kernel components per cell, background walk and its smoothing per source, motion
+        self._a_d, self._a_r = np.exp(-1 / tmp_tau_d), np.exp(-1 / tmp_tau_r)
+        self._u_d, self._u_r = np.zeros(ncell), np.zeros(ncell)
+        self._bg_walk, self._bg_smth = np.zeros(bg_nsrc), np.zeros(bg_nsrc)
+        # Exponential smoothing whose noise gain alpha / (2 - alpha) is that of a Gaussian, 1 / (2 sqrt(pi) sigma)
+        self._bg_alpha = 1 / (np.sqrt(np.pi) * bg_smth_var + 0.5)
+        self._shift = np.zeros(2)
+
+        self._frame = np.empty((1, hh, ww), dtype=np.float32)
+        self._noise = np.empty((hh, ww), dtype=np.float32)
+        self.stats = dict(frames=0, late=0, fps=0.0, max_fps=0.0)
+
+    def next_frame(self) -> np.ndarray:
+        """
+        Advances the simulation by one frame, without any pacing.
+
+        Returns
+        -------
+        np.ndarray
+            The next frame, as a (height, width) 8-bit unsigned integer array.
+        """
+        rng = self._rng
+
+        # Calcium traces, the sum of two exponentially decaying components driven by the spikes
+        spk = rng.random(len(self._u_d)) < self.tmp_pfire
+        self._u_d = self._a_d * (self._u_d + spk)
+        self._u_r = self._a_r * (self._u_r + spk)
+
+        # Background dynamics, a constrained random walk followed by causal smoothing
+        self._bg_walk += rng.normal(
+            loc=-self.bg_cons_fac * self._bg_walk, scale=self.bg_tmp_var
+        )
+        self._bg_smth += self._bg_alpha * (self._bg_walk - self._bg_smth)
+
+        # Motion, a constrained random walk rounded to whole pixels
+        self._shift += rng.normal(loc=-self.mo_cons_fac * self._shift, scale=self.mo_stp_var)
+        shift = np.clip(np.around(self._shift), -self.pad, self.pad)
+
+        # Combine the footprints with the temporal dynamics, then shift the frame in place
+        coefs = np.concatenate(
+            [(self._u_d - self._u_r) * self.sig_scale, np.clip(self._bg_smth, 0, None)]
+        ).astype(np.float32)
+        Y = self._frame
+        Y.reshape(-1)[:] = self._A.T.dot(coefs)
+        shift_frames(Y, shift[None], fill=0, out=Y)
+
+        # Add noise, offset and gain, then clip to the 8-bit range
+        rng.standard_normal(dtype=np.float32, out=self._noise)
+        self._noise *= self.noise_scale
+        Y[0] += self._noise
+        Y += self.post_offset
+        Y *= self.post_gain
+        np.clip(Y, 0, 255, out=Y)
+
+        pad = self.pad
+        return Y[0, pad : pad + self.height, pad : pad + self.width].astype(np.uint8)
+
+    def frames(self, n_frames: Optional[int] = None, realtime: bool = True) -> Iterator[np.ndarray]:
+        """
+        Yields frames at the target frame rate.
+
+        Parameters
+        ----------
+        n_frames : int, optional
+            Number of frames to yield. If not specified, frames are yielded indefinitely.
+        realtime : bool, optional
+            Whether to pace the frames at the target frame rate. If False, frames are
+            yielded as fast as they can be generated. Default is True.
+
+        Yields
+        ------
+        np.ndarray
+            The next frame, as a (height, width) 8-bit unsigned integer array.
+        """
+        start, busy, ifrm = time.perf_counter(), 0.0, 0
+        while n_frames is None or ifrm < n_frames:
+            t0 = time.perf_counter()
+            frame = self.next_frame()
+            busy += time.perf_counter() - t0
+
+            # Wait for the frame's due time, or record it as late if generation fell behind
+            due = start + (ifrm + 1) / self.fps
+            now = time.perf_counter()
+            if realtime:
+                if now < due:
+                    time.sleep(due - now)
+                else:
+                    self.stats["late"] += 1
+
+            ifrm += 1
+            self.stats["frames"] += 1
+            self.stats["fps"] = ifrm / (time.perf_counter() - start)
+            self.stats["max_fps"] = ifrm / busy
+            yield frame
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        return self.frames()
+
+    @property
+    def keeping_up(self) -> bool:
+        """Whether frame generation sustains the target frame rate."""
+        return self.stats["max_fps"] >= self.fps
@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional
+import os
+import time
+import dask.array as darr
+import numpy as np
+import xarray as xr
+
+from .gen_miniscope import _simulate_miniscope_model, computeY
+
+# Model and output array of the current worker process, set by `_init_worker`
+_WORKER = {}
+
+
+def write_miniscope_zarr(
+    store: str,
+    ncell: int = 40,
+    dims: dict = {"height": 256, "width": 256, "frame": 150},
+    sig_scale: float = 1.0,
+    post_offset: float = 1.0,
+    post_gain: float = 50.0,
+    seed: Optional[int] = None,
+    chk_size: int = 1000,
+    arr_name: str = "sim-miniscope",
+    n_workers: Optional[int] = None,
+    resume: bool = False,
+    verbose: bool = True,
+    **kwargs,
+) -> float:
+    """
+    Generates a simulated miniscope dataset and streams it to a zarr store, one
+    block of frames at a time.
+
+    The footprints and temporal dynamics of the simulation are generated once,
+    then blocks of `chk_size` frames are computed by a pool of worker processes
+    and written directly to their region of the store. Peak memory is therefore
+    proportional to a block of frames per worker rather than to the whole dataset.
+    Completed blocks are recorded in the store, so that an interrupted run can be
+    resumed with `resume=True` and the same parameters.
+
+    Parameters
+    ----------
+    store : str
+        Path of the zarr store to write to.
+    ncell : int
+        Number of cells to simulate.
+    dims : dict
+        Dictionary specifying the dimensions (frame, height, width) of the data.
+    sig_scale : float
+        Signal scaling factor.
+    post_offset : float
+        Post-processing offset.
+    post_gain : float
+        Post-processing gain.
+    seed : int, optional
+        Seed of the simulation. If not specified, a random seed is drawn. The seed
+        is stored in the zarr store and reused when resuming. The data only depends
+        on the seed, not on `chk_size` or `n_workers`.
+    chk_size : int, optional
+        Number of frames per block, which is also the chunk size along frames in
+        the zarr store. Default is 1000.
+    arr_name : str, optional
+        Name of the data array. Default is 'sim-miniscope'.
+    n_workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs. If 1, blocks
+        are computed in the current process.
+    resume : bool, optional
+        Whether to resume writing to an existing store, skipping completed blocks.
+        Default is False, which overwrites the store.
+    verbose : bool, optional
+        Whether to report progress and throughput. Default is True.
+    **kwargs
+        Further simulation parameters, see `simulate_miniscope_data`.
+
+    Returns
+    -------
+    float
+        Throughput of the run, in frames per second.
+
+    Raises
+    ------
+    ValueError
+        if resuming a store that was written with different parameters.
+    """
+    import zarr  # import here to avoid dependency for all workflows
+
+    ff, hh, ww = dims["frame"], dims["height"], dims["width"]
+    params = dict(
+        ncell=ncell,
+        dims=dict(dims),
+        sig_scale=sig_scale,
+        post_offset=post_offset,
+        post_gain=post_gain,
+        chk_size=chk_size,
+        **{k: np.asarray(v).tolist() if isinstance(v, np.ndarray) else v for k, v in kwargs.items()},
+    )
+
+    # Reuse the seed and completed blocks of an interrupted run
+    group = zarr.open_group(store, mode="a") if resume else None
+    if group is not None and "sim_params" in group.attrs:
+        if group.attrs["sim_params"] != params:
+            raise ValueError(
+                f"Cannot resume {store}, it was written with parameters {group.attrs['sim_params']}"
+            )
+        seed = group.attrs["sim_seed"]
+        completed = set(group.attrs["completed_blocks"])
+    else:
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1)[0])
+        # Write the metadata and coordinates of the store, without any data
+        Y = xr.DataArray(
+            darr.zeros((ff, hh, ww), chunks=(chk_size, -1, -1), dtype=np.uint8),
+            dims=["frame", "height", "width"],
+            coords={"frame": np.arange(ff), "height": np.arange(hh), "width": np.arange(ww)},
+            name=arr_name,
+        )
+        Y.to_dataset().to_zarr(store, mode="w", compute=False)
+        group = zarr.open_group(store, mode="a")
+        group.attrs.update(sim_params=params, sim_seed=seed, completed_blocks=[])
+        completed = set()
+
+    # Generate the footprints and temporal dynamics of the simulation
+    model = _simulate_miniscope_model(ncell=ncell, dims=dims, seed=seed, **_model_kwargs(kwargs))
+    compute_kwargs = dict(
+        sig_scale=sig_scale,
+        noise_scale=0.1,
+        post_offset=post_offset,
+        post_gain=post_gain,
+        subpixel=kwargs.get("mo_subpixel", False),
+    )
+
+    blocks = [
+        (iblk, f0, min(f0 + chk_size, ff))
+        for iblk, f0 in enumerate(range(0, ff, chk_size))
+        if iblk not in completed
+    ]
+    n_frames, n_done = sum(f1 - f0 for _, f0, f1 in blocks), 0
+    start = time.perf_counter()
+
+    def _report(iblk, nfm):
+        nonlocal n_done
+        completed.add(iblk)
+        group.attrs["completed_blocks"] = sorted(completed)
+        n_done += nfm
+        if verbose:
+            rate = n_done / (time.perf_counter() - start)
+            print(f"Wrote {n_done}/{n_frames} frames ({rate:.1f} frames/s)", end="\r")
+
+    n_workers = n_workers or os.cpu_count()
+    if n_workers == 1:
+        _init_worker(model, store, arr_name, compute_kwargs)
+        for blk in blocks:
+            _report(*_write_block(*blk))
+    else:
+        with ProcessPoolExecutor(
+            n_workers,
+            initializer=_init_worker,
+            initargs=(model, store, arr_name, compute_kwargs),
+        ) as pool:
+            # Only keep a few blocks in flight per worker to bound memory
+            pending, blocks = set(), iter(blocks)
+            for blk in blocks:
+                pending.add(pool.submit(_write_block, *blk))
+                if len(pending) >= 2 * n_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        _report(*fut.result())
+            for fut in pending:
+                _report(*fut.result())
+
+    zarr.consolidate_metadata(store)
+    rate = n_done / max(time.perf_counter() - start, 1e-9)
+    if verbose:
+        print(f"\nWrote {n_done} frames to {store} ({rate:.1f} frames/s)")
+    return rate
+
+
+def _model_kwargs(kwargs: dict) -> dict:
+    """Fill in the defaults of `simulate_miniscope_data` for the model parameters."""
+    defaults = dict(
+        sz_mean=3.0,
+        sz_sigma=0.6,
+        sz_min=0.1,
+        tmp_pfire=0.01,
+        tmp_tau_d=6.0,
+        tmp_tau_r=1.0,
+        bg_nsrc=100,
+        bg_tmp_var=2.0,
+        bg_cons_fac=0.1,
+        bg_smth_var=60.0,
+        mo_stp_var=1.0,
+        mo_cons_fac=0.2,
+        mo_subpixel=False,
+        cent=None,
+        zero_thres=1e-8,
+    )
+    unknown = set(kwargs) - set(defaults)
+    if unknown:
+        raise TypeError(f"Unexpected simulation parameters: {sorted(unknown)}")
+    defaults.update(kwargs)
+    if defaults["cent"] is not None:
+        defaults["cent"] = np.asarray(defaults["cent"])
+    return defaults
+
+
+def _init_worker(model: dict, store: str, arr_name: str, compute_kwargs: dict) -> None:
+    """Keep the simulation model and the output array around in each worker process."""
+    import zarr  # import here to avoid dependency for all workflows
+
+    _WORKER.update(
+        model=model,
+        arr=zarr.open_group(store, mode="r+")[arr_name],
+        compute_kwargs=compute_kwargs,
+    )
+
+
+def _write_block(iblk: int, f0: int, f1: int):
+    """Compute a block of frames and write it to its region of the output array."""
+    model, arr = _WORKER["model"], _WORKER["arr"]
+    pad, (_, hh, ww) = model["pad"], arr.shape
+
+    # Noise is indexed by the position of the block, so that it does not depend on the worker computing it
+    Y = computeY(
+        [model["A"]],
+        [model["C"][f0:f1]],
+        [model["A_bg"]],
+        [model["C_bg"][f0:f1]],
+        [model["shifts"][f0:f1]],
+        noise_key=model["noise_key"],
+        origin=(f0, 0, 0),
+        **_WORKER["compute_kwargs"],
+    )
+    arr[f0:f1] = Y[:, pad : pad + hh, pad : pad + ww]
+    return iblk, f1 - f0
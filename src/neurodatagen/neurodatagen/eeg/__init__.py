@@ -1,2 +1,5 @@
 from .gen_eeg import *
 from .gen_eeg_mne import *
+from .artifacts import *
+from .stream_eeg import *
+from .virtual_eeg import *
@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+from typing import Optional, Sequence, Tuple
+import numpy as np
+from scipy.signal import butter, sosfiltfilt
+
+from ..rng import SeedLike, default_rng
+
+
+def add_bursts(
+    data: np.ndarray,
+    onsets: np.ndarray,
+    bursts: np.ndarray,
+    channels: np.ndarray,
+) -> np.ndarray:
+    """
+    Add a batch of transient bursts to multichannel data, in place.
+
+    All bursts are scattered into the data with a single vectorized add over their
+    (channel, time) indices. Overlapping bursts add up, and the parts of bursts that
+    fall outside the data are dropped, so that bursts drawn for a larger recording can
+    be added to a window of it by offsetting their onsets and channels.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The (n_channels, n_samples) data to add the bursts to.
+    onsets : np.ndarray
+        Sample index of the start of each burst, of shape (n_bursts,). May be negative.
+    bursts : np.ndarray
+        Waveform of each burst, of shape (n_bursts, burst_len), or of shape
+        (n_bursts, n_burst_channels, burst_len) to give each channel of a burst its
+        own waveform.
+    channels : np.ndarray
+        Channels each burst is added to, of shape (n_bursts, n_burst_channels). Channels
+        outside of the data are skipped.
+
+    Returns
+    -------
+    np.ndarray
+        The data, with the bursts added.
+    """
+    n_channels, n_samples = data.shape
+    onsets, channels = np.asarray(onsets), np.asarray(channels)
+    if bursts.ndim == 2:
+        bursts = bursts[:, None, :]
+    times = onsets[:, None, None] + np.arange(bursts.shape[-1])
+    bursts = np.broadcast_to(bursts, channels.shape + bursts.shape[-1:])
+
+    # (channel, time) index of every sample of every burst inside the data, which may be a non-contiguous view
+    chans, times = np.broadcast_arrays(channels[:, :, None], times)
+    inside = (times >= 0) & (times < n_samples) & (chans >= 0) & (chans < n_channels)
+    np.add.at(data, (chans[inside], times[inside]), bursts[inside].astype(data.dtype, copy=False))
+    return data
+
+
+def _random_channels(rng: np.random.Generator, n_bursts: int, n_channels: int, k: int) -> np.ndarray:
+    """Draw `k` distinct channels for each of `n_bursts` bursts."""
+    return np.argsort(rng.random((n_bursts, n_channels)), axis=1)[:, :k]
+
+
+def add_blinks(
+    data: np.ndarray,
+    fs: float,
+    rate: float = 0.5,
+    duration: float = 0.1,
+    amplitude: float = 1000.0,
+    channel_fraction: float = 0.5,
+    seed: SeedLike = None,
+) -> np.ndarray:
+    """
+    Add blink artifacts to multichannel data, in place.
+
+    Blinks occur at random times at an average `rate`, each one a Hanning-tapered
+    burst of Gaussian noise applied to a random subset of the channels.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The (n_channels, n_samples) data to add the blinks to.
+    fs : float
+        Sampling rate of the data in Hz.
+    rate : float, optional
+        Average number of blinks per second. Defaults to 0.5.
+    duration : float, optional
+        Duration of a blink in seconds. Defaults to 0.1.
+    amplitude : float, optional
+        Scaling factor of the blinks. Defaults to 1000.
+    channel_fraction : float, optional
+        Fraction of the channels each blink is applied to. Defaults to 0.5.
+    seed : SeedLike, optional
+        Seed or random number generator.
+
+    Returns
+    -------
+    np.ndarray
+        The data, with the blinks added.
+    """
+    n_channels, n_samples = data.shape
+    bursts = _draw_blinks(
+        default_rng(seed), n_channels, n_samples, fs, rate, duration, amplitude, channel_fraction
+    )
+    return add_bursts(data, *bursts)
+
+
+def _draw_blinks(
+    rng: np.random.Generator,
+    n_channels: int,
+    n_samples: int,
+    fs: float,
+    rate: float,
+    duration: float,
+    amplitude: float,
+    channel_fraction: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Draw the onsets, waveforms and channels of the blinks of `add_blinks`."""
+    n_blinks = min(rng.poisson(n_samples / fs * rate), n_samples)  # Number of blinks
+    onsets = rng.choice(n_samples, n_blinks, replace=False)  # Random times
+
+    # Draw all blinks at once, tapered at onset and offset
+    blink_len = int(fs * duration)
+    bursts = rng.normal(size=(n_blinks, blink_len))
+    bursts *= np.hanning(blink_len) * amplitude
+
+    channels = _random_channels(rng, n_blinks, n_channels, int(n_channels * channel_fraction))
+    return onsets, bursts, channels
+
+
+def add_muscle_artifacts(
+    data: np.ndarray,
+    fs: float,
+    rate: float = 0.1,
+    duration: Sequence[float] = (0.5, 2.0),
+    band: Sequence[float] = (20.0, 100.0),
+    amplitude: float = 20.0,
+    channel_fraction: float = 0.1,
+    seed: SeedLike = None,
+) -> np.ndarray:
+    """
+    Add muscle artifacts to multichannel data, in place.
+
+    Muscle artifacts occur at random times at an average `rate`, each one a burst of
+    band-limited, high frequency noise with a Hanning envelope, independent on each
+    of a random subset of the channels.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The (n_channels, n_samples) data to add the artifacts to.
+    fs : float
+        Sampling rate of the data in Hz.
+    rate : float, optional
+        Average number of artifacts per second. Defaults to 0.1.
+    duration : sequence of float, optional
+        Range of the duration of an artifact in seconds. Defaults to (0.5, 2.0).
+    band : sequence of float, optional
+        Frequency band of the artifacts in Hz, capped below the Nyquist frequency.
+        Defaults to (20, 100).
+    amplitude : float, optional
+        Standard deviation of the artifacts. Defaults to 20.
+    channel_fraction : float, optional
+        Fraction of the channels each artifact is applied to. Defaults to 0.1.
+    seed : SeedLike, optional
+        Seed or random number generator.
+
+    Returns
+    -------
+    np.ndarray
+        The data, with the artifacts added.
+
+    Raises
+    ------
+    ValueError
+        if the band is empty once capped below the Nyquist frequency.
+    """
+    n_channels, n_samples = data.shape
+    bursts = _draw_muscle_artifacts(
+        default_rng(seed), n_channels, n_samples, fs, rate, duration, band, amplitude, channel_fraction
+    )
+    return add_bursts(data, *bursts)
+
+
+def _draw_muscle_artifacts(
+    rng: np.random.Generator,
+    n_channels: int,
+    n_samples: int,
+    fs: float,
+    rate: float,
+    duration: Sequence[float],
+    band: Sequence[float],
+    amplitude: float,
+    channel_fraction: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Draw the onsets, waveforms and channels of the artifacts of `add_muscle_artifacts`."""
+    low, high = band[0], min(band[1], 0.45 * fs)
+    if not 0 < low < high:
+        raise ValueError(
+            f"Muscle artifact band {tuple(band)} Hz is empty below the Nyquist frequency at fs={fs} Hz, "
+            f"its low edge must be between 0 and {0.45 * fs:g} Hz"
+        )
+    n_bursts = rng.poisson(n_samples / fs * rate)
+    k = max(1, int(n_channels * channel_fraction))
+    onsets = rng.integers(0, n_samples, n_bursts)
+    channels = _random_channels(rng, n_bursts, n_channels, k)
+    burst_len = int(fs * duration[1])
+    if n_bursts == 0:
+        return onsets, np.zeros((0, k, burst_len)), channels
+
+    # Draw and band-pass filter the noise of all bursts and channels at once, at the longest duration
+    sos = butter(4, [low, high], btype="bandpass", fs=fs, output="sos")
+    bursts = sosfiltfilt(sos, rng.normal(size=(n_bursts, k, burst_len)), axis=-1)
+    bursts *= amplitude / max(bursts.std(), np.finfo(float).tiny)
+
+    # Taper each burst to its own duration
+    lens = (fs * rng.uniform(*duration, n_bursts)).astype(int)
+    t = np.arange(burst_len)
+    envelope = np.sin(np.pi * t / np.maximum(lens[:, None], 1)) ** 2 * (t < lens[:, None])
+    bursts *= envelope[:, None, :]
+
+    return onsets, bursts, channels
+
+
+def add_line_noise(
+    data: np.ndarray,
+    fs: float,
+    freq: float = 60.0,
+    amplitude: float = 5.0,
+    n_harmonics: int = 3,
+    seed: SeedLike = None,
+    max_block_size: int = 2**22,
+    start: int = 0,
+    channels: Optional[Sequence[int]] = None,
+) -> np.ndarray:
+    """
+    Add power line noise to multichannel data, in place.
+
+    The noise is a sinusoid at `freq` and its harmonics, with a random amplitude and
+    phase on each channel, added a block of samples at a time. The amplitudes and
+    phases of a channel only depend on the seed and on its index.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The (n_channels, n_samples) data to add the noise to.
+    fs : float
+        Sampling rate of the data in Hz.
+    freq : float, optional
+        Line frequency in Hz, usually 50 or 60. Defaults to 60.
+    amplitude : float, optional
+        Average amplitude of the fundamental. The amplitude of each harmonic is
+        divided by its order. Defaults to 5.
+    n_harmonics : int, optional
+        Number of harmonics, including the fundamental, below the Nyquist frequency.
+        Defaults to 3.
+    seed : SeedLike, optional
+        Seed or random number generator.
+    max_block_size : int, optional
+        Maximum number of values generated at once, to bound memory. Defaults to 2**22.
+    start : int, optional
+        Sample index of the first sample of `data` within the recording, to add the
+        noise to consecutive blocks of a recording with the same seed. Defaults to 0.
+    channels : sequence of int, optional
+        Index of each row of `data` within the recording, to add the noise to a subset
+        of its channels. Defaults to all channels.
+
+    Returns
+    -------
+    np.ndarray
+        The data, with the line noise added.
+    """
+    rng = default_rng(seed)
+    n_channels, n_samples = data.shape
+    channels = np.arange(n_channels) if channels is None else np.asarray(channels, dtype=int)
+    if n_channels == 0:
+        return data
+    orders = np.arange(1, n_harmonics + 1)
+    orders = orders[orders * freq < fs / 2]
+
+    # Draw the amplitudes and phases channel by channel, so that those of a channel do not depend on the others
+    draws = rng.random((channels.max() + 1, 2, len(orders)))[channels]
+    amps = (amplitude * (0.5 + draws[:, 0]) / orders).T[:, :, None]
+    phases = (2 * np.pi * draws[:, 1]).T[:, :, None]
+
+    block = max(1, max_block_size // n_channels)
+    for t0 in range(0, n_samples, block):
+        t = np.arange(start + t0, start + min(t0 + block, n_samples)) / fs
+        for order, amp, phase in zip(orders, amps, phases):
+            data[:, t0 : t0 + len(t)] += amp * np.sin(2 * np.pi * freq * order * t + phase)
+    return data
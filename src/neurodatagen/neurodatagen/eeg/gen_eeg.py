@@ -1,7 +1,13 @@
 from __future__ import annotations
 
+from typing import Optional, Sequence, Tuple, Union
 import numpy as np
-from neurodsp.sim import sim_powerlaw
+from scipy import fft as sp_fft
+from scipy.signal import firwin
+
+from ..adc import quantize
+from ..rng import SeedLike, default_rng, seed_sequence, child_rng
+from . import artifacts
 
 
 def generate_eeg_powerlaw(
@@ -15,6 +21,13 @@ def generate_eeg_powerlaw(
     add_blink_artifacts: bool = True,
     correlated_noise_scale: float = 0.1,
     blink_scale: float = 0.05,
+    seed: SeedLike = None,
+    dtype=np.float64,
+    correlated_noise_cov: Optional[Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]] = None,
+    add_muscle_artifacts: bool = False,
+    line_noise_freq: Optional[float] = None,
+    adc_gain: Optional[float] = None,
+    adc_offset: float = 0.0,
 ) -> tuple[np.ndarray, np.ndarray, list]:
     """
     Generate synthetic EEG data as a power-law time series, with a specified exponent.
@@ -41,12 +54,42 @@ def generate_eeg_powerlaw(
         Scale factor for the correlated noise. Defaults to 0.2.
     blink_scale (float, optional):
         Scale factor for the blink artifacts. Defaults to 0.05.
+    seed (SeedLike, optional):
+        Seed or random number generator. Each channel is generated from its own
+        stream of the seed, so channels can be generated independently.
+    dtype (optional):
+        Floating point data type of the generated data, e.g. np.float32 to halve
+        its memory. Defaults to np.float64.
+    correlated_noise_cov (optional):
+        Covariance of the correlated noise across channels. Either a tuple
+        `(loadings, diag)` of a (n_channels, rank) array and a (n_channels,)
+        array, for the low-rank plus diagonal covariance
+        `loadings @ loadings.T + np.diag(diag)`, or a dense (n_channels,
+        n_channels) covariance matrix. Defaults to `np.eye(n_channels) + 0.5`,
+        i.e. independent noise plus a component shared by all channels.
+    add_muscle_artifacts (bool, optional):
+        Whether to add muscle artifacts, bursts of high frequency noise on a
+        few channels, to the generated data, in the 20 to 100 Hz band. Requires a
+        sampling rate above 45 Hz. Defaults to False.
+    line_noise_freq (float, optional):
+        Frequency of the power line noise to add to the generated data, usually
+        50 or 60 Hz. Defaults to None, for no line noise.
+    adc_gain (float, optional):
+        If given, the data is quantized to int16 samples with this gain in
+        microvolts per bit, see `neurodatagen.adc.quantize`, so that the data
+        in microvolts is `data * adc_gain + adc_offset`. Defaults to None, for
+        data in microvolts.
+    adc_offset (float, optional):
+        Offset of the quantized data in microvolts. Defaults to 0.
 
     Returns
     -------
     data (np.ndarray):
         Synthetic EEG data as a NumPy array of shape 
-        (n_channels, total_samples).
+        (n_channels, total_samples), of int16 samples if `adc_gain` is given.
+        The samples do not carry the gain and offset: keep them to convert the
+        samples back to microvolts with `neurodatagen.adc.dequantize`, or to
+        store them alongside as the attributes of `neurodatagen.adc.adc_attrs`.
     time (np.ndarray):
         Time array as a NumPy array of shape (total_samples,).
     ch_names (list):
@@ -55,34 +98,50 @@ def generate_eeg_powerlaw(
     """
 
     total_samples = int(n_seconds * fs)
+    ss = seed_sequence(seed)
 
-    # Generate high-passed power law noise for each channel
-    scaled_noise = np.empty((n_channels, total_samples))
-    for ch in range(n_channels):
-        pl_noise = sim_powerlaw(
-            n_seconds, fs, exponent=exponent, f_range=(highpass, None)
-        )
-        scaled_noise[ch] = pl_noise * amplitude
+    # Generate high-passed power law noise for all channels at once
+    scaled_noise = _sim_powerlaw(
+        n_seconds,
+        fs,
+        exponent=exponent,
+        highpass=highpass,
+        seeds=[child_rng(ss, 0, ch) for ch in range(n_channels)],
+        dtype=dtype,
+    )
+    scaled_noise *= amplitude
 
-    # Add channel correlations
-    cov_matrix = np.eye(n_channels) + 0.5  # Identity matrix with some weighted correlation
-    correlated_noise = np.random.multivariate_normal(np.zeros(n_channels), cov_matrix, size=total_samples).T
-    correlated_noise *= amplitude / correlated_noise_scale  # Scale the correlated noise
-    scaled_noise += correlated_noise
+    # Add channel correlations, by default identity with some weighted correlation, i.e. a shared component
+    if correlated_noise_cov is None:
+        correlated_noise_cov = (np.full((n_channels, 1), np.sqrt(0.5)), np.ones(n_channels))
+    _add_correlated_noise(
+        scaled_noise,
+        correlated_noise_cov,
+        scale=amplitude / correlated_noise_scale,  # Scale the correlated noise
+        seed=child_rng(ss, 1),
+    )
 
-    # Add blink artifacts
+    # Add blink artifacts, on average 1 blink every 2 seconds lasting 100 ms, each on a random half of the channels
     if add_blink_artifacts:
-        blink_rate = 1 / 2  # Average rate of 1 blink every 2 seconds
-        n_blinks = np.random.poisson(n_seconds * blink_rate)  # Number of blinks
-        blink_times = np.random.choice(total_samples, n_blinks, replace=False)  # Random times
-        for i in blink_times:
-            blink_samples = np.random.normal(size=fs//10)  # Blink lasts 100 ms
-            blink_samples *= np.hanning(len(blink_samples))  # Taper blink onset/offset
-            blink_samples *= amplitude / blink_scale  # scaled by amplitude
-            # pick a random half of the channels
-            n_channels_to_blink = np.random.choice(n_channels, int(n_channels/2), replace=False)
-            
-            scaled_noise[n_channels_to_blink, i:i + len(blink_samples)] += blink_samples # apply to a quarter of the channels
+        artifacts.add_blinks(
+            scaled_noise,
+            fs,
+            rate=1 / 2,
+            duration=0.1,
+            amplitude=amplitude / blink_scale,  # scaled by amplitude
+            channel_fraction=0.5,
+            seed=child_rng(ss, 2),
+        )
+
+    # Add other artifacts
+    if add_muscle_artifacts:
+        artifacts.add_muscle_artifacts(scaled_noise, fs, amplitude=amplitude, seed=child_rng(ss, 3))
+    if line_noise_freq:
+        artifacts.add_line_noise(scaled_noise, fs, freq=line_noise_freq, amplitude=amplitude, seed=child_rng(ss, 4))
+
+    # Quantize to the samples of an ADC
+    if adc_gain is not None:
+        scaled_noise = quantize(scaled_noise, adc_gain, adc_offset)
 
     time = np.arange(total_samples) / fs
     # Check dimensions of the generated data
@@ -93,6 +152,178 @@ def generate_eeg_powerlaw(
     return scaled_noise, time, ch_names
 
 
+def _add_correlated_noise(
+    data: np.ndarray,
+    cov: Union[np.ndarray, Tuple[np.ndarray, np.ndarray]],
+    scale: float = 1.0,
+    seed: SeedLike = None,
+    max_block_size: int = 2**22,
+    channels: Optional[Sequence[int]] = None,
+) -> None:
+    """
+    Add zero-mean Gaussian noise that is correlated across channels to `data`, in place.
+
+    The covariance is taken as low-rank plus diagonal, `loadings @ loadings.T +
+    np.diag(diag)`, so that the noise is the sum of `rank` shared components, mixed
+    into the channels by the loadings, and of independent noise per channel. The
+    noise is generated and added a block of samples at a time, which takes
+    O(n_samples * n_channels * rank) time and no copy of the data. A dense covariance
+    is factored with its Cholesky decomposition, i.e. as full rank loadings.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The (n_channels, n_samples) data to add the noise to.
+    cov : np.ndarray or tuple of np.ndarray
+        The covariance, either as a tuple `(loadings, diag)` or as a dense matrix.
+    scale : float, optional
+        Scaling factor of the noise. Defaults to 1.
+    seed : SeedLike, optional
+        Seed or random number generator. The shared components and the independent
+        noise of each channel are drawn from their own streams of the seed.
+    max_block_size : int, optional
+        Maximum number of values generated at once, to bound memory. Defaults to 2**22.
+    channels : sequence of int, optional
+        Index of each row of `data` within the covariance, to add the noise to a subset
+        of the channels. The noise of a channel is the same as when it is added to all
+        channels. Defaults to all channels.
+    """
+    n_channels, n_samples = data.shape
+    if isinstance(cov, tuple):
+        loadings, diag = (np.asarray(c, dtype=float) for c in cov)
+    else:
+        cov = np.asarray(cov, dtype=float)
+        loadings, diag = np.linalg.cholesky(cov), np.zeros(len(cov))
+    channels = np.arange(n_channels) if channels is None else np.asarray(channels, dtype=int)
+    loadings, std = loadings.reshape(len(diag), -1)[channels] * scale, np.sqrt(diag)[channels] * scale
+
+    ss = seed_sequence(seed)
+    shared_rng = child_rng(ss, 0)
+    channel_rngs = [child_rng(ss, 1, ch) if s > 0 else None for ch, s in zip(channels, std)]
+
+    block = max(1, max_block_size // max(n_channels, loadings.shape[1]))
+    for t0 in range(0, n_samples, block):
+        t1 = min(t0 + block, n_samples)
+
+        # Shared components, drawn sample-major so that the draws do not depend on the block size
+        if loadings.shape[1]:
+            data[:, t0:t1] += loadings @ shared_rng.standard_normal((t1 - t0, loadings.shape[1])).T
+
+        # Independent noise of each channel
+        for row, rng in enumerate(channel_rngs):
+            if rng is not None:
+                data[row, t0:t1] += std[row] * rng.standard_normal(t1 - t0)
+
+
+def _highpass_length(fs: float, highpass: float) -> int:
+    """Length of the FIR highpass filter of neurodsp, 3 cycles at the cutoff frequency rounded up to odd."""
+    filt_len = int(np.ceil(fs * 3 / highpass))
+    return filt_len + 1 - filt_len % 2
+
+
+def _powerlaw_response(
+    n: int, fs: float, exponent: float, highpass: Optional[float] = None
+) -> np.ndarray:
+    """
+    Frequency response, over the real FFT of `n` samples, that shapes white noise into
+    power law noise of the given exponent, leaving the DC component untouched, and
+    applies the optional FIR highpass of neurodsp, with its kernel centered on the first
+    sample as for a 'same' convolution.
+    """
+    freqs = sp_fft.rfftfreq(n, 1.0 / fs)
+    response = np.ones(len(freqs), dtype=complex)
+    response[1:] = freqs[1:] ** (exponent / 2)
+    if highpass:
+        filt_len = _highpass_length(fs, highpass)
+        kernel = np.zeros(n)
+        kernel[:filt_len] = firwin(filt_len, highpass, pass_zero=False, fs=fs)
+        response *= sp_fft.rfft(np.roll(kernel, -(filt_len // 2)))
+    return response
+
+
+def _sim_powerlaw(
+    n_seconds: float,
+    fs: float,
+    exponent: float = -2.0,
+    highpass: Optional[float] = None,
+    seeds: Sequence[SeedLike] = (None,),
+    dtype=np.float64,
+    max_batch_size: int = 2**24,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Simulate power law time series by spectrally rotating white noise, as
+    `neurodsp.sim.sim_powerlaw` does, for a batch of channels at once.
+
+    The white noise of each channel is drawn from its own seed, rather than from the
+    global random state. The 1/f^exponent shaping and the optional highpass, the FIR
+    filter of 3 cycles at the cutoff frequency used by neurodsp, are applied in a
+    single real FFT round-trip over a (channel, sample) batch. Extra samples are
+    simulated and discarded so that, as with neurodsp, the circular filtering does not
+    reach the returned samples. The number of simulated samples is rounded up to a
+    length with a fast FFT. Each channel is normalized to zero mean and unit
+    variance.
+
+    Parameters
+    ----------
+    n_seconds : float
+        Duration of the time series in seconds.
+    fs : float
+        Sampling rate in Hz.
+    exponent : float, optional
+        Power law exponent. Defaults to -2.
+    highpass : float, optional
+        Cutoff frequency of the highpass filter in Hz. No filter is applied by default.
+    seeds : sequence of SeedLike, optional
+        Seed or random number generator of each channel. Defaults to a single channel
+        with fresh entropy.
+    dtype : optional
+        Floating point data type of the computation and of the output. Defaults to
+        np.float64.
+    max_batch_size : int, optional
+        Maximum number of samples transformed at once, to bound memory. Defaults to 2**24.
+    out : np.ndarray, optional
+        Array of shape (n_channels, n_samples) to write the time series to, e.g. a
+        region of a shared or memory mapped array. Defaults to a new array.
+
+    Returns
+    -------
+    np.ndarray
+        The time series, of shape (n_channels, n_samples).
+    """
+    n_samples = int(np.ceil(n_seconds * fs))
+    n_sim, n_rmv = n_samples, 0
+    if highpass:
+        filt_len = _highpass_length(fs, highpass)
+        n_sim += filt_len + 1
+        n_rmv = int(np.ceil(filt_len / 2))
+
+    # Simulate a few more samples if needed, for a length with small prime factors that transforms fast
+    n_sim = sp_fft.next_fast_len(n_sim, real=True)
+    response = _powerlaw_response(n_sim, fs, exponent, highpass).astype(
+        np.result_type(dtype, np.complex64)
+    )
+
+    sigs = np.empty((len(seeds), n_samples), dtype=dtype) if out is None else out
+    batch = np.empty((max(1, min(len(seeds), max_batch_size // n_sim)), n_sim), dtype=dtype)
+    for c0 in range(0, len(seeds), len(batch)):
+        buf = batch[: len(seeds) - c0]
+        for row, seed in zip(buf, seeds[c0 : c0 + len(buf)]):
+            row[:] = default_rng(seed).standard_normal(n_sim)
+
+        # Shape the spectrum of all channels of the batch, and drop the edges
+        spectrum = sp_fft.rfft(buf, axis=1)
+        spectrum *= response
+        sig = sp_fft.irfft(spectrum, n=n_sim, axis=1)[:, n_rmv : n_rmv + n_samples]
+        del spectrum
+
+        sig -= sig.mean(axis=1, keepdims=True)
+        sig /= sig.std(axis=1, keepdims=True)
+        sigs[c0 : c0 + len(buf)] = sig
+
+    return sigs
+
+
 def create_channel_names(n_channels: int, prefix: str = "EEG") -> list[str]:
     """Given the number of channels, return a list of strings like '<prefix> 1'"""
     return [f"{prefix} {i+1}" for i in range(n_channels)]
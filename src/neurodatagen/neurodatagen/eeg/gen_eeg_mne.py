@@ -1,22 +1,46 @@
 from __future__ import annotations
 
+from typing import Optional
 import numpy as np
 import mne
 
+from ..rng import SeedLike, default_rng
+
 
 def generate_eeg_sine_mne(
-    duration: float = 10, n_channels: int = 100, fs: float = 1000
+    duration: float = 10,
+    n_channels: int = 100,
+    fs: float = 1000,
+    seed: SeedLike = None,
+    dtype=np.float64,
+    memmap: Optional[str] = None,
+    max_block_size: int = 2**22,
 ) -> mne.io.RawArray:
     """
     Simulate EEG data using noisy sine waves and output to MNE RawArray.
     For now, hard-code the noise amplitude scaling and eeg data scaling.
 
+    The data is generated in place, a block of channels at a time, into the buffer
+    that the RawArray then uses as is, so that peak memory is about one copy of the
+    data. With the default float64 the output is the same as generating all channels
+    at once.
+
     Parameters
     ----------
     duration (float, optional): Duration of the simulated data in seconds.
         Defaults to 10.
     n_channels (int, optional): Number of EEG channels. Defaults to 100.
     fs (float, optional): Sampling frequency in Hz. Defaults to 1000.
+    seed (SeedLike, optional): Seed or random number generator.
+    dtype (optional): Floating point data type the noise is generated in, e.g.
+        np.float32 for faster generation. The phase of the sines is always computed
+        in float64, so that it stays accurate over long durations. MNE stores the
+        data in float64 regardless. Defaults to np.float64.
+    memmap (str, optional): Path of a file to back the data with a memory map
+        instead of memory, for very long durations. The file is overwritten and
+        must outlive the RawArray. Defaults to None.
+    max_block_size (int, optional): Maximum number of values generated at once,
+        to bound the memory of temporaries. Defaults to 2**22.
 
     Returns
     -------
@@ -26,28 +50,42 @@ def generate_eeg_sine_mne(
     # Calculate the number of samples based on duration and sampling frequency
     n_samples = int(duration * fs)
 
-    # Create a time vector for the EEG data
+    # Create a time vector for the EEG data, in float64 to keep the phase of long recordings accurate
     times = np.arange(n_samples) / fs
 
-    # Generate synthetic EEG data using sine waves
-    data = np.zeros((n_channels, n_samples))
-    for ch in range(n_channels):
-        # Generate a random frequency for each channel
-        freq = np.random.uniform(4, 30)
-        # Generate a sine wave for the channel
-        sine_wave = np.sin(2 * np.pi * freq * times)
-        # Add the sine wave to the channel's data
-        data[ch] = sine_wave
-
-    # Add noise to the data to make it slightly more realistic
+    rng = default_rng(seed)
+
+    # Generate a random frequency for each channel
+    freqs = rng.uniform(4, 30, n_channels)
+
+    # Allocate the float64 buffer that MNE will use, so that it does not copy it
+    if memmap is None:
+        data = np.empty((n_channels, n_samples))
+    else:
+        data = np.memmap(memmap, dtype=np.float64, mode="w+", shape=(n_channels, n_samples))
+
+    # Generate a block of channels at a time, drawing the noise in the same order as for all channels at once
     noise_amplitude = 0.2  # Adjust this parameter to control the noise level
-    noise = np.random.normal(scale=noise_amplitude, size=(n_channels, n_samples))
-    data += noise
+    block = max(1, max_block_size // max(n_samples, 1))
+    buf = np.empty((min(block, n_channels), n_samples), dtype=dtype)
+    phase = np.empty(buf.shape)
+    for c0 in range(0, n_channels, block):
+        c1 = min(c0 + block, n_channels)
+        out = buf[: c1 - c0]
+
+        # Add noise to a sine wave per channel to make it slightly more realistic
+        rng.standard_normal(out=out, dtype=dtype)
+        out *= dtype(noise_amplitude)
+        # The phase is wrapped to a cycle in float64 before the sine, only its output is in `dtype`
+        ph = np.multiply(freqs[c0:c1, None], times, out=phase[: c1 - c0])
+        np.mod(ph, 1.0, out=ph)
+        ph *= 2 * np.pi
+        out += np.sin(ph, out=ph)
 
-    # There is some correction in mne happening for 'eeg' 'ch_type' data 
-    # that scales it up.. I think the data is going from Volts to microvolts 
-    # when returned with raw.get_data()... so Scale the data down to Volts first
-    data = data * 1e-5
+        # There is some correction in mne happening for 'eeg' 'ch_type' data
+        # that scales it up.. I think the data is going from Volts to microvolts
+        # when returned with raw.get_data()... so Scale the data down to Volts first
+        np.multiply(out, 1e-5, out=data[c0:c1])
 
     # Create a channel names list
     ch_names = [f"EEG {i+1}" for i in range(n_channels)]
@@ -55,7 +93,7 @@ def generate_eeg_sine_mne(
     # Create an info object
     info = mne.create_info(ch_names=ch_names, sfreq=fs, ch_types="eeg")
 
-    # Create a `mne.io.RawArray` object
-    raw = mne.io.RawArray(data, info)
+    # Create a `mne.io.RawArray` object on the buffer, without copying it
+    raw = mne.io.RawArray(data, info, copy=None)
 
     return raw
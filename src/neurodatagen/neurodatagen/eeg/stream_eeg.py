@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+from typing import Iterator, Optional, Tuple, Union
+import time
+import numpy as np
+from scipy import fft as sp_fft
+from scipy.signal import oaconvolve
+
+from ..adc import adc_attrs, quantize
+from ..rng import SeedLike, seed_sequence, child_rng
+from . import artifacts
+from .gen_eeg import _add_correlated_noise, _powerlaw_response, create_channel_names
+
+
+def stream_eeg_powerlaw(
+    n_channels: int,
+    n_seconds: Optional[float],
+    fs: int,
+    block_seconds: float = 10.0,
+    highpass: Optional[float] = 2.0,
+    exponent: float = -1,
+    amplitude: float = 50.0,
+    add_blink_artifacts: bool = True,
+    correlated_noise_scale: float = 0.1,
+    blink_scale: float = 0.05,
+    seed: SeedLike = None,
+    dtype=np.float64,
+    correlated_noise_cov: Optional[Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]] = None,
+    add_muscle_artifacts: bool = False,
+    line_noise_freq: Optional[float] = None,
+    adc_gain: Optional[float] = None,
+    adc_offset: float = 0.0,
+) -> Iterator[np.ndarray]:
+    """
+    Generate synthetic EEG data like `generate_eeg_powerlaw`, as a stream of consecutive
+    time blocks, so that recordings of any duration can be produced in constant memory.
+
+    The power law noise of each channel is a continuous stream of white noise filtered
+    with a fixed FIR kernel that combines the 1/f^exponent shaping and the highpass.
+    The filtering is applied block by block with overlap-add, carrying the tail of each
+    block over to the next, so the spectrum is continuous across block boundaries.
+    Artifacts that straddle a boundary are likewise carried over, and line noise keeps
+    its phase. The kernel spans 8 periods of the highpass cutoff, or 16 seconds without
+    highpass, below which the spectrum flattens.
+
+    The data is statistically equivalent to, but not the same as, the output of
+    `generate_eeg_powerlaw` for the same seed. It depends on `block_seconds`, as the
+    noise and artifacts of each block are drawn from their own streams of the seed,
+    and is equal to that of `virtual_eeg_powerlaw` with the same parameters up to
+    floating-point rounding (~1e-12 microvolts at the default amplitude).
+
+    Parameters
+    ----------
+    n_channels : int
+        Number of EEG channels.
+    n_seconds : float, optional
+        Duration of the EEG data in seconds. If None, blocks are generated indefinitely.
+    fs : int
+        Sampling rate of the EEG data in Hz.
+    block_seconds : float, optional
+        Duration of each block in seconds, the last one may be shorter. Defaults to 10.
+    highpass, exponent, amplitude, add_blink_artifacts, correlated_noise_scale,
+    blink_scale, dtype, correlated_noise_cov, add_muscle_artifacts, line_noise_freq,
+    adc_gain, adc_offset :
+        As in `generate_eeg_powerlaw`. With `adc_gain`, blocks are of int16 samples
+        and `dtype` is the precision they are computed in.
+    seed : SeedLike, optional
+        Seed or random number generator.
+
+    Yields
+    ------
+    np.ndarray
+        The next block of data, of shape (n_channels, block_samples).
+    """
+    ss = seed_sequence(seed)
+    block_len = max(1, int(block_seconds * fs))
+    total_samples = None if n_seconds is None else int(n_seconds * fs)
+
+    kernel = _powerlaw_kernel(fs, exponent, highpass).astype(dtype)
+    tail = np.zeros((n_channels, len(kernel) - 1), dtype=dtype)
+
+    # Filter a few blocks of white noise before the start, so that the first samples have a full history
+    n_pre = _preroll_blocks(len(kernel), block_len)
+    for iblk in range(n_pre):
+        conv = oaconvolve(_white_noise(ss, iblk, range(n_channels), block_len, dtype), kernel[None], axes=1)
+        conv[:, : tail.shape[1]] += tail
+        tail = conv[:, block_len:].copy()
+
+    if correlated_noise_cov is None:
+        correlated_noise_cov = (np.full((n_channels, 1), np.sqrt(0.5)), np.ones(n_channels))
+
+    # Artifacts are drawn for each block and may spill over into the next one
+    spill_len = int(fs * 0.1) * add_blink_artifacts + int(fs * 2.0) * add_muscle_artifacts
+    spill = np.zeros((n_channels, spill_len), dtype=dtype)
+
+    start, iblk = 0, 0
+    while total_samples is None or start < total_samples:
+        n = block_len if total_samples is None else min(block_len, total_samples - start)
+
+        # Power law noise, filtering the white noise of the block with overlap-add
+        white = _white_noise(ss, iblk + n_pre, range(n_channels), n, dtype)
+        conv = oaconvolve(white, kernel[None], mode="full", axes=1)
+        del white
+        conv[:, : tail.shape[1]] += tail
+        block, tail = conv[:, :n], conv[:, n:].copy()
+        block *= amplitude
+
+        # Add channel correlations
+        _add_correlated_noise(
+            block,
+            correlated_noise_cov,
+            scale=amplitude / correlated_noise_scale,
+            seed=child_rng(ss, 1, iblk),
+        )
+
+        # Add the artifacts of the block, and those spilling over from the previous one
+        if spill_len:
+            ext = np.zeros((n_channels, n + spill_len), dtype=dtype)
+            ext[:, :spill_len] = spill
+            for bursts in _draw_bursts(
+                ss, iblk, n_channels, n, fs, amplitude, blink_scale, add_blink_artifacts, add_muscle_artifacts
+            ):
+                artifacts.add_bursts(ext, *bursts)
+            block += ext[:, :n]
+            spill = ext[:, n:].copy()
+            del ext
+        if line_noise_freq:
+            artifacts.add_line_noise(
+                block, fs, freq=line_noise_freq, amplitude=amplitude, seed=child_rng(ss, 4), start=start
+            )
+
+        yield np.ascontiguousarray(block) if adc_gain is None else quantize(block, adc_gain, adc_offset)
+        start += n
+        iblk += 1
+
+
+def write_eeg_zarr(
+    store: str,
+    n_channels: int,
+    n_seconds: float,
+    fs: int,
+    block_seconds: float = 10.0,
+    channel_prefix: str = "EEG",
+    arr_name: str = "eeg",
+    verbose: bool = True,
+    **kwargs,
+) -> float:
+    """
+    Generates synthetic EEG data with `stream_eeg_powerlaw` and writes it to a zarr store
+    one block at a time, so that memory use does not depend on the duration.
+
+    The store can be opened with `xarray.open_zarr`, as a (channel, time) data array
+    with channel names and times as coordinates, and the sampling rate as the `sfreq`
+    attribute. Data quantized with `adc_gain` is stored as int16 samples, with the
+    gain and offset as the `scale_factor` and `add_offset` attributes, which xarray
+    applies lazily unless opened with `mask_and_scale=False`.
+
+    Parameters
+    ----------
+    store : str
+        Path of the zarr store to write to. It is overwritten if it exists.
+    n_channels : int
+        Number of EEG channels.
+    n_seconds : float
+        Duration of the EEG data in seconds.
+    fs : int
+        Sampling rate of the EEG data in Hz.
+    block_seconds : float, optional
+        Duration of each block in seconds, which is also the chunk size along time in
+        the zarr store. Defaults to 10.
+    channel_prefix : str, optional
+        Prefix for the channel names. Defaults to 'EEG'.
+    arr_name : str, optional
+        Name of the data array. Defaults to 'eeg'.
+    verbose : bool, optional
+        Whether to report progress and throughput. Defaults to True.
+    **kwargs
+        Further parameters of `stream_eeg_powerlaw`.
+
+    Returns
+    -------
+    float
+        Throughput of the run, in seconds of data per second.
+    """
+    import zarr  # import here to avoid dependency for all workflows
+
+    total_samples, block_len = int(n_seconds * fs), max(1, int(block_seconds * fs))
+    dtype = kwargs.get("dtype", np.float64) if kwargs.get("adc_gain") is None else np.int16
+
+    # Write the arrays with the dimension names that xarray expects, the data and times are filled in by block
+    group = zarr.open_group(store, mode="w")
+    data = group.create_dataset(
+        arr_name,
+        shape=(n_channels, total_samples),
+        chunks=(n_channels, block_len),
+        dtype=dtype,
+        fill_value=None,
+    )
+    data.attrs.update(_ARRAY_DIMENSIONS=["channel", "time"], units="uV", sfreq=fs)
+    if kwargs.get("adc_gain") is not None:
+        data.attrs.update(adc_attrs(kwargs["adc_gain"], kwargs.get("adc_offset", 0.0)))
+    times = group.create_dataset(
+        "time", shape=(total_samples,), chunks=(block_len,), dtype=np.float64, fill_value=None
+    )
+    times.attrs.update(_ARRAY_DIMENSIONS=["time"], units="s")
+    channels = group.array("channel", np.array(create_channel_names(n_channels, channel_prefix)))
+    channels.attrs.update(_ARRAY_DIMENSIONS=["channel"])
+
+    start_time, t0 = time.perf_counter(), 0
+    for block in stream_eeg_powerlaw(n_channels, n_seconds, fs, block_seconds=block_seconds, **kwargs):
+        t1 = t0 + block.shape[1]
+        data[:, t0:t1] = block
+        times[t0:t1] = np.arange(t0, t1) / fs
+        t0 = t1
+        if verbose:
+            rate = t0 / fs / (time.perf_counter() - start_time)
+            print(f"Wrote {t0 / fs:.0f}/{n_seconds:.0f} s ({rate:.0f}x real time)", end="\r")
+
+    zarr.consolidate_metadata(store)
+    rate = n_seconds / max(time.perf_counter() - start_time, 1e-9)
+    if verbose:
+        print(f"\nWrote {n_seconds:.0f} s of {n_channels} channels to {store} ({rate:.0f}x real time)")
+    return rate
+
+
+def _powerlaw_kernel(fs: float, exponent: float, highpass: Optional[float]) -> np.ndarray:
+    """
+    FIR kernel, normalized to unit gain for white noise, that turns white noise into
+    power law noise with the highpass of `generate_eeg_powerlaw`.
+    """
+    n = sp_fft.next_fast_len(int(np.ceil(8 * fs / (highpass or 0.5))), real=True)
+    response = _powerlaw_response(n, fs, exponent, highpass)
+    response[0] = 0  # Zero mean
+
+    # The response is zero-phase, center its impulse response and taper its ends
+    kernel = np.roll(sp_fft.irfft(response, n), n // 2) * np.hanning(n)
+    return kernel / np.sqrt(np.sum(kernel**2))
+
+
+def _preroll_blocks(kernel_len: int, block_len: int) -> int:
+    """Number of blocks of white noise before the start that the power law kernel reaches."""
+    return -(-(kernel_len - 1) // block_len)
+
+
+def _white_noise(
+    ss: np.random.SeedSequence, iblk: int, channels, n: int, dtype, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    White noise of a block of samples, drawn from a stream of its own for each channel,
+    in the given floating point precision. Blocks are counted from the first pre-roll
+    block, see `_preroll_blocks`.
+    """
+    white = np.empty((len(channels), n), dtype=dtype) if out is None else out
+    for row, ch in zip(white, channels):
+        child_rng(ss, 0, iblk, ch).standard_normal(out=row, dtype=white.dtype.type)
+    return white
+
+
+def _draw_bursts(
+    ss: np.random.SeedSequence,
+    iblk: int,
+    n_channels: int,
+    n: int,
+    fs: float,
+    amplitude: float,
+    blink_scale: float,
+    add_blink_artifacts: bool,
+    add_muscle_artifacts: bool,
+) -> list:
+    """
+    Blinks and muscle artifacts of a block of samples, as in `generate_eeg_powerlaw`,
+    as a list of batches of bursts for `artifacts.add_bursts`. Bursts start within the
+    block and may extend past its end.
+    """
+    bursts = []
+    if add_blink_artifacts:
+        bursts.append(
+            artifacts._draw_blinks(child_rng(ss, 2, iblk), n_channels, n, fs, 1 / 2, 0.1, amplitude / blink_scale, 0.5)
+        )
+    if add_muscle_artifacts:
+        bursts.append(
+            artifacts._draw_muscle_artifacts(
+                child_rng(ss, 3, iblk), n_channels, n, fs, 0.1, (0.5, 2.0), (20.0, 100.0), amplitude, 0.1
+            )
+        )
+    return bursts
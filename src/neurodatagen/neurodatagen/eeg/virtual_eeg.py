@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+from typing import Optional, Sequence, Tuple, Union
+import numpy as np
+from scipy.signal import oaconvolve
+
+from ..adc import adc_attrs, quantize
+from ..rng import SeedLike, seed_sequence, child_rng
+from . import artifacts
+from .gen_eeg import _add_correlated_noise, create_channel_names
+from .stream_eeg import _draw_bursts, _powerlaw_kernel, _preroll_blocks, _white_noise
+
+
+def virtual_eeg_powerlaw(
+    n_channels: int,
+    n_seconds: float,
+    fs: int,
+    chunk_seconds: float = 10.0,
+    channel_chunk: Optional[int] = None,
+    highpass: Optional[float] = 2.0,
+    exponent: float = -1,
+    amplitude: float = 50.0,
+    channel_prefix: str = "EEG",
+    add_blink_artifacts: bool = True,
+    correlated_noise_scale: float = 0.1,
+    blink_scale: float = 0.05,
+    seed: SeedLike = None,
+    dtype=np.float64,
+    correlated_noise_cov: Optional[Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]] = None,
+    add_muscle_artifacts: bool = False,
+    line_noise_freq: Optional[float] = None,
+    adc_gain: Optional[float] = None,
+    adc_offset: float = 0.0,
+    arr_name: str = "eeg",
+):
+    """
+    Returns a virtual synthetic EEG recording, a lazy dask-backed data array whose
+    chunks are only synthesized when they are computed, so that any window of a
+    recording of any duration can be accessed without generating or storing the rest.
+
+    Each (channel, time) chunk is synthesized from the streams of the seed that belong
+    to its block of samples and channels. The power law filtering and the artifacts of
+    a chunk depend on the few blocks of samples before it, whose noise is drawn again,
+    so that the recording is continuous across chunks. Computing the same chunk twice
+    gives the same data, and the recording is equal to the blocks of
+    `stream_eeg_powerlaw` with `block_seconds=chunk_seconds` up to floating-point
+    rounding (~1e-12 microvolts at the default amplitude), as the stream filters each
+    block with overlap-add rather than the blocks before it at once.
+
+    Parameters
+    ----------
+    n_channels : int
+        Number of EEG channels.
+    n_seconds : float
+        Duration of the EEG data in seconds.
+    fs : int
+        Sampling rate of the EEG data in Hz.
+    chunk_seconds : float, optional
+        Duration of the chunks in seconds. The data depends on it. Defaults to 10.
+    channel_chunk : int, optional
+        Number of channels of the chunks. The data does not depend on it. Defaults to
+        all channels.
+    highpass, exponent, amplitude, channel_prefix, add_blink_artifacts,
+    correlated_noise_scale, blink_scale, dtype, correlated_noise_cov,
+    add_muscle_artifacts, line_noise_freq :
+        As in `generate_eeg_powerlaw`.
+    adc_gain, adc_offset : optional
+        As in `generate_eeg_powerlaw`. Chunks are then of int16 samples, with the gain
+        and offset as the `scale_factor` and `add_offset` attributes, which
+        `xarray.decode_cf` applies lazily, and `dtype` is the precision they are
+        computed in.
+    seed : SeedLike, optional
+        Seed or random number generator. It is drawn from once, when the array is
+        created, so that the array is deterministic even without a seed.
+    arr_name : str, optional
+        Name of the data array. Defaults to 'eeg'.
+
+    Returns
+    -------
+    xr.DataArray
+        The (channel, sample) data array, with channel names, sample indices and times
+        in seconds as coordinates, and the sampling rate as the `sfreq` attribute.
+    """
+    import dask.array as darr  # import here to avoid dependency for all workflows
+
+    ss = seed_sequence(seed)
+    block_len = max(1, int(chunk_seconds * fs))
+    if correlated_noise_cov is None:
+        correlated_noise_cov = (np.full((n_channels, 1), np.sqrt(0.5)), np.ones(n_channels))
+
+    # Longest burst, which may spill over from the chunks before
+    spill_len = max(int(fs * 0.1) * add_blink_artifacts, int(fs * 2.0) * add_muscle_artifacts)
+    out_dtype = dtype if adc_gain is None else np.int16
+    data = darr.map_blocks(
+        _eeg_chunk,
+        chunks=_virtual_chunks(n_channels, int(n_seconds * fs), block_len, channel_chunk),
+        dtype=out_dtype,
+        meta=np.empty((0, 0), dtype=out_dtype),
+        token=arr_name,
+        ss=ss,
+        kernel=_powerlaw_kernel(fs, exponent, highpass).astype(dtype),
+        block_len=block_len,
+        spill_len=spill_len,
+        n_channels=n_channels,
+        fs=fs,
+        amplitude=amplitude,
+        cov=correlated_noise_cov,
+        correlated_noise_scale=correlated_noise_scale,
+        blink_scale=blink_scale,
+        add_blink_artifacts=add_blink_artifacts,
+        add_muscle_artifacts=add_muscle_artifacts,
+        line_noise_freq=line_noise_freq,
+        adc=None if adc_gain is None else (adc_gain, adc_offset),
+    )
+    return _virtual_data_array(
+        data,
+        fs,
+        create_channel_names(n_channels, channel_prefix),
+        arr_name,
+        units="uV",
+        **({} if adc_gain is None else adc_attrs(adc_gain, adc_offset)),
+    )
+
+
+def _virtual_chunks(
+    n_channels: int, n_samples: int, block_len: int, channel_chunk: Optional[int]
+) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    """Chunks of a virtual (channel, sample) array, blocks of `block_len` samples."""
+    channel_chunk = channel_chunk or max(n_channels, 1)
+    ch_chunks = tuple(min(channel_chunk, n_channels - c0) for c0 in range(0, n_channels, channel_chunk))
+    t_chunks = tuple(min(block_len, n_samples - t0) for t0 in range(0, n_samples, block_len))
+    return ch_chunks or (0,), t_chunks or (0,)
+
+
+def _virtual_data_array(data, fs: float, ch_names: Sequence[str], arr_name: str, **attrs):
+    """
+    Wraps a virtual (channel, sample) dask array into a data array. The sample index is
+    a range and the times are lazy, so that the coordinates take no memory either.
+    """
+    import dask.array as darr  # import here to avoid dependency for all workflows
+    import pandas as pd
+    import xarray as xr
+
+    n_samples = data.shape[1]
+    return xr.DataArray(
+        data,
+        dims=["channel", "sample"],
+        coords={
+            "channel": list(ch_names),
+            "sample": pd.RangeIndex(n_samples),
+            "time": ("sample", darr.arange(n_samples, chunks=data.chunks[1]) / fs),
+        },
+        name=arr_name,
+        attrs=dict(attrs, sfreq=fs),
+    )
+
+
+def _powerlaw_chunk(
+    ss: np.random.SeedSequence,
+    kernel: np.ndarray,
+    channels: np.ndarray,
+    iblk: int,
+    block_len: int,
+    n: int,
+    max_block_size: int = 2**22,
+) -> np.ndarray:
+    """
+    Power law noise of a block of samples of a stream of `_white_noise` blocks filtered
+    with `kernel`, from the white noise of the block and of the ones before it that the
+    kernel reaches, including the pre-roll blocks before the start. Channels are
+    filtered a few at a time, to bound the memory of the convolution to about
+    `max_block_size` samples of white noise.
+    """
+    n_hist = _preroll_blocks(len(kernel), block_len)
+    block = np.empty((len(channels), n), dtype=kernel.dtype)
+    white = np.empty((max(1, max_block_size // (n_hist * block_len + n)), n_hist * block_len + n), dtype=kernel.dtype)
+    for r0 in range(0, len(channels), len(white)):
+        chans = channels[r0 : r0 + len(white)]
+        buf = white[: len(chans)]
+        for k in range(n_hist + 1):
+            _white_noise(ss, iblk + k, chans, None, None, out=buf[:, k * block_len : (k + 1) * block_len])
+        block[r0 : r0 + len(chans)] = oaconvolve(buf, kernel[None], mode="full", axes=1)[
+            :, n_hist * block_len : n_hist * block_len + n
+        ]
+    return block
+
+
+def _eeg_chunk(
+    block_info=None,
+    *,
+    ss: np.random.SeedSequence,
+    kernel: np.ndarray,
+    block_len: int,
+    spill_len: int,
+    n_channels: int,
+    fs: float,
+    amplitude: float,
+    cov,
+    correlated_noise_scale: float,
+    blink_scale: float,
+    add_blink_artifacts: bool,
+    add_muscle_artifacts: bool,
+    line_noise_freq: Optional[float],
+    adc: Optional[Tuple[float, float]] = None,
+) -> np.ndarray:
+    """Synthesizes a chunk of `virtual_eeg_powerlaw`, as `stream_eeg_powerlaw` does a block."""
+    (c0, c1), (t0, t1) = block_info[None]["array-location"]
+    iblk, channels = t0 // block_len, np.arange(c0, c1)
+
+    block = _powerlaw_chunk(ss, kernel, channels, iblk, block_len, t1 - t0)
+    block *= amplitude
+    _add_correlated_noise(
+        block, cov, scale=amplitude / correlated_noise_scale, seed=child_rng(ss, 1, iblk), channels=channels
+    )
+
+    # Add the artifacts of the block, and of the blocks before it that spill into it
+    n_spill = min(iblk, -(-spill_len // block_len))
+    for j in range(iblk - n_spill, iblk + 1):
+        n = block_len if j < iblk else t1 - t0
+        for onsets, bursts, chans in _draw_bursts(
+            ss, j, n_channels, n, fs, amplitude, blink_scale, add_blink_artifacts, add_muscle_artifacts
+        ):
+            artifacts.add_bursts(block, onsets + (j - iblk) * block_len, bursts, chans - c0)
+    if line_noise_freq:
+        artifacts.add_line_noise(
+            block, fs, freq=line_noise_freq, amplitude=amplitude, seed=child_rng(ss, 4), start=t0, channels=channels
+        )
+    return block if adc is None else quantize(block, *adc)
@@ -2,3 +2,6 @@ from .gen_spiketimes import *
 from .gen_waveforms import *
 from .load_waveforms import *
 from .gen_ephys import *
+from .virtual_ephys import *
+from .write_ephys import *
+from .snippets import *
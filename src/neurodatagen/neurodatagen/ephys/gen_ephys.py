@@ -1,9 +1,19 @@
 from __future__ import annotations
 
-from typing import Tuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+from typing import Optional, Sequence, Tuple, Union
+import os
+import weakref
 import numpy as np
 
-from ..eeg.gen_eeg import generate_eeg_powerlaw
+from ..adc import quantize
+from ..eeg.gen_eeg import generate_eeg_powerlaw, _sim_powerlaw
+from ..rng import SeedLike, default_rng, seed_sequence, child_rng
+
+# Output array and parameters of `generate_ephys` in the current worker process, set by `_init_worker`
+_WORKER = {}
 
 def generate_lfp(
     n_channels: int,
@@ -12,7 +22,10 @@ def generate_lfp(
     highpass: float = 2.0,
     exponent: float = -1,
     amplitude: float = 50.0,
-    channel_prefix: str = ''
+    channel_prefix: str = '',
+    seed: SeedLike = None,
+    adc_gain: Optional[float] = None,
+    adc_offset: float = 0.0,
 ) -> tuple[np.ndarray, np.ndarray, list]:
     """
     Generate synthetic Local Field Potential (LFP) data as a power-law time series, with a specified exponent.
@@ -33,12 +46,20 @@ def generate_lfp(
         50.0 microvolts.
     channel_prefix (str, optional):
         Prefix for the channel names. Defaults to ''.
+    seed (SeedLike, optional):
+        Seed or random number generator.
+    adc_gain (float, optional):
+        If given, the data is quantized to int16 samples with this gain in
+        microvolts per bit, as in `generate_eeg_powerlaw`. Defaults to None.
+    adc_offset (float, optional):
+        Offset of the quantized data in microvolts. Defaults to 0.
 
     Returns
     -------
     data (np.ndarray):
         Synthetic EEG data as a NumPy array of shape 
-        (n_channels, total_samples).
+        (n_channels, total_samples), of int16 samples if `adc_gain` is given,
+        without the gain and offset, as in `generate_eeg_powerlaw`.
     time (np.ndarray):
         Time array as a NumPy array of shape (total_samples,).
     ch_names (list):
@@ -55,7 +76,10 @@ def generate_lfp(
         exponent=exponent,
         amplitude=amplitude,
         channel_prefix= '',  # Change the channel prefix to '' since LFP channels usually don't have a prefix
-        add_blink_artifacts=False  # Turn off blink artifacts
+        add_blink_artifacts=False,  # Turn off blink artifacts
+        seed=seed,
+        adc_gain=adc_gain,
+        adc_offset=adc_offset,
     )
     
     return times, sigs, ch_names
@@ -105,7 +129,9 @@ def generate_spike_timeseries(
     decay_rate: float = 5.0,
     spike_dur: float = 0.001,
     amplitude: float = 100.0,
-) -> np.ndarray:
+    seed: SeedLike = None,
+    return_spikes: bool = False,
+) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
     """
     Generates a spike time series with a random spike rate within a given range.
 
@@ -126,51 +152,123 @@ def generate_spike_timeseries(
         The duration of a single spike. Default is 0.001.
     amplitude : float, optional
         Amplitude scaling factor for the generated spike data. Default is 100.0 microvolts.
+    seed : SeedLike, optional
+        Seed or random number generator.
+    return_spikes : bool, optional
+        Whether to also return the sample index of the start of the waveform of each
+        spike. Default is False.
 
     Returns
     -------
     np.ndarray
         Spike time series.
+    np.ndarray
+        Sorted sample indices of the spikes, only returned if `return_spikes` is True.
     """
-    time = np.arange(0, duration, 1 / sampling_rate)  # Time vector
+    series, (_, spikes) = generate_spike_timeseries_batch(
+        duration,
+        sampling_rate,
+        spike_rate_range=spike_rate_range,
+        gaussian_std_dev=gaussian_std_dev,
+        decay_rate=decay_rate,
+        spike_dur=spike_dur,
+        amplitude=amplitude,
+        seeds=[seed],
+        return_spikes=True,
+    )
+    return (series[0], spikes) if return_spikes else series[0]
 
-    # Generate spike train using Poisson process
-    spike_rate = np.random.uniform(
-        *spike_rate_range
-    )  # Average spike rate (spikes per second)
-    spike_train = np.random.poisson(spike_rate / sampling_rate, len(time))
 
-    # If there are no spikes (e.g. from very short duration and low spike rate), randomly pick a time for a spike
-    if np.sum(spike_train) == 0:
-        spike_train[np.random.randint(0, len(time))] = 1
+def generate_spike_timeseries_batch(
+    duration: float,
+    sampling_rate: float = 30000,
+    spike_rate_range: Tuple[float, float] = (0.1, 20),
+    gaussian_std_dev: float = 0.1,
+    decay_rate: float = 5.0,
+    spike_dur: float = 0.001,
+    amplitude: float = 100.0,
+    seeds: Sequence[SeedLike] = (None,),
+    out: Optional[np.ndarray] = None,
+    return_spikes: bool = False,
+) -> Union[np.ndarray, Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray]]]:
+    """
+    Generates the spike time series of a batch of channels, each one as
+    `generate_spike_timeseries` does with its own seed.
 
-    # Generate spike waveform
-    spike_waveform = generate_action_potential(
-        np.linspace(-1, 2, int(sampling_rate * spike_dur)), gaussian_std_dev, decay_rate
-    )
+    The spike trains are drawn channel by channel, the refractory filtering is done
+    with vectorized masks, and the waveforms of all kept spikes of all channels are
+    placed with a single unbuffered scatter-add into `out`, which may be a
+    non-contiguous view. The result is the same as adding the waveforms one spike at a
+    time.
 
-    # Add action potential waveform at spike times
-    spike_times = np.where(spike_train)[0]
-    interspike_interval = np.diff(spike_times)  # calculate interspike intervals
-
-    # Check if there's enough space between spikes for the action potential waveform; if so, keep the earlier spike
-    valid_spike_times = [
-        spike_times[i]
-        for i in range(len(interspike_interval))
-        if interspike_interval[i] >= len(spike_waveform)
-    ]
-    valid_spike_times.append(spike_times[-1])  # include the last spike
-
-    spikes = np.zeros(len(time))
-    for spike_time in valid_spike_times:
-        if spike_time + len(spike_waveform) < len(
-            spikes
-        ):  # make sure not to go past the end of the array
-            spikes[spike_time : spike_time + len(spike_waveform)] += (
-                spike_waveform * amplitude
-            )  # Adjust the amplitude to a reasonable range (in microvolts)
+    Parameters
+    ----------
+    duration, sampling_rate, spike_rate_range, gaussian_std_dev, decay_rate, spike_dur,
+    amplitude :
+        As in `generate_spike_timeseries`.
+    seeds : sequence of SeedLike, optional
+        Seed or random number generator of each channel. Defaults to a single channel
+        with fresh entropy.
+    out : np.ndarray, optional
+        Array of shape (n_channels, n_samples) to add the spikes to, in place, e.g. the
+        background noise of the channels. Defaults to a new array of zeros.
+    return_spikes : bool, optional
+        Whether to also return the spikes, as a CSR-style index. Default is False.
 
-    return spikes
+    Returns
+    -------
+    np.ndarray
+        Spike time series, of shape (n_channels, n_samples).
+    Tuple[np.ndarray, np.ndarray]
+        Only returned if `return_spikes` is True, the `(offsets, indices)` of the
+        spikes, where the sorted sample indices of the start of the waveforms of the
+        spikes of channel `i` are `indices[offsets[i]:offsets[i + 1]]`, see
+        `extract_snippets`.
+    """
+    n_samples = len(np.arange(0, duration, 1 / sampling_rate))  # Length of the time vector
+    if out is None:
+        out = np.zeros((len(seeds), n_samples))
+
+    # Generate spike waveform, with the amplitude in a reasonable range (in microvolts)
+    spike_waveform = generate_action_potential(
+        np.linspace(-1, 2, int(sampling_rate * spike_dur)), gaussian_std_dev, decay_rate
+    ) * amplitude
+
+    rows, onsets = [], []
+    for row, seed in enumerate(seeds):
+        rng = default_rng(seed)
+
+        # Generate spike train using Poisson process
+        spike_rate = rng.uniform(*spike_rate_range)  # Average spike rate (spikes per second)
+        spike_times = np.flatnonzero(rng.poisson(spike_rate / sampling_rate, n_samples))
+
+        # If there are no spikes (e.g. from very short duration and low spike rate), randomly pick a time for a spike
+        if len(spike_times) == 0:
+            spike_times = np.array([rng.integers(0, n_samples)])
+
+        # Keep spikes that fit their waveform before the next spike and before the end of the array
+        spike_times = spike_times[_fits_waveform(spike_times, len(spike_waveform))]
+        spike_times = spike_times[spike_times + len(spike_waveform) < n_samples]
+        rows.append(np.full(len(spike_times), row))
+        onsets.append(spike_times)
+
+    # Add action potential waveform at spike times of all channels at once
+    indices = np.concatenate(onsets).astype(np.int64)
+    cols = indices[:, None] + np.arange(len(spike_waveform))
+    np.add.at(out, (np.concatenate(rows)[:, None], cols), spike_waveform)
+    if not return_spikes:
+        return out
+    offsets = np.zeros(len(seeds) + 1, dtype=np.int64)
+    np.cumsum([len(o) for o in onsets], out=offsets[1:])
+    return out, (offsets, indices)
+
+
+def _fits_waveform(spike_times: np.ndarray, waveform_len: int) -> np.ndarray:
+    """
+    Mask of the sorted spike times to keep, those that leave enough space for their
+    waveform before the next spike, and the last one.
+    """
+    return np.diff(spike_times, append=spike_times[-1:] + waveform_len) >= waveform_len
 
 
 def generate_ephys(
@@ -180,10 +278,20 @@ def generate_ephys(
     highpass: float = 2.0,
     exponent: float = -1,
     amplitude: float = 20.0,
-) -> Tuple[np.ndarray, np.ndarray, list]:
+    seed: SeedLike = None,
+    n_workers: Optional[int] = 1,
+    memmap: Optional[str] = None,
+    adc_gain: Optional[float] = None,
+    adc_offset: float = 0.0,
+    return_spikes: bool = False,
+) -> tuple:
     """
     Generate synthetic ephys data as power law time series at a specified exponent and poisson spikes.
 
+    Channels are generated in groups, by a pool of worker processes if `n_workers` is
+    more than 1. Each worker writes its channels directly into the output, held in
+    shared memory or in a memory mapped file, so no data is sent between processes.
+
     Parameters
     ----------
     n_channels : int
@@ -200,32 +308,85 @@ def generate_ephys(
         producing brown noise.
     amplitude : float, optional
         Amplitude scaling factor for the generated ephys data. Default is 20.0 microvolts.
+    seed : SeedLike, optional
+        Seed or random number generator. Each channel is generated from its own stream
+        of the seed, so channels can be generated independently, and the data does not
+        depend on `n_workers`.
+    n_workers : int, optional
+        Number of worker processes. If None, the number of CPUs. Default is 1, which
+        generates the channels in the current process.
+    memmap : str, optional
+        Path of a file to write the data to, returned as a `np.memmap`, for data that
+        does not fit in memory. The file is overwritten. By default the data is kept in
+        memory; with several workers it is generated in shared memory, and the array
+        returned is a view of it, which is released once the array is deleted.
+    adc_gain : float, optional
+        If given, the data is quantized to int16 samples with this gain in microvolts
+        per bit, e.g. 0.195 for Intan amplifiers, see `neurodatagen.adc.quantize`, so
+        that the data in microvolts is `data * adc_gain + adc_offset`. Each group of
+        channels is quantized as it is generated, so the output only takes a quarter
+        of the memory. Default is None, for data in microvolts.
+    adc_offset : float, optional
+        Offset of the quantized data in microvolts. Default is 0.
+    return_spikes : bool, optional
+        Whether to also return the ground truth spikes. Default is False.
 
     Returns
     -------
     Tuple[np.ndarray, np.ndarray, list]
-        Data: Synthetic ephys data as a NumPy array of shape (n_channels, total_samples).
+        Data: Synthetic ephys data as a NumPy array of shape (n_channels, total_samples),
+            of int16 samples if `adc_gain` is given. The samples do not carry the gain
+            and offset: keep them to convert the samples back to microvolts with
+            `neurodatagen.adc.dequantize`, or to store them alongside as the attributes
+            of `neurodatagen.adc.adc_attrs`.
         Time: Time array as a NumPy array of shape (total_samples,).
         Channel names: List of strings of channel names like ['1', '2', ].
+        Spikes: Only returned if `return_spikes` is True, the CSR-style `(offsets, indices)`
+            of the spikes, as returned by `generate_spike_timeseries_batch`.
     """
 
-    from neurodsp.sim import (
-        sim_powerlaw,
-    )  # import here to avoid dependency for all ephys workflows
-
     total_samples = int(n_seconds * fs)
-
-    # Generate high-passed power law noise for each channel
-    ephys = np.empty((n_channels, total_samples))
-    for ch in range(n_channels):
-        pl_noise = (
-            sim_powerlaw(n_seconds, fs, exponent=exponent, f_range=(highpass, None))
-            * amplitude
-        )
-        spikes = generate_spike_timeseries(n_seconds, fs)
-
-        # Combine LFP and spike waveform into a single trace
-        ephys[ch] = pl_noise + spikes
+    ss = seed_sequence(seed)
+    n_workers = n_workers or os.cpu_count()
+    shape = (n_channels, int(np.ceil(n_seconds * fs)))
+    params = dict(ss=ss, n_seconds=n_seconds, fs=fs, highpass=highpass, exponent=exponent, amplitude=amplitude)
+    params.update(adc=None if adc_gain is None else (adc_gain, adc_offset))
+    dtype = np.float64 if adc_gain is None else np.int16
+
+    # Split the channels in groups, for each worker to get a few of them, of at most 2**24 samples
+    group = max(1, min(-(-n_channels // (4 * n_workers)), 2**24 // max(shape[1], 1)))
+    groups = [(c0, min(c0 + group, n_channels)) for c0 in range(0, n_channels, group)]
+
+    if n_workers == 1:
+        ephys = np.empty(shape, dtype) if memmap is None else np.memmap(memmap, dtype, "w+", shape=shape)
+        _init_worker(params, arr=ephys)
+        spikes = [_write_channels(c0, c1) for c0, c1 in groups]
+        _WORKER.clear()
+    else:
+        # Create the output where workers can write to it, in shared memory or a memory mapped file
+        shm = None
+        if memmap is None:
+            shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1))
+            ephys = np.ndarray(shape, dtype, buffer=shm.buf)
+            out = dict(shape=shape, dtype=dtype, shm_name=shm.name)
+        else:
+            ephys = np.memmap(memmap, dtype, "w+", shape=shape)
+            ephys.flush()
+            out = dict(shape=shape, dtype=dtype, path=memmap)
+        try:
+            with ProcessPoolExecutor(n_workers, initializer=partial(_init_worker, params, **out)) as pool:
+                spikes = list(pool.map(_write_channels, *zip(*groups)))
+        except BaseException:
+            if shm is not None:
+                del ephys  # Views of the block must be released before it is closed
+                shm.close()
+                shm.unlink()
+            raise
+        if shm is not None:
+            # Return the shared memory without copying it, its name is no longer needed, and the
+            # block is closed once the array and all its views are deleted
+            shm.unlink()
+            weakref.finalize(ephys, shm.close)
 
     time = np.arange(total_samples) / fs
 
@@ -238,9 +399,67 @@ def generate_ephys(
     # Create channel names
     ch_names = create_ephys_channel_names(n_channels)
 
+    if return_spikes:
+        # Join the spike indices of the groups of channels
+        counts = np.concatenate([np.diff(offsets) for offsets, _ in spikes])
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return ephys, time, ch_names, (offsets, np.concatenate([indices for _, indices in spikes]))
     return ephys, time, ch_names
 
 
+def _init_worker(
+    params: dict,
+    arr: Optional[np.ndarray] = None,
+    shape: Optional[Tuple[int, int]] = None,
+    dtype=np.float64,
+    shm_name: Optional[str] = None,
+    path: Optional[str] = None,
+) -> None:
+    """
+    Keep the output array of `generate_ephys` and its parameters around in a worker
+    process. The output is either given as an array, or as a shared memory block or
+    a memory mapped file holding an array of `shape` and `dtype`.
+    """
+    if shm_name is not None:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _WORKER.update(shm=shm)  # The array is only valid as long as the block is open
+        arr = np.ndarray(shape, dtype, buffer=shm.buf)
+    elif path is not None:
+        arr = np.memmap(path, dtype, "r+", shape=shape)
+    _WORKER.update(arr=arr, params=params)
+
+
+def _write_channels(c0: int, c1: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generate channels `c0` to `c1` of `generate_ephys` and write them to the output
+    array. Returns the CSR-style index of their spikes.
+    """
+    arr, params = _WORKER["arr"], _WORKER["params"]
+    out = arr[c0:c1] if params["adc"] is None else np.empty(arr[c0:c1].shape)
+
+    # Generate high-passed power law noise, then the spikes, from the stream of each channel
+    rngs = [child_rng(params["ss"], ch) for ch in range(c0, c1)]
+    _sim_powerlaw(
+        params["n_seconds"],
+        params["fs"],
+        exponent=params["exponent"],
+        highpass=params["highpass"],
+        seeds=rngs,
+        out=out,
+    )
+    out *= params["amplitude"]
+
+    # Combine LFP and spike waveforms of the channels into a single array
+    _, spikes = generate_spike_timeseries_batch(
+        params["n_seconds"], params["fs"], seeds=rngs, out=out, return_spikes=True
+    )
+
+    # Quantize to the samples of an ADC
+    if params["adc"] is not None:
+        quantize(out, *params["adc"], out=arr[c0:c1])
+    return spikes
+
+
 def create_ephys_channel_names(n_channels: int = None) -> list[str]:
     """
     Given the number of channels, return a list of channel names like ['1', '2', ...].
@@ -1,13 +1,25 @@
 from __future__ import annotations
 
+from typing import Iterator
 import numpy as np
 import pandas as pd
 
+from ..rng import SeedLike, default_rng, seed_sequence, child_rng
 
-def sim_spikes(num_neurons: int, firing_rate: float, duration: float) -> pd.DataFrame:
+
+def sim_spikes(
+    num_neurons: int,
+    firing_rate: float,
+    duration: float,
+    seed: SeedLike = None,
+    dtype=np.float64,
+) -> pd.DataFrame:
     """
     Simulates spike times for a given number of neurons, firing rate, and duration.
 
+    All the spikes are held in memory, see `stream_spikes` and `write_spikes_parquet`
+    for datasets of any size.
+
     Parameters
     ----------
     num_neurons (int):
@@ -16,6 +28,11 @@ def sim_spikes(num_neurons: int, firing_rate: float, duration: float) -> pd.Data
         Firing rate of each neuron in Hz.
     duration (float):
         Duration of the spike trains in seconds.
+    seed (SeedLike, optional):
+        Seed or random number generator.
+    dtype (optional):
+        Floating point data type of the spike times, e.g. np.float32 to halve their
+        memory. Defaults to np.float64.
 
     Returns
     -------
@@ -23,28 +40,180 @@ def sim_spikes(num_neurons: int, firing_rate: float, duration: float) -> pd.Data
         Spiking data
     """
 
+    rng = default_rng(seed)
+
     # Calculate the expected number of spikes for each neuron
-    expected_num_spikes = np.random.poisson(firing_rate * duration, size=num_neurons)
+    expected_num_spikes = rng.poisson(firing_rate * duration, size=num_neurons)
 
     # Generate spike times for all neurons at once using a uniform distribution
-    spike_times = np.random.uniform(0, duration, size=sum(expected_num_spikes))
+    spike_times = rng.uniform(0, duration, size=sum(expected_num_spikes))
 
-    # Assign spike times to each neuron based on their expected number of spikes
-    neuron_ids = np.repeat(np.arange(1, num_neurons + 1), expected_num_spikes)
+    # Assign spike times to each neuron based on their expected number of spikes, as
+    # codes of the categories of the neurons that spike
+    spiking = np.flatnonzero(expected_num_spikes)
+    codes = np.repeat(np.arange(len(spiking), dtype=np.int32), expected_num_spikes[spiking])
 
     # Create a DataFrame of time and neuron cols, sorted by spike times
+    order = np.argsort(spike_times)
     spikes_df = pd.DataFrame(
-        {"time": spike_times, "neuron": pd.Categorical(neuron_ids)}
+        {
+            "time": spike_times[order].astype(dtype, copy=False),
+            "neuron": pd.Categorical.from_codes(codes[order], spiking + 1),
+        }
     )
-    spikes_df.sort_values("time", inplace=True, ignore_index=True)
 
     return spikes_df
 
 
-def assign_groups(times: np.ndarray, num_groups: int, sigma: float = 1) -> np.ndarray:
+def stream_spikes(
+    num_neurons: int,
+    firing_rate: float,
+    duration: float,
+    chunk_seconds: float = 10.0,
+    seed: SeedLike = None,
+    dtype=np.float64,
+    fs: float = 30000,
+) -> Iterator[pd.DataFrame]:
+    """
+    Simulates spike times like `sim_spikes`, as a stream of consecutive chunks of time,
+    so that datasets of any number of spikes can be produced in constant memory.
+
+    The spikes of each chunk are drawn from a stream of the seed of their own, as a
+    Poisson number of spikes per neuron at uniform times within the chunk, and only the
+    spikes of the chunk are sorted, so that the whole stream is sorted by time without
+    a global sort. The spikes are statistically equivalent to those of `sim_spikes`,
+    but depend on `chunk_seconds`.
+
+    Parameters
+    ----------
+    num_neurons (int):
+        Number of neurons to simulate.
+    firing_rate (float):
+        Firing rate of each neuron in Hz.
+    duration (float):
+        Duration of the spike trains in seconds.
+    chunk_seconds (float, optional):
+        Duration of each chunk in seconds, the last one may be shorter. Defaults to 10.
+    seed (SeedLike, optional):
+        Seed or random number generator.
+    dtype (optional):
+        Data type of the spike times. With a floating point type, times are in
+        seconds; np.float32 keeps them to within about 0.1 ms for an hour. With an
+        integer type, e.g. np.uint32, times are sample indices at `fs`. Defaults to
+        np.float64.
+    fs (float, optional):
+        Sampling rate of integer spike times in Hz. Defaults to 30000.
+
+    Yields
+    ------
+    pandas DataFrame:
+        Spiking data of the next chunk, sorted by time, with the same columns as
+        `sim_spikes`. The neuron categories are all the neurons, in every chunk.
+    """
+    ss = seed_sequence(seed)
+    categories = pd.RangeIndex(1, num_neurons + 1)
+    integer = np.issubdtype(dtype, np.integer)
+
+    # Chunk boundaries, in samples for integer times
+    scale = fs if integer else 1
+    total, chunk = (int(duration * fs), max(1, int(chunk_seconds * fs))) if integer else (duration, chunk_seconds)
+    for ichunk, t0 in enumerate(np.arange(0, total, chunk)):
+        t1 = min(t0 + chunk, total)
+        rng = child_rng(ss, ichunk)
+        counts = rng.poisson(firing_rate * (t1 - t0) / scale, size=num_neurons)
+        codes = np.repeat(np.arange(num_neurons, dtype=np.int32), counts)
+        if integer:
+            times = rng.integers(t0, t1, size=len(codes), dtype=dtype)
+            order = np.argsort(times, kind="stable")  # Spikes in the same sample stay in neuron order
+        else:
+            times = rng.uniform(t0, t1, size=len(codes))
+            order = np.argsort(times)
+        yield pd.DataFrame(
+            {
+                "time": times[order].astype(dtype, copy=False),
+                "neuron": pd.Categorical.from_codes(codes[order], categories),
+            }
+        )
+
+
+def write_spikes_parquet(
+    path: str,
+    num_neurons: int,
+    firing_rate: float,
+    duration: float,
+    chunk_seconds: float = 10.0,
+    verbose: bool = True,
+    **kwargs,
+) -> int:
+    """
+    Simulates spike times with `stream_spikes` and writes them to a parquet file one
+    chunk at a time, as a row group each, so that memory use does not depend on the
+    number of spikes, e.g. for 10000 neurons over an hour.
+
+    The file can be read with `pandas.read_parquet`, or lazily with
+    `dask.dataframe.read_parquet`, as a dataframe of spikes sorted by time. Neurons are
+    stored as their number, in the smallest unsigned integer type that holds them.
+
+    Parameters
+    ----------
+    path (str):
+        Path of the parquet file to write to. It is overwritten if it exists.
+    num_neurons (int):
+        Number of neurons to simulate.
+    firing_rate (float):
+        Firing rate of each neuron in Hz.
+    duration (float):
+        Duration of the spike trains in seconds.
+    chunk_seconds (float, optional):
+        Duration of each chunk in seconds. Defaults to 10.
+    verbose (bool, optional):
+        Whether to report progress. Defaults to True.
+    **kwargs:
+        Further parameters of `stream_spikes`.
+
+    Returns
+    -------
+    int:
+        Number of spikes written.
+    """
+    import pyarrow as pa  # import here to avoid dependency for all workflows
+    import pyarrow.parquet as pq
+
+    n_spikes, writer = 0, None
+    neuron_dtype = np.min_scalar_type(num_neurons)
+    try:
+        for chunk in stream_spikes(num_neurons, firing_rate, duration, chunk_seconds=chunk_seconds, **kwargs):
+            chunk["neuron"] = chunk["neuron"].cat.codes.to_numpy().astype(neuron_dtype) + neuron_dtype.type(1)
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            n_spikes += len(chunk)
+            if verbose:
+                print(f"Wrote {n_spikes} spikes", end="\r")
+    finally:
+        if writer is not None:
+            writer.close()
+    if verbose:
+        print(f"\nWrote {n_spikes} spikes of {num_neurons} neurons to {path}")
+    return n_spikes
+
+
+def assign_groups(
+    times: np.ndarray,
+    num_groups: int,
+    sigma: float = 1,
+    seed: SeedLike = None,
+    max_block_size: int = 2**22,
+) -> np.ndarray:
     """
     Bin an array of times into a number of groups controlled by num_groups parameter.
 
+    Each time is assigned to a group at random, with a probability that falls off as a
+    Gaussian of its distance to the center of the group, the groups evenly dividing the
+    range of the times. The probabilities of a block of times are computed at once, and
+    the groups are drawn by inverse transform sampling, one uniform number per time.
+
     Parameters
     ----------
     times (numpy.ndarray):
@@ -54,37 +223,44 @@ def assign_groups(times: np.ndarray, num_groups: int, sigma: float = 1) -> np.nd
     sigma (float, optional):
         The standard deviation of the normal distribution used to assign times to groups
         probabilistically. Default is 1.
+    seed (SeedLike, optional):
+        Seed or random number generator.
+    max_block_size (int, optional):
+        Maximum number of probabilities computed at once, to bound memory. Default is
+        2**22.
 
     Returns
     -------
     numpy.ndarray:
         An equally sized array of groups labeled with integers.
     """
-    # Sort the array of times
-    sorted_times = np.sort(times)
+    rng = default_rng(seed)
+    times = np.asarray(times)
+    groups = np.zeros_like(times)
+    if len(times) == 0:
+        return groups
 
     # Calculate the bin width based on the number of groups
-    bin_width = (sorted_times[-1] - sorted_times[0]) / num_groups
+    t_min, t_max = times.min(), times.max()
+    bin_width = (t_max - t_min) / num_groups
 
     # Calculate the center of each bin
-    bin_centers = np.linspace(
-        sorted_times[0] + bin_width / 2, sorted_times[-1] - bin_width / 2, num_groups
-    )
-
-    # Assign each time to a group probabilistically
-    groups = np.zeros_like(sorted_times)
-    for i, time in enumerate(sorted_times):
-        # Calculate the distance to each bin center
-        distances = np.abs(time - bin_centers)
+    bin_centers = np.linspace(t_min + bin_width / 2, t_max - bin_width / 2, num_groups)
 
-        # Calculate the probability of assigning the time to each group
-        probabilities = np.exp(-(distances**2) / (2 * sigma**2))
+    # Assign each block of times to a group probabilistically
+    n_rows = max(1, max_block_size // num_groups)
+    for r0 in range(0, len(times), n_rows):
+        block = times[r0 : r0 + n_rows]
 
-        # Normalize the probabilities so they sum to 1
-        probabilities /= np.sum(probabilities)
+        # Squared distance of each time to each bin center, relative to the nearest one,
+        # so that the probability of the nearest group never underflows
+        dist2 = (block[:, None] - bin_centers) ** 2
+        dist2 -= dist2.min(axis=1, keepdims=True)
 
-        # Assign the time to a group based on the probabilities
-        groups[i] = np.random.choice(range(num_groups), p=probabilities)
+        # Unnormalized cumulative probabilities of the groups, and the first group whose
+        # cumulative probability exceeds a uniform draw scaled to the total
+        cdf = np.cumsum(np.exp(-dist2 / (2 * sigma**2)), axis=1)
+        u = rng.random(len(block)) * cdf[:, -1]
+        groups[r0 : r0 + n_rows] = np.minimum((cdf <= u[:, None]).sum(axis=1), num_groups - 1)
 
-    # Sort the groups based on the original order of the times
-    return groups[np.argsort(times)]
+    return groups
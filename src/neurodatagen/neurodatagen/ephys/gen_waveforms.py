@@ -2,11 +2,14 @@ from __future__ import annotations
 
 import numpy as np
 
+from ..rng import SeedLike, default_rng
+
 
 def create_noisy_waveforms(
     spike_waveform: np.ndarray,
     noise_std_percent: float = 50,
-    num_spikes: int = 100
+    num_spikes: int = 100,
+    seed: SeedLike = None,
 ) -> list[np.ndarray]:
     """
     Generate a list of noisy spike waveforms based on a given input waveform.
@@ -22,6 +25,8 @@ def create_noisy_waveforms(
     num_spikes : int, optional
         The number of noisy waveforms to generate.
         Default is 100.
+    seed : SeedLike, optional
+        Seed or random number generator.
 
     Returns
     -------
@@ -36,7 +41,7 @@ def create_noisy_waveforms(
     noise_std = (noise_std_percent / 100) * real_data_std
 
     # Generate random noise with the same shape as the spike waveform and num_spikes
-    noise = np.random.normal(
+    noise = default_rng(seed).normal(
         scale=noise_std, size=(num_spikes, spike_waveform.shape[0])
     )
 
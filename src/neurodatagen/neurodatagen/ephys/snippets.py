@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+from typing import Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def spike_index_csr(
+    channels: np.ndarray, samples: np.ndarray, n_channels: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts spikes given as a channel and sample index each, e.g. the `spike_channel`
+    and `spike_sample` ground truth of `write_ephys_zarr`, into a CSR-style index,
+    where the sorted sample indices of the spikes of channel `i` are
+    `indices[offsets[i]:offsets[i + 1]]`.
+
+    Parameters
+    ----------
+    channels : np.ndarray
+        Channel index of each spike.
+    samples : np.ndarray
+        Sample index of each spike.
+    n_channels : int, optional
+        Number of channels. Defaults to one more than the largest channel index.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        offsets: Start of the spikes of each channel in `indices`, of length
+            n_channels + 1.
+        indices: Sample index of the spikes, sorted by channel then sample.
+    """
+    channels, samples = np.asarray(channels), np.asarray(samples)
+    if n_channels is None:
+        n_channels = int(channels.max()) + 1 if len(channels) else 0
+    order = np.lexsort((samples, channels))
+    offsets = np.zeros(n_channels + 1, dtype=np.int64)
+    np.cumsum(np.bincount(channels, minlength=n_channels), out=offsets[1:])
+    return offsets, samples[order].astype(np.int64)
+
+
+def extract_snippets(
+    data: np.ndarray,
+    offsets: np.ndarray,
+    indices: np.ndarray,
+    n_before: int,
+    n_after: int,
+    fill_value: Optional[float] = None,
+    max_block_size: int = 2**22,
+) -> np.ndarray:
+    """
+    Extracts the waveform snippet of every spike of a CSR-style spike index, as
+    returned by `generate_ephys` or `spike_index_csr`, from (channel, sample) data.
+
+    The snippets are gathered from a strided view of all the windows of the data, which
+    takes no memory, with a single fancy index per batch of spikes, so that there is no
+    loop over the spikes and only the snippets are read, e.g. from a `np.memmap` of a
+    recording that does not fit in memory. Batches are bounded to about
+    `max_block_size` values.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Data of shape (n_channels, n_samples), or a `np.memmap`.
+    offsets : np.ndarray
+        Start of the spikes of each channel in `indices`, of length n_channels + 1.
+    indices : np.ndarray
+        Sample index of the spikes.
+    n_before : int
+        Number of samples of the snippets before the spike.
+    n_after : int
+        Number of samples of the snippets from the spike on, including it.
+    fill_value : float, optional
+        Value of the samples of snippets that extend past the start or end of the data.
+        Defaults to NaN for floating point data and 0 otherwise.
+    max_block_size : int, optional
+        Maximum number of values gathered at once. Default is 2**22.
+
+    Returns
+    -------
+    np.ndarray
+        Snippets of shape (n_spikes, n_before + n_after), in the order of `indices`,
+        of the data type of `data`.
+    """
+    n_samples, snippet_len = data.shape[1], n_before + n_after
+    channels = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    starts = np.asarray(indices, dtype=np.int64) - n_before
+    if fill_value is None:
+        fill_value = np.nan if np.issubdtype(data.dtype, np.inexact) else 0
+
+    snippets = np.empty((len(starts), snippet_len), dtype=data.dtype)
+    windows = sliding_window_view(data, snippet_len, axis=1) if n_samples >= snippet_len else None
+    batch = max(1, max_block_size // max(snippet_len, 1))
+    for s0 in range(0, len(starts), batch):
+        chans, t0 = channels[s0 : s0 + batch], starts[s0 : s0 + batch]
+        out = snippets[s0 : s0 + batch]
+
+        # Gather the snippets that lie within the data from the strided windows
+        inside = (t0 >= 0) & (t0 + snippet_len <= n_samples)
+        if windows is not None:
+            out[inside] = windows[chans[inside], t0[inside]]
+
+        # Fill in the few snippets at the edges sample by sample
+        if not inside.all():
+            idx = t0[~inside, None] + np.arange(snippet_len)
+            valid = (idx >= 0) & (idx < n_samples)
+            edge = data[chans[~inside, None], np.clip(idx, 0, n_samples - 1)] if n_samples else 0
+            out[~inside] = np.where(valid, edge, fill_value)
+    return snippets
+
+
+def snippets_dataframe(
+    snippets: np.ndarray,
+    offsets: np.ndarray,
+    fs: float,
+    n_before: int = 0,
+    neurons: Optional[Sequence] = None,
+) -> pd.DataFrame:
+    """
+    Long-format dataframe of the snippets of `extract_snippets`, with a row per sample
+    of each snippet, as used by the waveform snippets workflow.
+
+    Parameters
+    ----------
+    snippets : np.ndarray
+        Snippets of shape (n_spikes, n_samples), in CSR order.
+    offsets : np.ndarray
+        Start of the spikes of each channel, as given to `extract_snippets`.
+    fs : float
+        Sampling rate in Hz.
+    n_before : int, optional
+        Number of samples of the snippets before the spike, which are at negative
+        times. Default is 0.
+    neurons : sequence, optional
+        Label of the neuron of each channel, e.g. the channel names. Defaults to the
+        channel index.
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe with the columns 'Neuron', 'Waveform', the index of the snippet
+        among those of its neuron, 'Time' in milliseconds relative to the spike, and
+        'Amplitude'.
+    """
+    n_spikes, snippet_len = snippets.shape
+    counts = np.diff(offsets)
+    channels = np.repeat(np.arange(len(counts)), counts)
+    labels = np.arange(len(counts)) if neurons is None else np.asarray(neurons)
+    waveform = np.arange(n_spikes) - np.repeat(offsets[:-1], counts)
+    return pd.DataFrame(
+        {
+            "Neuron": np.repeat(labels[channels], snippet_len),
+            "Waveform": np.repeat(waveform, snippet_len),
+            "Time": np.tile((np.arange(snippet_len) - n_before) * 1000 / fs, n_spikes),
+            "Amplitude": snippets.reshape(-1),
+        }
+    )
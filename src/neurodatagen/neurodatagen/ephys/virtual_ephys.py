@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+from typing import Optional, Tuple
+import numpy as np
+
+from ..adc import adc_attrs, quantize
+from ..eeg import artifacts
+from ..eeg.stream_eeg import _powerlaw_kernel
+from ..eeg.virtual_eeg import _powerlaw_chunk, _virtual_chunks, _virtual_data_array
+from ..rng import SeedLike, seed_sequence, child_rng
+from .gen_ephys import _fits_waveform, create_ephys_channel_names, generate_action_potential
+
+
+def virtual_ephys(
+    n_channels: int,
+    n_seconds: float,
+    fs: int = 30000,
+    chunk_seconds: float = 1.0,
+    channel_chunk: Optional[int] = None,
+    highpass: Optional[float] = 2.0,
+    exponent: float = -1,
+    amplitude: float = 20.0,
+    spike_rate_range: Tuple[float, float] = (0.1, 20),
+    spike_amplitude: float = 100.0,
+    seed: SeedLike = None,
+    dtype=np.float64,
+    adc_gain: Optional[float] = None,
+    adc_offset: float = 0.0,
+    arr_name: str = "ephys",
+):
+    """
+    Returns a virtual synthetic ephys recording, power law noise and Poisson spikes as
+    in `generate_ephys`, as a lazy dask-backed data array whose chunks are only
+    synthesized when they are computed.
+
+    Each (channel, time) chunk is synthesized from the streams of the seed that belong
+    to its block of samples and channels, and from the blocks of samples before it that
+    the power law filter and the spike waveforms reach, so that any window of a
+    recording of any duration can be accessed without generating or storing the rest.
+    Computing the same chunk twice gives the same data.
+
+    Each channel fires at its own rate, drawn from `spike_rate_range`. Within a block,
+    a spike is dropped when the next one follows before the end of its waveform, as in
+    `generate_spike_timeseries`.
+
+    Parameters
+    ----------
+    n_channels : int
+        Number of ephys channels.
+    n_seconds : float
+        Duration of the ephys data in seconds.
+    fs : int, optional
+        Sampling rate of the ephys data in Hz. Default is 30000.
+    chunk_seconds : float, optional
+        Duration of the chunks in seconds. The data depends on it. Default is 1.
+    channel_chunk : int, optional
+        Number of channels of the chunks. The data does not depend on it. Default is
+        all channels.
+    highpass : float, optional
+        High-pass filter factor in Hz. Default is 2.0.
+    exponent : float, optional
+        Power law exponent. Default is -1.
+    amplitude : float, optional
+        Amplitude scaling factor of the power law noise. Default is 20.0 microvolts.
+    spike_rate_range : Tuple[float, float], optional
+        Range of the spike rates of the channels in Hz. Default is (0.1, 20).
+    spike_amplitude : float, optional
+        Amplitude of the spikes. Default is 100.0 microvolts.
+    seed : SeedLike, optional
+        Seed or random number generator. It is drawn from once, when the array is
+        created, so that the array is deterministic even without a seed.
+    dtype : optional
+        Floating point data type of the data. Default is np.float64.
+    adc_gain : float, optional
+        If given, chunks are quantized to int16 samples with this gain in microvolts per
+        bit, as in `generate_ephys`, with the gain and offset as the `scale_factor` and
+        `add_offset` attributes, which `xarray.decode_cf` applies lazily. `dtype` is
+        then the precision they are computed in. Default is None.
+    adc_offset : float, optional
+        Offset of the quantized data in microvolts. Default is 0.
+    arr_name : str, optional
+        Name of the data array. Default is 'ephys'.
+
+    Returns
+    -------
+    xr.DataArray
+        The (channel, sample) data array, with channel names, sample indices and times
+        in seconds as coordinates, and the sampling rate as the `sfreq` attribute.
+    """
+    import dask.array as darr  # import here to avoid dependency for all workflows
+
+    model = _ephys_model(
+        seed_sequence(seed),
+        n_channels,
+        fs,
+        max(1, int(chunk_seconds * fs)),
+        highpass,
+        exponent,
+        amplitude,
+        spike_rate_range,
+        spike_amplitude,
+        dtype,
+    )
+    out_dtype = dtype if adc_gain is None else np.int16
+    data = darr.map_blocks(
+        _ephys_chunk,
+        chunks=_virtual_chunks(n_channels, int(n_seconds * fs), model["block_len"], channel_chunk),
+        dtype=out_dtype,
+        meta=np.empty((0, 0), dtype=out_dtype),
+        token=arr_name,
+        adc=None if adc_gain is None else (adc_gain, adc_offset),
+        **model,
+    )
+    return _virtual_data_array(
+        data,
+        fs,
+        create_ephys_channel_names(n_channels),
+        arr_name,
+        units="uV",
+        **({} if adc_gain is None else adc_attrs(adc_gain, adc_offset)),
+    )
+
+
+def _ephys_model(
+    ss: np.random.SeedSequence,
+    n_channels: int,
+    fs: float,
+    block_len: int,
+    highpass: Optional[float],
+    exponent: float,
+    amplitude: float,
+    spike_rate_range: Tuple[float, float],
+    spike_amplitude: float,
+    dtype,
+) -> dict:
+    """Everything that `_synthesize_ephys` needs to synthesize any block of a recording."""
+    waveform = spike_amplitude * generate_action_potential(np.linspace(-1, 2, int(fs * 0.001)), 0.1, 5.0)
+    return dict(
+        ss=ss,
+        kernel=_powerlaw_kernel(fs, exponent, highpass).astype(dtype),
+        block_len=block_len,
+        fs=fs,
+        amplitude=amplitude,
+        spike_rates=child_rng(ss, 2).uniform(*spike_rate_range, n_channels),
+        waveform=waveform.astype(dtype),
+    )
+
+
+def _ephys_chunk(block_info=None, adc: Optional[Tuple[float, float]] = None, **model) -> np.ndarray:
+    """Synthesizes a chunk of `virtual_ephys`."""
+    (c0, c1), (t0, t1) = block_info[None]["array-location"]
+    block = _synthesize_ephys(c0, c1, t0, t1, **model)[0]
+    return block if adc is None else quantize(block, *adc)
+
+
+def _synthesize_ephys(
+    c0: int,
+    c1: int,
+    t0: int,
+    t1: int,
+    *,
+    ss: np.random.SeedSequence,
+    kernel: np.ndarray,
+    block_len: int,
+    fs: float,
+    amplitude: float,
+    spike_rates: np.ndarray,
+    waveform: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Synthesizes channels `c0` to `c1` of the block of samples `t0` to `t1`, which must
+    start on a multiple of `block_len`. Returns the data, and the channel and sample
+    index of the spikes that start in the block.
+    """
+    iblk, channels = t0 // block_len, np.arange(c0, c1)
+
+    block = _powerlaw_chunk(ss, kernel, channels, iblk, block_len, t1 - t0)
+    block *= amplitude
+
+    # Add the spikes of the block, and of the blocks before it whose waveforms spill into it
+    n_spill = min(iblk, -(-len(waveform) // block_len))
+    for j in range(iblk - n_spill, iblk + 1):
+        rows, onsets = _draw_spikes(ss, j, channels, block_len if j < iblk else t1 - t0, fs, spike_rates, len(waveform))
+        artifacts.add_bursts(
+            block,
+            onsets + (j - iblk) * block_len,
+            np.broadcast_to(waveform, (len(onsets), len(waveform))),
+            rows[:, None],
+        )
+    return block, channels[rows], onsets + t0
+
+
+def _draw_spikes(
+    ss: np.random.SeedSequence,
+    iblk: int,
+    channels: np.ndarray,
+    n: int,
+    fs: float,
+    spike_rates: np.ndarray,
+    waveform_len: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Row within `channels` and sample index within the block of the spikes of a block.
+
+    As with a Poisson spike count per sample, each sample has a spike with probability
+    1 - exp(-rate / fs). The number of samples with a spike is drawn first, then which
+    samples they are, so that only the spikes are drawn rather than every sample.
+    """
+    rows, onsets = [], []
+    for row, ch in enumerate(channels):
+        rng = child_rng(ss, 1, iblk, ch)
+        n_spikes = rng.binomial(n, -np.expm1(-spike_rates[ch] / fs))
+        spike_times = np.sort(rng.choice(n, n_spikes, replace=False))
+
+        # Keep a spike only if there is enough space for its waveform before the next one
+        spike_times = spike_times[_fits_waveform(spike_times, waveform_len)]
+        onsets.append(spike_times)
+        rows.append(np.full(len(spike_times), row))
+    return np.concatenate(rows), np.concatenate(onsets)
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Optional, Tuple
+import os
+import time
+import numpy as np
+
+from ..adc import adc_attrs, quantize
+from ..rng import seed_sequence
+from .gen_ephys import create_ephys_channel_names
+from .virtual_ephys import _ephys_model, _synthesize_ephys
+
+# Model and store of the current worker process, set by `_init_worker`
+_WORKER = {}
+
+
+def write_ephys_zarr(
+    store: str,
+    n_channels: int,
+    n_seconds: float,
+    fs: int = 30000,
+    block_seconds: float = 10.0,
+    channel_chunk: int = 64,
+    highpass: Optional[float] = 2.0,
+    exponent: float = -1,
+    amplitude: float = 20.0,
+    spike_rate_range: Tuple[float, float] = (0.1, 20),
+    spike_amplitude: float = 100.0,
+    seed: Optional[int] = None,
+    dtype=np.float32,
+    adc_gain: Optional[float] = None,
+    adc_offset: float = 0.0,
+    arr_name: str = "ephys",
+    n_workers: Optional[int] = None,
+    resume: bool = False,
+    progress: Optional[Callable[[float, float], None]] = None,
+    verbose: bool = True,
+) -> float:
+    """
+    Generates synthetic ephys data, as `virtual_ephys` does, and writes it to a zarr
+    store one block of samples and channels at a time, with the spikes it contains as
+    a ground truth table.
+
+    Blocks are synthesized independently by a pool of worker processes and written
+    directly to their chunk of the store, so that memory use is proportional to a
+    block per worker, whatever the duration. Completed blocks are recorded in the
+    store, so that an interrupted run can be resumed with `resume=True` and the same
+    parameters.
+
+    The store can be opened with `xarray.open_zarr`, as a dataset with the
+    (channel, time) data array, and `spike_sample` and `spike_channel` along a
+    `spike` dimension, the sample and channel index of every spike sorted by time.
+    The ground truth table is only written once all blocks are completed. Data
+    quantized with `adc_gain` is stored as int16 samples, with the gain and offset as
+    the `scale_factor` and `add_offset` attributes, which xarray applies lazily unless
+    opened with `mask_and_scale=False`.
+
+    Parameters
+    ----------
+    store : str
+        Path of the zarr store to write to.
+    n_channels : int
+        Number of ephys channels.
+    n_seconds : float
+        Duration of the ephys data in seconds.
+    fs : int, optional
+        Sampling rate of the ephys data in Hz. Default is 30000.
+    block_seconds : float, optional
+        Duration of the blocks in seconds, which is also the chunk size along time in
+        the zarr store. The data depends on it. Default is 10.
+    channel_chunk : int, optional
+        Number of channels of the blocks, which is also the chunk size along channels
+        in the zarr store. The data does not depend on it. Default is 64.
+    highpass, exponent, amplitude, spike_rate_range, spike_amplitude :
+        As in `virtual_ephys`.
+    seed : int, optional
+        Seed of the simulation. If not specified, a random seed is drawn. The seed is
+        stored in the zarr store and reused when resuming. The data only depends on the
+        seed, not on `n_workers`, and is the same as that of `virtual_ephys` with
+        `chunk_seconds=block_seconds`.
+    dtype : optional
+        Floating point data type of the data, or that it is computed in when quantized.
+        Default is np.float32.
+    adc_gain : float, optional
+        If given, the data is quantized to int16 samples with this gain in microvolts
+        per bit, as in `generate_ephys`. Default is None.
+    adc_offset : float, optional
+        Offset of the quantized data in microvolts. Default is 0.
+    arr_name : str, optional
+        Name of the data array. Default is 'ephys'.
+    n_workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs. If 1, blocks are
+        computed in the current process.
+    resume : bool, optional
+        Whether to resume writing to an existing store, skipping completed blocks.
+        Default is False, which overwrites the store.
+    progress : callable, optional
+        Called after each completed block with the number of seconds of data written
+        so far, counting a block of some of the channels pro rata, and `n_seconds`.
+    verbose : bool, optional
+        Whether to report progress and throughput. Default is True.
+
+    Returns
+    -------
+    float
+        Throughput of the run, in seconds of data per second.
+
+    Raises
+    ------
+    ValueError
+        if resuming a store that was written with different parameters.
+    """
+    import zarr  # import here to avoid dependency for all workflows
+
+    total_samples, block_len = int(n_seconds * fs), max(1, int(block_seconds * fs))
+    params = dict(
+        n_channels=n_channels,
+        n_seconds=n_seconds,
+        fs=fs,
+        block_seconds=block_seconds,
+        channel_chunk=channel_chunk,
+        highpass=highpass,
+        exponent=exponent,
+        amplitude=amplitude,
+        spike_rate_range=list(spike_rate_range),
+        spike_amplitude=spike_amplitude,
+        dtype=np.dtype(dtype).str,
+        adc_gain=adc_gain,
+        adc_offset=adc_offset,
+        arr_name=arr_name,
+    )
+
+    # Reuse the seed and completed blocks of an interrupted run
+    group = zarr.open_group(store, mode="a") if resume else None
+    if group is not None and "sim_params" in group.attrs:
+        if group.attrs["sim_params"] != params:
+            raise ValueError(
+                f"Cannot resume {store}, it was written with parameters {group.attrs['sim_params']}"
+            )
+        seed = group.attrs["sim_seed"]
+        completed = set(group.attrs["completed_blocks"])
+    else:
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1)[0])
+        # Write the arrays with the dimension names that xarray expects, the data and spikes are filled in by block
+        group = zarr.open_group(store, mode="w")
+        data = group.create_dataset(
+            arr_name,
+            shape=(n_channels, total_samples),
+            chunks=(channel_chunk, block_len),
+            dtype=dtype if adc_gain is None else np.int16,
+            fill_value=None,
+        )
+        data.attrs.update(_ARRAY_DIMENSIONS=["channel", "time"], units="uV", sfreq=fs)
+        if adc_gain is not None:
+            data.attrs.update(adc_attrs(adc_gain, adc_offset))
+        times = group.create_dataset(
+            "time", shape=(total_samples,), chunks=(block_len,), dtype=np.float64, fill_value=None
+        )
+        times.attrs.update(_ARRAY_DIMENSIONS=["time"], units="s")
+        channels = group.array("channel", np.array(create_ephys_channel_names(n_channels)))
+        channels.attrs.update(_ARRAY_DIMENSIONS=["channel"])
+        group.create_group("block_spikes")
+        group.attrs.update(sim_params=params, sim_seed=seed, completed_blocks=[])
+        completed = set()
+
+    # Blocks of samples and channels, numbered in time then channel order
+    n_chunks = -(-n_channels // channel_chunk)
+    blocks = [
+        (iblk, t0, min(t0 + block_len, total_samples), c0, min(c0 + channel_chunk, n_channels))
+        for iblk, (t0, c0) in enumerate(
+            (t0, c0) for t0 in range(0, total_samples, block_len) for c0 in range(0, n_channels, channel_chunk)
+        )
+        if iblk not in completed
+    ]
+    # Progress in seconds of data, where a block of some of the channels counts pro rata
+    n_done = n_seconds - sum((t1 - t0) * (c1 - c0) for _, t0, t1, c0, c1 in blocks) / fs / n_channels
+    n_run, start = 0.0, time.perf_counter()
+
+    def _report(iblk, n):
+        nonlocal n_done, n_run
+        completed.add(iblk)
+        group.attrs["completed_blocks"] = sorted(completed)
+        n_done, n_run = n_done + n / fs / n_channels, n_run + n / fs / n_channels
+        if progress is not None:
+            progress(n_done, n_seconds)
+        if verbose:
+            rate = n_run / (time.perf_counter() - start)
+            print(f"Wrote {n_done:.0f}/{n_seconds:.0f} s ({rate:.1f}x real time)", end="\r")
+
+    init_args = (store, seed, params)
+    n_workers = n_workers or os.cpu_count()
+    if n_workers == 1:
+        _init_worker(*init_args)
+        for blk in blocks:
+            _report(*_write_block(*blk))
+        _WORKER.clear()
+    else:
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=init_args) as pool:
+            # Only keep a few blocks in flight per worker to bound memory
+            pending, blocks = set(), iter(blocks)
+            for blk in blocks:
+                pending.add(pool.submit(_write_block, *blk))
+                if len(pending) >= 2 * n_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        _report(*fut.result())
+            for fut in pending:
+                _report(*fut.result())
+
+    # Gather the spikes of all blocks into the ground truth table, once all blocks are written
+    if "block_spikes" in group and len(completed) == -(-total_samples // block_len) * n_chunks:
+        _write_spike_table(group, n_channels)
+    zarr.consolidate_metadata(store)
+
+    rate = n_run / max(time.perf_counter() - start, 1e-9)
+    if verbose:
+        print(f"\nWrote {n_seconds:.0f} s of {n_channels} channels to {store} ({rate:.1f}x real time)")
+    return rate
+
+
+def _write_spike_table(group, n_channels: int) -> None:
+    """Gathers the spikes of all blocks, sorted by time, and removes those of the blocks."""
+    blocks = group["block_spikes"]
+    spikes = [blocks[key][:] for key in sorted(blocks.array_keys(), key=int)]
+    spikes = np.concatenate(spikes, axis=1) if spikes else np.zeros((2, 0), dtype=np.int64)
+    order = np.lexsort((spikes[1], spikes[0]))
+    sample = group.array("spike_sample", spikes[0, order], fill_value=None)
+    sample.attrs.update(_ARRAY_DIMENSIONS=["spike"])
+    channel = group.array(
+        "spike_channel", spikes[1, order].astype(np.min_scalar_type(max(n_channels - 1, 0))), fill_value=None
+    )
+    channel.attrs.update(_ARRAY_DIMENSIONS=["spike"])
+    del group["block_spikes"]
+
+
+def _init_worker(store: str, seed: int, params: dict) -> None:
+    """Keep the simulation model and the store around in each worker process."""
+    import zarr  # import here to avoid dependency for all workflows
+
+    p = params
+    _WORKER.update(
+        model=_ephys_model(
+            seed_sequence(seed),
+            p["n_channels"],
+            p["fs"],
+            max(1, int(p["block_seconds"] * p["fs"])),
+            p["highpass"],
+            p["exponent"],
+            p["amplitude"],
+            p["spike_rate_range"],
+            p["spike_amplitude"],
+            np.dtype(p["dtype"]),
+        ),
+        group=zarr.open_group(store, mode="r+"),
+        arr_name=p["arr_name"],
+        adc=None if p["adc_gain"] is None else (p["adc_gain"], p["adc_offset"]),
+    )
+
+
+def _write_block(iblk: int, t0: int, t1: int, c0: int, c1: int) -> Tuple[int, int]:
+    """Synthesize a block of samples and channels and write it, and its spikes, to the store."""
+    group = _WORKER["group"]
+    data, spike_channels, spike_samples = _synthesize_ephys(c0, c1, t0, t1, **_WORKER["model"])
+    if _WORKER["adc"] is not None:
+        data = quantize(data, *_WORKER["adc"])
+    group[_WORKER["arr_name"]][c0:c1, t0:t1] = data
+    if c0 == 0:
+        group["time"][t0:t1] = np.arange(t0, t1) / _WORKER["model"]["fs"]
+    group["block_spikes"].array(str(iblk), np.stack([spike_samples, spike_channels]), overwrite=True)
+    return iblk, (t1 - t0) * (c1 - c0)  # Number of values written
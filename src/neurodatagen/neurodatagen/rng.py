@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+from typing import Optional, Sequence, Tuple, Union
+import numpy as np
+
+# Anything that can seed a generator: None (fresh entropy), an integer or a sequence of
+# integers, a `SeedSequence`, or an existing `Generator` to draw a seed from.
+SeedLike = Union[None, int, Sequence[int], np.random.SeedSequence, np.random.Generator]
+
+
+def seed_sequence(seed: SeedLike = None) -> np.random.SeedSequence:
+    """
+    Converts a seed into a `numpy.random.SeedSequence`.
+
+    Parameters
+    ----------
+    seed : SeedLike, optional
+        The seed. A `Generator` is advanced to draw the entropy of the sequence, so
+        that repeated calls with the same generator give different sequences. If
+        not specified, fresh entropy is drawn from the operating system.
+
+    Returns
+    -------
+    np.random.SeedSequence
+        The seed sequence.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(seed.integers(2**32, size=4, dtype=np.uint64).tolist())
+    return np.random.SeedSequence(seed)
+
+
+def default_rng(seed: SeedLike = None) -> np.random.Generator:
+    """
+    Returns a random number generator for a seed, or the generator itself if one is given.
+
+    Parameters
+    ----------
+    seed : SeedLike, optional
+        The seed, or a `Generator` to use as is.
+
+    Returns
+    -------
+    np.random.Generator
+        The random number generator.
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+
+def child_rng(seed: SeedLike, *key: int) -> np.random.Generator:
+    """
+    Returns the random number generator of an independent stream of a seed.
+
+    Streams are identified by a key, such as the index of a channel or of a chunk,
+    rather than by the order in which they are created, so any subset of them can be
+    created in any process and in any order with the same result.
+
+    Parameters
+    ----------
+    seed : SeedLike
+        The seed of the parent stream.
+    *key : int
+        Non-negative integers identifying the stream.
+
+    Returns
+    -------
+    np.random.Generator
+        The random number generator of the stream.
+    """
+    ss = seed_sequence(seed)
+    return np.random.default_rng(
+        np.random.SeedSequence(ss.entropy, spawn_key=tuple(ss.spawn_key) + tuple(int(k) for k in key))
+    )
+
+
+def spawn_rngs(seed: SeedLike, n: int) -> list[np.random.Generator]:
+    """
+    Returns the random number generators of `n` independent streams of a seed, e.g.
+    one per channel. Stream `i` is the same as `child_rng(seed, i)`.
+
+    Parameters
+    ----------
+    seed : SeedLike
+        The seed of the parent stream.
+    n : int
+        Number of streams.
+
+    Returns
+    -------
+    list of np.random.Generator
+        The random number generators of the streams.
+    """
+    ss = seed_sequence(seed)
+    return [child_rng(ss, i) for i in range(n)]
+
+
+def stream_key(seed: SeedLike, *key: int) -> int:
+    """
+    Returns a 64-bit integer key of an independent stream of a seed, for use with
+    `hashed_normal`.
+
+    Parameters
+    ----------
+    seed : SeedLike
+        The seed of the parent stream.
+    *key : int
+        Non-negative integers identifying the stream.
+
+    Returns
+    -------
+    int
+        The key of the stream.
+    """
+    return int(child_rng(seed, *key).integers(2**64, dtype=np.uint64))
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """SplitMix64 finalizer, a bijective hash of unsigned 64-bit integers, in place."""
+    x *= np.uint64(0x9E3779B97F4A7C15)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def hashed_normal(
+    key: int,
+    start: Tuple[int, int, int],
+    shape: Tuple[int, int, int],
+    dtype=np.float32,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Returns standard normal samples over a box of an unbounded 3-dimensional grid.
+
+    Each sample is a pure function of `key` and of its position on the grid, computed
+    by hashing its coordinates. Any box of the grid can therefore be generated on its
+    own, e.g. one chunk or one spatial tile of a video, and overlapping boxes agree
+    exactly on their common samples, whatever order they are generated in.
+
+    Samples are drawn with the Box-Muller transform of two 24-bit uniforms of a
+    SplitMix64 hash. The smallest uniform is 2**-25, so the samples are truncated at
+    sqrt(50 log(2)), about 5.9 standard deviations, which only cuts a fraction 4e-9 of
+    the tails. This is negligible for the noise of simulated images, but the samples
+    are not suited to studies of extreme values.
+
+    Parameters
+    ----------
+    key : int
+        64-bit key of the grid, e.g. from `stream_key`.
+    start : tuple of int
+        Position of the first sample of the box along each dimension.
+    shape : tuple of int
+        Shape of the box. Positions must stay below 2**24 along the first dimension
+        and 2**20 along the others.
+    dtype : optional
+        Floating point data type of the samples. Default is np.float32.
+    out : np.ndarray, optional
+        C-contiguous array of `shape` and `dtype` to write the samples to, e.g. a
+        buffer reused across boxes. The transform is then computed in place in it
+        when the box starts and ends on even positions of the last dimension.
+
+    Returns
+    -------
+    np.ndarray
+        The samples, of shape `shape`.
+    """
+    (f0, h0, w0), (nf, nh, nw) = start, shape
+
+    # Each hash gives a pair of samples through the Box-Muller transform, for two adjacent positions of the last dimension
+    p0, p1 = w0 // 2, (w0 + nw + 1) // 2
+    f = np.arange(f0, f0 + nf, dtype=np.uint64)[:, None, None] << np.uint64(40)
+    h = np.arange(h0, h0 + nh, dtype=np.uint64)[None, :, None] << np.uint64(20)
+    p = np.arange(p0, p1, dtype=np.uint64)[None, None, :]
+    z = _mix64((f | h | p) + np.uint64(key))
+
+    # Pairs of samples, computed in place in `out` if its positions are those of whole pairs
+    aligned = out is not None and w0 % 2 == 0 and nw % 2 == 0
+    pairs = out.reshape(nf, nh, p1 - p0, 2) if aligned else np.empty((nf, nh, p1 - p0, 2), dtype=dtype)
+    u1, u2 = pairs[..., 0], pairs[..., 1]
+
+    # Two independent 24-bit uniforms per hash, the first one strictly positive
+    np.bitwise_and(z, np.uint64(0xFFFFFF), out=u2, casting="unsafe")
+    z >>= np.uint64(40)
+    np.copyto(u1, z, casting="unsafe")
+    del z
+    u1 += dtype(0.5)
+    u1 *= dtype(2.0**-24)
+    u2 *= dtype(2 * np.pi * 2.0**-24)
+
+    # Box-Muller transform, the radius replaces the first uniform
+    np.log(u1, out=u1)
+    u1 *= dtype(-2)
+    np.sqrt(u1, out=u1)
+    sin = np.sin(u2)
+    sin *= u1
+    np.cos(u2, out=u2)
+    np.multiply(u1, u2, out=u1)
+    u2[...] = sin
+
+    samples = pairs.reshape(nf, nh, 2 * (p1 - p0))[:, :, w0 - 2 * p0 : w0 - 2 * p0 + nw]
+    if out is None:
+        return samples
+    if not aligned:
+        out[...] = samples
+    return out
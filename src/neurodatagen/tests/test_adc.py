@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from neurodatagen.adc import adc_attrs, dequantize, quantize
+from neurodatagen.ephys import generate_ephys
+
+
+@pytest.mark.parametrize("gain, offset", [(0.195, 0.0), (0.5, -12.5)])
+def test_quantize_round_trip(gain, offset):
+    data = np.random.default_rng(0).normal(offset, 100.0, size=(3, 1000))
+    samples = quantize(data, gain, offset)
+    assert samples.dtype == np.int16
+    np.testing.assert_array_less(np.abs(dequantize(samples, gain, offset) - data), gain / 2 + 1e-12)
+
+
+def test_quantize_clips_to_range():
+    samples = quantize(np.array([-1e9, 0.0, 1e9]), 1.0)
+    np.testing.assert_array_equal(samples, [-(2**15), 0, 2**15 - 1])
+
+
+def test_quantize_blocks_and_out():
+    data = np.random.default_rng(0).normal(0, 100.0, size=(5, 301))
+    expected = quantize(data, 0.195, 3.0)
+    out = np.empty(data.shape, dtype=np.int32)
+    samples = quantize(data, 0.195, 3.0, out=out, max_block_size=400)
+    assert samples is out
+    np.testing.assert_array_equal(samples, expected)
+
+
+def test_adc_attrs_decode_cf():
+    data = np.random.default_rng(0).normal(0, 100.0, size=(2, 50))
+    samples = quantize(data, 0.195, 1.0)
+    da = xr.DataArray(samples, dims=["channel", "sample"], attrs=adc_attrs(0.195, 1.0))
+    decoded = xr.decode_cf(da.to_dataset(name="data"))["data"]
+    np.testing.assert_allclose(decoded.values, dequantize(samples, 0.195, 1.0), rtol=1e-6)
+
+
+def test_generate_ephys_quantized_matches_quantize():
+    data = generate_ephys(3, 0.5, seed=0)[0]
+    samples = generate_ephys(3, 0.5, seed=0, adc_gain=0.195, adc_offset=2.0)[0]
+    np.testing.assert_array_equal(samples, quantize(data, 0.195, 2.0))
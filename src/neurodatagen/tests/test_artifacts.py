@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from neurodatagen.eeg.artifacts import add_bursts, add_muscle_artifacts
+
+
+def _expected(shape, onsets, bursts, channels):
+    expected = np.zeros(shape)
+    for onset, burst, chans in zip(onsets, bursts, channels):
+        for ch in chans:
+            for i, value in enumerate(burst):
+                if 0 <= ch < shape[0] and 0 <= onset + i < shape[1]:
+                    expected[ch, onset + i] += value
+    return expected
+
+
+def test_add_bursts_overlapping_and_outside():
+    onsets = np.array([-2, 3, 4, 8])
+    bursts = np.arange(1, 17, dtype=float).reshape(4, 4)
+    channels = np.array([[0, 1], [1, 2], [1, 5], [-1, 2]])
+    data = add_bursts(np.zeros((3, 10)), onsets, bursts, channels)
+    np.testing.assert_array_equal(data, _expected((3, 10), onsets, bursts, channels))
+
+
+@pytest.mark.parametrize("view", ["transposed", "sliced"])
+def test_add_bursts_non_contiguous(view):
+    onsets = np.array([0, 5])
+    bursts = np.ones((2, 3))
+    channels = np.array([[0, 2], [1, 2]])
+    if view == "transposed":
+        base = np.zeros((10, 3))
+        data = base.T
+    else:
+        base = np.zeros((3, 20))
+        data = base[:, ::2]
+    assert not data.flags.c_contiguous
+
+    add_bursts(data, onsets, bursts, channels)
+    np.testing.assert_array_equal(data, _expected((3, 10), onsets, bursts, channels))
+    assert base.sum() == bursts.sum() * 2  # The bursts were written to the underlying array
+
+
+@pytest.mark.parametrize("fs, band", [(40.0, (20.0, 100.0)), (1000.0, (100.0, 50.0)), (1000.0, (0.0, 50.0))])
+def test_add_muscle_artifacts_empty_band(fs, band):
+    with pytest.raises(ValueError, match="band"):
+        add_muscle_artifacts(np.zeros((4, 100)), fs, band=band, seed=0)
+
+
+def test_add_muscle_artifacts_band_capped_below_nyquist():
+    data = add_muscle_artifacts(np.zeros((4, 2000)), 100.0, rate=5.0, seed=0)
+    assert np.isfinite(data).all()
+    assert np.abs(data).max() > 0
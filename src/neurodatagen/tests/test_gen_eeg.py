@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from scipy import fft as sp_fft
+
+from neurodatagen.eeg.gen_eeg import _add_correlated_noise, _highpass_length, _sim_powerlaw
+
+
+def _sim_powerlaw_reference(n_seconds, fs, exponent, highpass, seed):
+    """Power law noise of one channel, filtered by neurodsp, from the same white noise."""
+    from neurodsp.filt import filter_signal
+    from neurodsp.sim.aperiodic import rotate_timeseries
+    from neurodsp.utils import remove_nans
+
+    n_samples = int(np.ceil(n_seconds * fs))
+    n_sim = n_samples + (_highpass_length(fs, highpass) + 1 if highpass else 0)
+    n_sim = sp_fft.next_fast_len(n_sim, real=True)
+    sig = rotate_timeseries(np.random.default_rng(seed).standard_normal(n_sim), fs, -exponent)
+    if highpass:
+        sig, _ = remove_nans(filter_signal(sig, fs, "highpass", (highpass, None), remove_edges=True))
+    sig = sig[:n_samples]
+    return (sig - sig.mean()) / sig.std()
+
+
+@pytest.mark.parametrize("fs", [250, 30000])
+@pytest.mark.parametrize("exponent", [-1, -1.5, -2])
+@pytest.mark.parametrize("highpass", [None, 2.0])
+def test_sim_powerlaw_matches_per_channel_reference(fs, exponent, highpass):
+    pytest.importorskip("neurodsp")
+    seeds = [1, 2, 3]
+    sigs = _sim_powerlaw(1.0, fs, exponent, highpass, seeds=seeds)
+    for sig, seed in zip(sigs, seeds):
+        np.testing.assert_allclose(sig, _sim_powerlaw_reference(1.0, fs, exponent, highpass, seed), atol=1e-12)
+
+
+def test_sim_powerlaw_batches_and_dtype():
+    seeds = [1, 2, 3, 4, 5]
+    sigs = _sim_powerlaw(2.0, 1000, -1, 2.0, seeds=seeds)
+    np.testing.assert_array_equal(_sim_powerlaw(2.0, 1000, -1, 2.0, seeds=seeds, max_batch_size=4000), sigs)
+
+    sigs32 = _sim_powerlaw(2.0, 1000, -1, 2.0, seeds=seeds, dtype=np.float32)
+    assert sigs32.dtype == np.float32
+    np.testing.assert_allclose(sigs32, sigs, atol=1e-5)
+
+
+def _low_rank_cov(n_channels=6, rank=2):
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(n_channels, rank)), rng.uniform(0.5, 1.5, n_channels)
+
+
+def test_correlated_noise_independent_of_block_size():
+    cov = _low_rank_cov()
+    expected = np.zeros((6, 1000))
+    _add_correlated_noise(expected, cov, scale=2.0, seed=0)
+    for max_block_size in [6, 100, 1234]:
+        data = np.zeros((6, 1000))
+        _add_correlated_noise(data, cov, scale=2.0, seed=0, max_block_size=max_block_size)
+        np.testing.assert_allclose(data, expected, rtol=1e-12)
+
+
+def test_correlated_noise_channel_subset():
+    cov = _low_rank_cov()
+    expected = np.zeros((6, 500))
+    _add_correlated_noise(expected, cov, seed=0)
+    data = np.zeros((3, 500))
+    _add_correlated_noise(data, cov, seed=0, channels=[1, 3, 4])
+    np.testing.assert_allclose(data, expected[[1, 3, 4]], rtol=1e-12)
+
+
+@pytest.mark.parametrize("dense", [False, True])
+def test_correlated_noise_covariance(dense):
+    loadings, diag = _low_rank_cov()
+    expected = loadings @ loadings.T + np.diag(diag)
+    data = np.zeros((6, 200000))
+    _add_correlated_noise(data, expected if dense else (loadings, diag), scale=2.0, seed=0)
+    np.testing.assert_allclose(np.cov(data), 4 * expected, atol=0.1)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from neurodatagen.eeg.gen_eeg_mne import generate_eeg_sine_mne
+
+
+def _reference(duration, n_channels, fs, seed):
+    """All channels at once, as generate_eeg_sine_mne used to."""
+    times = np.arange(int(duration * fs)) / fs
+    rng = np.random.default_rng(seed)
+    data = np.stack([np.sin(2 * np.pi * rng.uniform(4, 30) * times) for _ in range(n_channels)])
+    data += rng.normal(scale=0.2, size=data.shape)
+    return data * 1e-5
+
+
+@pytest.mark.parametrize("max_block_size", [2**22, 2500, 1])
+def test_generate_eeg_sine_mne_matches_reference(max_block_size):
+    raw = generate_eeg_sine_mne(5, 6, 1000, seed=0, max_block_size=max_block_size)
+    np.testing.assert_allclose(raw.get_data(), _reference(5, 6, 1000, 0), rtol=0, atol=1e-16)
+
+
+def test_generate_eeg_sine_mne_memmap_and_dtype(tmp_path):
+    expected = generate_eeg_sine_mne(5, 6, 1000, seed=0).get_data()
+    raw = generate_eeg_sine_mne(5, 6, 1000, seed=0, memmap=str(tmp_path / "eeg.dat"))
+    assert isinstance(raw._data, np.memmap)
+    np.testing.assert_array_equal(raw.get_data(), expected)
+
+    # float32 noise is drawn with another algorithm, the sines and the noise level are the same
+    raw32 = generate_eeg_sine_mne(5, 6, 1000, seed=0, dtype=np.float32)
+    freqs = np.random.default_rng(0).uniform(4, 30, 6)
+    noise = raw32.get_data() - 1e-5 * np.sin(2 * np.pi * freqs[:, None] * raw32.times)
+    np.testing.assert_allclose(noise.std(axis=1), 0.2e-5, rtol=0.05)
+    np.testing.assert_allclose(noise.mean(axis=1), 0, atol=1e-7)
@@ -0,0 +1,44 @@
+import gc
+
+import numpy as np
+
+from neurodatagen.ephys import generate_ephys
+from neurodatagen.ephys.gen_ephys import generate_spike_timeseries, generate_spike_timeseries_batch
+
+
+def test_spike_timeseries_batch_matches_single_channels():
+    seeds = [1, 2, 3]
+    batch = generate_spike_timeseries_batch(2.0, 30000, seeds=seeds)
+    for row, seed in zip(batch, seeds):
+        np.testing.assert_array_equal(row, generate_spike_timeseries(2.0, 30000, seed=seed))
+
+
+def test_spike_timeseries_batch_non_contiguous_out():
+    seeds = [1, 2, 3]
+    expected = generate_spike_timeseries_batch(2.0, 30000, seeds=seeds)
+    base = np.zeros((expected.shape[1], len(seeds)))
+    generate_spike_timeseries_batch(2.0, 30000, seeds=seeds, out=base.T)
+    np.testing.assert_array_equal(base.T, expected)
+
+
+def test_generate_ephys_spikes_independent_of_workers():
+    data, _, _, (offsets, indices) = generate_ephys(4, 1, seed=0, return_spikes=True)
+    data2, _, _, (offsets2, indices2) = generate_ephys(4, 1, seed=0, return_spikes=True, n_workers=2)
+    np.testing.assert_array_equal(data, data2)
+    np.testing.assert_array_equal(offsets, offsets2)
+    np.testing.assert_array_equal(indices, indices2)
+    assert offsets[-1] == len(indices)
+
+
+def test_generate_ephys_pool_matches_serial(tmp_path):
+    serial, _, _ = generate_ephys(5, 0.5, seed=1)
+    pooled, _, _ = generate_ephys(5, 0.5, seed=1, n_workers=2)
+    mapped, _, _ = generate_ephys(5, 0.5, seed=1, n_workers=2, memmap=str(tmp_path / "ephys.dat"))
+    np.testing.assert_array_equal(pooled, serial)
+    np.testing.assert_array_equal(mapped, serial)
+
+    # The shared memory stays valid through views of the returned array
+    view = pooled[1:3]
+    del pooled
+    gc.collect()
+    np.testing.assert_array_equal(view, serial[1:3])
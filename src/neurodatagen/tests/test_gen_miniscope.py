@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter1d
+
+from neurodatagen.ca_imaging import simulate_miniscope_data
+from neurodatagen.ca_imaging.gen_miniscope import (
+    _crop_footprints,
+    exp_trace,
+    exp_traces,
+    gauss_cell,
+    random_walk,
+    shift_frames,
+    shift_perframe,
+)
+
+DIMS = {"height": 32, "width": 32, "frame": 20}
+
+
+@pytest.mark.parametrize("kwargs", [{"bg_nsrc": 0}, {"ncell": 0}, {"ncell": 0, "bg_nsrc": 0}])
+def test_simulate_miniscope_data_without_sources(kwargs):
+    Y = simulate_miniscope_data(dims=DIMS, seed=0, **kwargs).compute()
+    assert Y.shape == (DIMS["frame"], DIMS["height"], DIMS["width"])
+    assert np.isfinite(Y.values).all()
+
+
+def test_gauss_cell_without_cells():
+    A = gauss_cell(16, 24, 3.0, 0.6, 0.1, cent=np.zeros((0, 2)), seed=0)
+    assert A.shape == (0, 16, 24)
+    assert A.nnz == 0
+
+
+@pytest.mark.parametrize("norm", [True, False])
+def test_gauss_cell_mixed_sizes_match_dense(norm):
+    height, width, sz_mean, sz_sigma, sz_min = 48, 40, 6.0, 4.0, 0.5
+    cent = np.random.default_rng(1).uniform(-4, [height + 4, width + 4], size=(30, 2))
+    A = gauss_cell(height, width, sz_mean, sz_sigma, sz_min, cent=cent, norm=norm, seed=0)
+
+    # Same sizes as drawn by gauss_cell, with the PDF evaluated over the whole frame
+    rng = np.random.default_rng(0)
+    sz_h = np.clip(rng.normal(sz_mean, sz_sigma, len(cent)), sz_min, None)
+    sz_w = np.clip(rng.normal(sz_mean, sz_sigma, len(cent)), sz_min, None)
+    peak = 1.0 if norm else 1 / (2 * np.pi * np.sqrt(sz_h * sz_w))[:, None, None]
+    hh, ww = np.arange(height)[None, :, None], np.arange(width)[None, None, :]
+    dense = peak * np.exp(
+        -((hh - cent[:, 0, None, None]) ** 2) / (2 * sz_h[:, None, None])
+        - (ww - cent[:, 1, None, None]) ** 2 / (2 * sz_w[:, None, None])
+    )
+    dense[dense <= 1e-8] = 0
+    np.testing.assert_allclose(A.todense(), dense, rtol=1e-12, atol=0)
+
+
+def _frames_and_shifts():
+    rng = np.random.default_rng(0)
+    fms = rng.random((12, 10, 14))
+    shifts = np.concatenate([rng.uniform(-4, 4, (8, 2)), [[0, 0], [12, -3], [-20, 20], [2.5, -2.5]]])
+    return fms, shifts
+
+
+def test_shift_frames_matches_shift_perframe():
+    fms, shifts = _frames_and_shifts()
+    expected = np.stack([shift_perframe(fm.copy(), sh, fill=0) for fm, sh in zip(fms, shifts)])
+    np.testing.assert_array_equal(shift_frames(fms, shifts, fill=0), expected)
+
+    # In place, as computeY shifts its frames
+    np.testing.assert_array_equal(shift_frames(fms, shifts, fill=0, out=fms), expected)
+
+
+def test_shift_frames_subpixel_whole_shifts():
+    fms, shifts = _frames_and_shifts()
+    shifts = np.around(shifts)
+    expected = shift_frames(fms, shifts, fill=0)
+    np.testing.assert_allclose(shift_frames(fms, shifts, fill=0, subpixel=True), expected, atol=1e-12)
+    np.testing.assert_allclose(shift_frames(fms, shifts, fill=0, subpixel=True, out=fms), expected, atol=1e-12)
+
+
+@pytest.mark.parametrize("smooth_var", [None, 3.0])
+def test_constrained_random_walk_matches_per_step_loop(smooth_var):
+    n_stp, ndim, stp_var, constrain_factor = 500, 2, 1.5, 0.2
+    walk = random_walk(
+        n_stp, stp_var, constrain_factor, ndim, integer=False, smooth_var=smooth_var, seed=0
+    )
+
+    rng = np.random.default_rng(0)
+    expected = np.zeros((n_stp, ndim))
+    for i in range(n_stp):
+        last = expected[i - 1] if i > 0 else 0
+        expected[i] = last + rng.normal(loc=-constrain_factor * last, scale=stp_var, size=ndim)
+    if smooth_var is not None:
+        for iw in range(ndim):
+            expected[:, iw] = gaussian_filter1d(expected[:, iw], smooth_var)
+    np.testing.assert_allclose(walk, expected, rtol=0, atol=1e-10)
+
+
+def test_exp_traces_match_exp_trace():
+    ncell, frame, pfire, tau_d, tau_r = 5, 2000, 0.02, 6.0, 1.0
+    C, S = exp_traces(ncell, frame, pfire, tau_d, tau_r, dtype=np.float64, seed=0)
+    assert C.shape == S.shape == (frame, ncell)
+
+    # Successive draws of the same generator give the spike trains of the batch, cell by cell
+    rng = np.random.default_rng(0)
+    for icell in range(ncell):
+        c, s = exp_trace(frame, pfire, tau_d, tau_r, seed=rng)
+        np.testing.assert_array_equal(S[:, icell].todense(), s)
+        # exp_trace truncates the kernel below 1e-6, the recursive filter does not
+        np.testing.assert_allclose(C[:, icell], c, rtol=0, atol=1e-5)
+
+    C32, _ = exp_traces(ncell, frame, pfire, tau_d, tau_r, seed=0)
+    assert C32.dtype == np.float32
+    np.testing.assert_allclose(C32, C, rtol=0, atol=1e-5)
+
+
+@pytest.mark.parametrize("tile_size", [8, 16, 17, 64])
+def test_simulate_miniscope_data_tiles(tile_size):
+    dims = {"height": 40, "width": 36, "frame": 20}
+    kwargs = dict(ncell=10, dims=dims, bg_nsrc=5, mo_stp_var=3.0, chk_size=8, seed=1)
+    expected = simulate_miniscope_data(**kwargs).values
+    np.testing.assert_array_equal(simulate_miniscope_data(tile_size=tile_size, **kwargs).values, expected)
+
+
+@pytest.mark.parametrize("hs, ws", [(slice(0, 16), slice(0, 24)), (slice(5, 12), slice(10, 30)), (slice(10, 40), slice(20, 50))])
+def test_crop_footprints_matches_dense(hs, ws):
+    cent = np.random.default_rng(0).uniform(0, [16, 24], size=(12, 2))
+    A = gauss_cell(16, 24, 2.0, 0.5, 0.1, cent=cent, zero_thres=1e-3, seed=0)
+    cropped, units = _crop_footprints(A, hs, ws)
+
+    dense = A.todense()[:, hs, ws]
+    expected_units = np.flatnonzero(dense.reshape(len(dense), -1).any(axis=1))
+    np.testing.assert_array_equal(units, expected_units)
+    np.testing.assert_array_equal(cropped.todense(), dense[expected_units])
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from neurodatagen.ephys.gen_spiketimes import assign_groups, sim_spikes, stream_spikes, write_spikes_parquet
+
+
+def test_sim_spikes_matches_sort_values():
+    rng = np.random.default_rng(0)
+    counts = rng.poisson(0.5 * 20, size=50)
+    times = rng.uniform(0, 20, size=counts.sum())
+    expected = pd.DataFrame({"time": times, "neuron": pd.Categorical(np.repeat(np.arange(1, 51), counts))})
+    expected = expected.sort_values("time", ignore_index=True)
+    pd.testing.assert_frame_equal(sim_spikes(50, 0.5, 20, seed=0), expected)
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32, np.uint32])
+def test_stream_spikes_sorted_by_time(dtype):
+    chunks = list(stream_spikes(20, 5.0, 25, chunk_seconds=10, seed=0, dtype=dtype, fs=1000))
+    assert len(chunks) == 3
+    spikes = pd.concat(chunks, ignore_index=True)
+    assert spikes["time"].dtype == dtype
+    assert spikes["time"].is_monotonic_increasing
+    assert all(list(chunk["neuron"].cat.categories) == list(range(1, 21)) for chunk in chunks)
+
+    # Spikes stay within the duration and their chunk, at the firing rate of each neuron
+    scale = 1000 if dtype == np.uint32 else 1
+    for i, chunk in enumerate(chunks):
+        assert (chunk["time"] >= i * 10 * scale).all() and (chunk["time"] < min((i + 1) * 10, 25) * scale).all()
+    assert spikes.groupby("neuron", observed=False).size().mean() == pytest.approx(5.0 * 25, rel=0.05)
+
+    # Spikes in the same sample stay in neuron order
+    if dtype == np.uint32:
+        same = spikes["time"].diff() == 0
+        assert (spikes["neuron"].cat.codes.diff()[same] >= 0).all()
+
+
+def test_write_spikes_parquet_matches_stream(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "spikes.parquet")
+    n_spikes = write_spikes_parquet(path, 300, 2.0, 25, chunk_seconds=10, verbose=False, seed=0)
+
+    expected = pd.concat(stream_spikes(300, 2.0, 25, chunk_seconds=10, seed=0), ignore_index=True)
+    spikes = pd.read_parquet(path)
+    assert n_spikes == len(spikes) == len(expected)
+    assert pq.ParquetFile(path).num_row_groups == 3
+    assert spikes["neuron"].dtype == np.uint16
+    np.testing.assert_array_equal(spikes["time"], expected["time"])
+    np.testing.assert_array_equal(spikes["neuron"], expected["neuron"].astype(int))
+
+
+def test_assign_groups_follows_input_order():
+    times = np.random.default_rng(0).permutation(np.linspace(0, 80, 1000))
+    groups = assign_groups(times, 8, sigma=1e-3, seed=0)
+    np.testing.assert_array_equal(groups, np.minimum(times // 10, 7))
+
+
+def test_assign_groups_far_from_centers():
+    times = np.array([0.0, 1e3, 1e4])
+    groups = assign_groups(times, 4, sigma=1e-2, seed=0)
+    np.testing.assert_array_equal(groups, [0, 0, 3])
+
+
+def test_assign_groups_block_size_and_frequencies():
+    times = np.random.default_rng(0).uniform(0, 100, 200000)
+    groups = assign_groups(times, 8, sigma=10, seed=1)
+    np.testing.assert_array_equal(assign_groups(times, 8, sigma=10, seed=1, max_block_size=1000), groups)
+
+    # Frequency of each group per decile of the times, against the mean of its probability
+    centers = np.linspace(times.min(), times.max(), 17)[1::2]
+    probs = np.exp(-((times[:, None] - centers) ** 2) / (2 * 10**2))
+    probs /= probs.sum(axis=1, keepdims=True)
+    decile = np.minimum(times // 10, 9).astype(int)
+    for d in range(10):
+        freqs = np.bincount(groups[decile == d].astype(int), minlength=8) / (decile == d).sum()
+        np.testing.assert_allclose(freqs, probs[decile == d].mean(axis=0), atol=0.015)
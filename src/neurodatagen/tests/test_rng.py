@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from neurodatagen.rng import hashed_normal
+
+# Bound of the samples, from the smallest 24-bit uniform of the Box-Muller transform
+TRUNCATION = np.sqrt(-2 * np.log(0.5 * 2.0**-24))
+
+
+@pytest.fixture(scope="module")
+def samples():
+    return hashed_normal(12345, (0, 0, 0), (64, 256, 256), dtype=np.float64)
+
+
+def test_moments(samples):
+    x = samples.ravel()
+    n = len(x)
+    assert abs(x.mean()) < 5 / np.sqrt(n)
+    assert abs(x.var() - 1) < 5 * np.sqrt(2 / n)
+    assert abs(stats.skew(x)) < 5 * np.sqrt(6 / n)
+    assert abs(stats.kurtosis(x)) < 5 * np.sqrt(24 / n)
+
+
+def test_tails(samples):
+    x = np.abs(samples.ravel())
+    assert x.max() <= TRUNCATION + 1e-6
+    for threshold in (2, 3, 4):
+        expected = 2 * stats.norm.sf(threshold) * len(x)
+        assert abs(np.sum(x > threshold) - expected) < 5 * np.sqrt(expected)
+
+
+def test_normality(samples):
+    assert stats.kstest(samples.ravel()[:200000], "norm").pvalue > 1e-4
+
+
+@pytest.mark.parametrize("axis", [0, 1, 2])
+def test_independence_across_positions(samples, axis):
+    a = np.moveaxis(samples, axis, 0)
+    r = np.corrcoef(a[1:].ravel(), a[:-1].ravel())[0, 1]
+    assert abs(r) < 5 / np.sqrt(a[1:].size)
+
+
+def test_independence_across_keys(samples):
+    other = hashed_normal(12346, (0, 0, 0), samples.shape, dtype=np.float64)
+    r = np.corrcoef(samples.ravel(), other.ravel())[0, 1]
+    assert abs(r) < 5 / np.sqrt(samples.size)
+
+
+def test_boxes_agree():
+    whole = hashed_normal(7, (3, 5, 9), (6, 10, 13))
+    part = hashed_normal(7, (5, 8, 12), (2, 4, 7))
+    np.testing.assert_array_equal(part, whole[2:4, 3:7, 3:10])
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from neurodatagen.ephys.gen_ephys import generate_action_potential, generate_spike_timeseries_batch
+from neurodatagen.ephys.snippets import extract_snippets, snippets_dataframe, spike_index_csr
+
+
+def _spikes():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 4, 200), rng.integers(0, 1000, 200)
+
+
+def test_spike_index_csr():
+    channels, samples = _spikes()
+    offsets, indices = spike_index_csr(channels, samples, n_channels=5)
+    assert offsets[-1] == len(indices) == len(samples)
+    for ch in range(5):
+        np.testing.assert_array_equal(indices[offsets[ch] : offsets[ch + 1]], np.sort(samples[channels == ch]))
+
+
+@pytest.mark.parametrize("max_block_size", [2**22, 30])
+@pytest.mark.parametrize("dtype", [np.float64, np.int16])
+def test_extract_snippets_matches_loop(tmp_path, max_block_size, dtype):
+    data = np.random.default_rng(1).normal(scale=100, size=(4, 1000)).astype(dtype)
+    offsets, indices = spike_index_csr(*_spikes())
+    snippets = extract_snippets(data, offsets, indices, 5, 10, max_block_size=max_block_size)
+    assert snippets.shape == (len(indices), 15) and snippets.dtype == dtype
+
+    # Snippets one by one, filled past the edges of the data
+    fill = np.nan if dtype == np.float64 else 0
+    padded = np.full((4, 1020), fill, dtype=dtype)
+    padded[:, 5:1005] = data
+    channels = np.repeat(np.arange(4), np.diff(offsets))
+    expected = np.stack([padded[ch, t : t + 15] for ch, t in zip(channels, indices)])
+    np.testing.assert_array_equal(snippets, expected)
+
+    # Only the snippets are read from a memory mapped recording
+    mm = np.memmap(tmp_path / "data.dat", dtype=dtype, mode="w+", shape=data.shape)
+    mm[:] = data
+    np.testing.assert_array_equal(extract_snippets(mm, offsets, indices, 5, 10), expected)
+
+
+def test_snippets_of_generated_spikes_are_waveforms():
+    data, (offsets, indices) = generate_spike_timeseries_batch(1.0, 30000, seeds=[1, 2, 3], return_spikes=True)
+    waveform = 100.0 * generate_action_potential(np.linspace(-1, 2, 30), 0.1, 5.0)
+    snippets = extract_snippets(data, offsets, indices, 0, len(waveform))
+    assert len(snippets) > 0
+    np.testing.assert_allclose(snippets, np.broadcast_to(waveform, snippets.shape))
+
+
+def test_snippets_dataframe():
+    offsets, snippets = np.array([0, 2, 2, 3]), np.arange(12.0).reshape(3, 4)
+    df = snippets_dataframe(snippets, offsets, fs=1000, n_before=1, neurons=["a", "b", "c"])
+    assert list(df.columns) == ["Neuron", "Waveform", "Time", "Amplitude"]
+    assert list(df["Neuron"]) == ["a"] * 8 + ["c"] * 4
+    assert list(df["Waveform"]) == [0] * 4 + [1] * 4 + [0] * 4
+    np.testing.assert_array_equal(df["Time"], np.tile([-1.0, 0.0, 1.0, 2.0], 3))
+    np.testing.assert_array_equal(df["Amplitude"], snippets.reshape(-1))
@@ -0,0 +1,48 @@
+from itertools import islice
+
+import numpy as np
+import pytest
+import xarray as xr
+from scipy.signal import welch
+
+from neurodatagen.eeg import generate_eeg_powerlaw, stream_eeg_powerlaw, write_eeg_zarr
+
+
+def test_stream_eeg_spectrum_matches_batch():
+    fs, kwargs = 250, dict(seed=0, add_blink_artifacts=False, correlated_noise_scale=1e9)
+    batch = generate_eeg_powerlaw(8, 120, fs, **kwargs)[0]
+    stream = np.concatenate(list(stream_eeg_powerlaw(8, 120, fs, block_seconds=10, **kwargs)), axis=1)
+    assert stream.shape == batch.shape
+
+    freqs, psd_batch = welch(batch, fs, nperseg=1024)
+    _, psd_stream = welch(stream, fs, nperseg=1024)
+    psd_batch, psd_stream = psd_batch.mean(axis=0), psd_stream.mean(axis=0)
+
+    # Same power in each octave above the highpass, and the same power law
+    for lo in [4, 8, 16, 32, 64]:
+        band = (freqs >= lo) & (freqs < 2 * lo)
+        assert psd_stream[band].mean() / psd_batch[band].mean() == pytest.approx(1, abs=0.1)
+    band = (freqs >= 4) & (freqs < 100)
+    for psd in [psd_batch, psd_stream]:
+        assert np.polyfit(np.log(freqs[band]), np.log(psd[band]), 1)[0] == pytest.approx(-1, abs=0.05)
+
+
+def test_stream_eeg_unbounded_matches_bounded():
+    kwargs = dict(block_seconds=2, seed=0, add_muscle_artifacts=True, line_noise_freq=50)
+    bounded = list(stream_eeg_powerlaw(4, 7, 250, **kwargs))
+    assert [block.shape[1] for block in bounded] == [500, 500, 500, 250]
+    for block, expected in zip(islice(stream_eeg_powerlaw(4, None, 250, **kwargs), 3), bounded):
+        np.testing.assert_array_equal(block, expected)
+
+
+@pytest.mark.parametrize("adc_gain", [None, 0.5])
+def test_write_eeg_zarr_matches_stream(tmp_path, adc_gain):
+    kwargs = dict(block_seconds=2, seed=0, add_muscle_artifacts=True, adc_gain=adc_gain)
+    write_eeg_zarr(str(tmp_path / "eeg.zarr"), 4, 7, 250, verbose=False, **kwargs)
+    expected = np.concatenate(list(stream_eeg_powerlaw(4, 7, 250, **kwargs)), axis=1)
+
+    eeg = xr.open_zarr(tmp_path / "eeg.zarr", mask_and_scale=False)["eeg"]
+    assert eeg.dims == ("channel", "time")
+    np.testing.assert_array_equal(eeg.values, expected)
+    np.testing.assert_array_equal(eeg["time"].values, np.arange(7 * 250) / 250)
+    assert eeg.attrs["sfreq"] == 250
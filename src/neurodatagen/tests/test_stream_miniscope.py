@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter1d
+
+from neurodatagen.ca_imaging import MiniscopeFrameSource
+
+
+@pytest.mark.parametrize("size", [1, 16, 32, 40])
+def test_small_field_of_view(size):
+    source = MiniscopeFrameSource(ncell=5, height=size, width=size + 3, bg_nsrc=3, seed=0)
+    for _ in range(3):
+        frame = source.next_frame()
+        assert frame.shape == (size, size + 3)
+        assert frame.dtype == np.uint8
+
+
+def test_background_smoothing_noise_bandwidth():
+    sigma = 60.0
+    source = MiniscopeFrameSource(ncell=1, height=8, width=8, bg_nsrc=1, bg_smth_var=sigma, seed=0)
+    alpha = source._bg_alpha
+
+    # Noise gain of the exponential smoothing and of the Gaussian smoothing of `simulate_miniscope_data`
+    impulse = np.zeros(4001)
+    impulse[2000] = 1
+    gaussian_gain = np.sum(gaussian_filter1d(impulse, sigma) ** 2)
+    assert alpha / (2 - alpha) == pytest.approx(gaussian_gain, rel=1e-3)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from neurodatagen.eeg import stream_eeg_powerlaw, virtual_eeg_powerlaw
+from neurodatagen.ephys import virtual_ephys
+
+EEG_KWARGS = dict(add_muscle_artifacts=True, line_noise_freq=50)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_virtual_eeg_matches_stream(seed):
+    stream = np.concatenate(list(stream_eeg_powerlaw(5, 23, 250, block_seconds=5, seed=seed, **EEG_KWARGS)), axis=1)
+    virtual = virtual_eeg_powerlaw(5, 23, 250, chunk_seconds=5, channel_chunk=2, seed=seed, **EEG_KWARGS)
+    assert virtual.shape == stream.shape
+    np.testing.assert_allclose(virtual.values, stream, rtol=0, atol=1e-12)
+
+
+def test_virtual_eeg_chunks_are_deterministic():
+    virtual = virtual_eeg_powerlaw(6, 20, 250, chunk_seconds=4, seed=2, **EEG_KWARGS)
+    window = virtual[:, 1100:2600]
+    np.testing.assert_array_equal(window.values, window.values)
+    np.testing.assert_array_equal(window.values, virtual.values[:, 1100:2600])
+
+    # Channel chunking does not change the data
+    split = virtual_eeg_powerlaw(6, 20, 250, chunk_seconds=4, channel_chunk=4, seed=2, **EEG_KWARGS)
+    np.testing.assert_array_equal(split.values, virtual.values)
+
+
+def test_virtual_ephys_chunks_are_deterministic():
+    virtual = virtual_ephys(5, 2, chunk_seconds=0.5, seed=3)
+    window = virtual[:, 12000:40000]
+    np.testing.assert_array_equal(window.values, window.values)
+    split = virtual_ephys(5, 2, chunk_seconds=0.5, channel_chunk=2, seed=3)
+    np.testing.assert_array_equal(split.values, virtual.values)
+
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+import xarray as xr
+import zarr
+
+from neurodatagen.ephys import virtual_ephys, write_ephys_zarr
+from neurodatagen.ephys import write_ephys
+from neurodatagen.ephys.virtual_ephys import _ephys_model, _synthesize_ephys
+from neurodatagen.rng import seed_sequence
+
+PARAMS = dict(n_channels=5, n_seconds=0.25, fs=2000, block_seconds=0.1, channel_chunk=2, verbose=False)
+
+
+def _read(store):
+    return xr.open_zarr(store, mask_and_scale=False)
+
+
+def test_write_ephys_zarr_matches_virtual(tmp_path):
+    write_ephys_zarr(str(tmp_path / "ephys.zarr"), seed=0, n_workers=1, **PARAMS)
+    ds = _read(tmp_path / "ephys.zarr")
+    expected = virtual_ephys(5, 0.25, fs=2000, chunk_seconds=0.1, seed=0, dtype=np.float32)
+    np.testing.assert_array_equal(ds["ephys"].values, expected.values)
+    np.testing.assert_array_equal(ds["time"].values, expected["time"].values)
+
+    write_ephys_zarr(str(tmp_path / "adc.zarr"), seed=0, n_workers=1, adc_gain=0.5, **PARAMS)
+    expected = virtual_ephys(5, 0.25, fs=2000, chunk_seconds=0.1, seed=0, dtype=np.float32, adc_gain=0.5)
+    np.testing.assert_array_equal(_read(tmp_path / "adc.zarr")["ephys"].values, expected.values)
+
+
+def test_write_ephys_zarr_spike_table(tmp_path):
+    write_ephys_zarr(str(tmp_path / "ephys.zarr"), seed=0, n_workers=1, **PARAMS)
+    ds = _read(tmp_path / "ephys.zarr")
+    assert "block_spikes" not in ds
+    assert ds["spike_channel"].dtype == np.uint8
+
+    # The spikes that start in each block of samples, of all channels at once
+    model = _ephys_model(seed_sequence(0), 5, 2000, 200, 2.0, -1, 20.0, (0.1, 20), 100.0, np.float32)
+    spikes = [_synthesize_ephys(0, 5, t0, min(t0 + 200, 500), **model)[1:] for t0 in range(0, 500, 200)]
+    channels, samples = (np.concatenate(s) for s in zip(*spikes))
+    order = np.lexsort((channels, samples))
+    assert len(order) > 0
+    np.testing.assert_array_equal(ds["spike_sample"].values, samples[order])
+    np.testing.assert_array_equal(ds["spike_channel"].values, channels[order])
+
+
+def test_write_ephys_zarr_independent_of_workers_and_channel_chunk(tmp_path):
+    write_ephys_zarr(str(tmp_path / "a.zarr"), seed=0, n_workers=1, **PARAMS)
+    write_ephys_zarr(str(tmp_path / "b.zarr"), seed=0, n_workers=2, **PARAMS)
+    write_ephys_zarr(str(tmp_path / "c.zarr"), seed=0, n_workers=1, **dict(PARAMS, channel_chunk=5))
+    expected = _read(tmp_path / "a.zarr").load()
+    xr.testing.assert_identical(_read(tmp_path / "b.zarr").load(), expected)
+    # The chunking along channels is recorded in the parameters, but does not change the data
+    xr.testing.assert_equal(_read(tmp_path / "c.zarr").load(), expected)
+
+
+def test_write_ephys_zarr_resume(tmp_path, monkeypatch):
+    store = str(tmp_path / "ephys.zarr")
+    write_block, written = write_ephys._write_block, []
+
+    def interrupted(*blk):
+        if len(written) == 3:
+            raise KeyboardInterrupt
+        written.append(blk)
+        return write_block(*blk)
+
+    monkeypatch.setattr(write_ephys, "_write_block", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        write_ephys_zarr(store, seed=0, n_workers=1, **PARAMS)
+    assert "spike_sample" not in zarr.open_group(store, mode="r")
+
+    # The seed and completed blocks are taken from the store
+    with pytest.raises(ValueError, match="Cannot resume"):
+        write_ephys_zarr(store, n_workers=1, resume=True, **dict(PARAMS, channel_chunk=5))
+    resumed, progress = [], []
+    monkeypatch.setattr(write_ephys, "_write_block", lambda *blk: resumed.append(blk) or write_block(*blk))
+    write_ephys_zarr(store, n_workers=1, resume=True, progress=lambda done, total: progress.append(done), **PARAMS)
+    assert [blk[0] for blk in resumed] == [3, 4, 5, 6, 7, 8]
+    assert progress[-1] == pytest.approx(PARAMS["n_seconds"])
+
+    expected = str(tmp_path / "expected.zarr")
+    write_ephys_zarr(expected, seed=0, n_workers=1, **PARAMS)
+    xr.testing.assert_identical(_read(store).load(), _read(expected).load())
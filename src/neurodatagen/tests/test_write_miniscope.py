@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from neurodatagen.ca_imaging import simulate_miniscope_data, write_miniscope_zarr
+from neurodatagen.ca_imaging import write_miniscope
+
+DIMS = {"height": 24, "width": 20, "frame": 30}
+PARAMS = dict(ncell=5, dims=DIMS, bg_nsrc=4, verbose=False)
+
+
+def _read(store):
+    return xr.open_zarr(store)["sim-miniscope"].values
+
+
+def test_write_miniscope_zarr_matches_simulation(tmp_path):
+    write_miniscope_zarr(str(tmp_path / "sim.zarr"), seed=3, chk_size=7, n_workers=1, **PARAMS)
+    expected = simulate_miniscope_data(ncell=5, dims=DIMS, bg_nsrc=4, seed=3).values
+    np.testing.assert_array_equal(_read(tmp_path / "sim.zarr"), expected)
+
+
+def test_write_miniscope_zarr_independent_of_workers_and_chunks(tmp_path):
+    write_miniscope_zarr(str(tmp_path / "a.zarr"), seed=3, chk_size=7, n_workers=1, **PARAMS)
+    write_miniscope_zarr(str(tmp_path / "b.zarr"), seed=3, chk_size=7, n_workers=2, **PARAMS)
+    write_miniscope_zarr(str(tmp_path / "c.zarr"), seed=3, chk_size=10, n_workers=1, **PARAMS)
+    expected = _read(tmp_path / "a.zarr")
+    np.testing.assert_array_equal(_read(tmp_path / "b.zarr"), expected)
+    np.testing.assert_array_equal(_read(tmp_path / "c.zarr"), expected)
+
+
+def test_write_miniscope_zarr_resume(tmp_path, monkeypatch):
+    store = str(tmp_path / "sim.zarr")
+    write_block, n_calls = write_miniscope._write_block, []
+
+    def interrupted(*blk):
+        if len(n_calls) == 2:
+            raise KeyboardInterrupt
+        n_calls.append(blk)
+        return write_block(*blk)
+
+    monkeypatch.setattr(write_miniscope, "_write_block", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        write_miniscope_zarr(store, seed=3, chk_size=7, n_workers=1, **PARAMS)
+    monkeypatch.setattr(write_miniscope, "_write_block", write_block)
+
+    # The seed and completed blocks are taken from the store
+    with pytest.raises(ValueError, match="Cannot resume"):
+        write_miniscope_zarr(store, chk_size=10, n_workers=1, resume=True, **PARAMS)
+    resumed = []
+    monkeypatch.setattr(write_miniscope, "_write_block", lambda *blk: resumed.append(blk) or write_block(*blk))
+    write_miniscope_zarr(store, chk_size=7, n_workers=1, resume=True, **PARAMS)
+    assert [blk[0] for blk in resumed] == [2, 3, 4]
+
+    expected = tmp_path / "expected.zarr"
+    write_miniscope_zarr(str(expected), seed=3, chk_size=7, n_workers=1, **PARAMS)
+    np.testing.assert_array_equal(_read(store), _read(expected))